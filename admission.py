@@ -0,0 +1,130 @@
+# admission.py — load shedding for the document endpoints (429 + Retry-After)
+from __future__ import annotations
+import hashlib, math, threading, time
+from collections import deque
+from contextlib import contextmanager
+from typing import Deque, Iterator, Optional, Tuple
+
+import metrics
+
+
+class Overloaded(Exception):
+    """Request rejected by admission control; ``retry_after`` is in seconds."""
+
+    def __init__(self, reason: str, retry_after: int, msg: str):
+        super().__init__(msg)
+        self.reason, self.retry_after, self.msg = reason, retry_after, msg
+
+
+def key_label(api_key: Optional[str]) -> str:
+    """Metric label for an API key: a short hash, never the key itself."""
+    if not api_key:
+        return "anonymous"
+    return hashlib.sha256(api_key.encode("utf-8")).hexdigest()[:12]
+
+
+class AdmissionController:
+    """Caps in-flight documents and pages, and predicts the latency of a new
+    request from the recent throughput of this process (pages completed per
+    second of busy time, i.e. while anything was in flight).
+
+    A request is rejected when a cap would be exceeded or when the predicted
+    latency (backlog + its own pages at the recent rate) is above the SLO;
+    ``Retry-After`` is the time needed to drain enough backlog to meet it.
+    """
+
+    def __init__(self, max_docs: int = 16, max_pages: int = 1000, slo_ms: float = 0.0, window_s: float = 60.0):
+        self.max_docs, self.max_pages = max_docs, max_pages
+        self.slo_ms, self.window_s = slo_ms, window_s
+        self.docs = 0
+        self.pages = 0
+        self._busy_total = 0.0
+        self._busy_since: Optional[float] = None
+        self._done: Deque[Tuple[float, int]] = deque()  # (busy clock at completion, pages)
+        self._pages_per_doc = 1.0
+        self._lock = threading.RLock()
+
+    def _busy_clock(self, now: float) -> float:
+        return self._busy_total + (now - self._busy_since if self._busy_since is not None else 0.0)
+
+    def pages_per_s(self, now: Optional[float] = None) -> Optional[float]:
+        """Recent throughput, or ``None`` before one second of busy time has been seen."""
+        b = self._busy_clock(now or time.monotonic())
+        while self._done and self._done[0][0] < b - self.window_s:
+            self._done.popleft()
+        span = min(self.window_s, b)
+        if span < 1.0 or not self._done:
+            return None
+        return sum(p for _, p in self._done) / span
+
+    def estimate_ms(self, pages: int) -> Optional[float]:
+        """Predicted latency of a ``pages``-page request behind the current backlog."""
+        rate = self.pages_per_s()
+        if rate is None:
+            return None
+        return (self.pages + pages) / rate * 1000.0
+
+    def _check(self, endpoint: str, key: str, pages: int) -> None:
+        reason = msg = retry = None
+        if self.docs + 1 > self.max_docs:
+            reason, msg = "max_docs", f"{self.docs} documents in flight (limit {self.max_docs})"
+        elif self.docs and self.pages + pages > self.max_pages:
+            reason, msg = "max_pages", f"{self.pages} pages in flight (limit {self.max_pages})"
+        est = self.estimate_ms(pages)
+        if est is not None:
+            metrics.admission_estimated_latency_ms.set(est)
+        if reason is None and self.slo_ms > 0 and est is not None and est > self.slo_ms:
+            reason, msg = "slo", f"predicted latency {est:.0f} ms exceeds the {self.slo_ms:.0f} ms SLO"
+            retry = (est - self.slo_ms) / 1000.0
+        if reason is None:
+            return
+        self.reject(endpoint, key, reason, msg, retry)
+
+    def reject(self, endpoint: str, key: str, reason: str, msg: str, retry_s: Optional[float] = None) -> None:
+        """Count the rejection and raise ``Overloaded``; by default a client should
+        retry once one document's worth of work has finished."""
+        if retry_s is None:
+            with self._lock:
+                rate = self.pages_per_s()
+            retry_s = self._pages_per_doc / rate if rate else 1.0
+        metrics.admission_rejected_total.labels(endpoint=endpoint, reason=reason, api_key=key).inc()
+        raise Overloaded(reason, max(1, math.ceil(retry_s)), msg)
+
+    def check(self, endpoint: str, api_key: Optional[str], pages: int) -> None:
+        """Raise ``Overloaded`` if a request would not be admitted (nothing is reserved)."""
+        with self._lock:
+            self._check(endpoint, key_label(api_key), pages)
+
+    @contextmanager
+    def admit(self, endpoint: str, api_key: Optional[str], pages: int, enforce: bool = True) -> Iterator[None]:
+        """Reserve ``pages`` for the enclosed processing or raise ``Overloaded``
+        (``enforce=False`` only accounts for work admitted elsewhere, e.g. a queued job)."""
+        with self._lock:
+            if enforce:
+                self._check(endpoint, key_label(api_key), pages)
+            now = time.monotonic()
+            if self.docs == 0:
+                self._busy_since = now
+            self.docs += 1
+            self.pages += pages
+            self._update_gauges()
+        ok = False
+        try:
+            yield
+            ok = True
+        finally:
+            with self._lock:
+                now = time.monotonic()
+                if ok:
+                    self._done.append((self._busy_clock(now), pages))
+                    self._pages_per_doc = 0.8 * self._pages_per_doc + 0.2 * pages
+                self.docs -= 1
+                self.pages -= pages
+                if self.docs == 0 and self._busy_since is not None:
+                    self._busy_total += now - self._busy_since
+                    self._busy_since = None
+                self._update_gauges()
+
+    def _update_gauges(self) -> None:
+        metrics.admission_inflight.labels(kind="docs").set(self.docs)
+        metrics.admission_inflight.labels(kind="pages").set(self.pages)
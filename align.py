@@ -1,14 +1,16 @@
 from __future__ import annotations
-from typing import List, Dict, Any, Tuple
+from typing import List, Dict, Any, Tuple, Union
 import re
+from token_table import TokenTable
 def _norm(s: str) -> str:
     s = s.strip().lower()
     s = re.sub(r"\s+"," ", s)
     return s
-def align_value_to_tokens(value: str, chunk_tokens: List[Dict[str,Any]]) -> Tuple[List[int], float]:
+def align_value_to_tokens(value: str, chunk_tokens: Union[TokenTable, List[Dict[str,Any]]]) -> Tuple[List[int], float]:
     v = _norm(value)
     if not v: return ([], 0.0)
-    toks = [_norm(t.get('text','')) for t in chunk_tokens]
+    texts = chunk_tokens.texts() if isinstance(chunk_tokens, TokenTable) else [t.get('text','') for t in chunk_tokens]
+    toks = [_norm(t) for t in texts]
     concat = ' '.join(toks)
     start = concat.find(v)
     if start >= 0:
@@ -0,0 +1,337 @@
+"""
+bench/micro.py
+--------------
+Micro-benchmarks for the CPU-side hot paths that run per token or per field,
+fed with seeded synthetic inputs (10..100k tokens, 1..50 fields).
+
+For every case and size it records the best wall time and the peak Python
+allocation (``tracemalloc``), plus the scaling exponent of time vs. tokens
+(log-log slope over the sizes >= 1000), and checks them against the budgets
+stored in ``bench/budgets.json``.
+
+Run with:
+    python -m bench.micro                     # full grid, exit 1 if a budget is blown
+    python -m bench.micro --quick --out micro.json
+    python -m bench.micro --update-budgets    # after an intentional change
+"""
+
+from __future__ import annotations
+import argparse
+import gc
+import json
+import math
+import os
+import random
+import string
+import sys
+import time
+import tracemalloc
+import zlib
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+BUDGETS_PATH = os.path.join(os.path.dirname(__file__), "budgets.json")
+
+SIZES = (10, 100, 1000, 10000, 100000)
+FIELDS = (1, 10, 50)
+QUICK_SIZES = (10, 100, 1000, 10000)
+QUICK_FIELDS = (1, 10)
+
+# headroom applied by --update-budgets
+TIME_HEADROOM, TIME_FLOOR_MS = 3.0, 2.0
+ALLOC_HEADROOM, ALLOC_FLOOR_KB = 1.5, 64.0
+SLOPE_SLACK = 0.3
+
+
+# ---------------- synthetic inputs ----------------
+def _word(rng: random.Random) -> str:
+    return "".join(rng.choices(string.ascii_lowercase + string.digits, k=rng.randint(2, 10)))
+
+
+def make_tokens(n: int, seed: int = 0) -> List[Dict[str, Any]]:
+    rng = random.Random(seed)
+    toks = []
+    for i in range(n):
+        x, y = rng.random() * 0.9, (i // 12 % 60) / 60.0
+        toks.append({
+            "text": _word(rng),
+            "page": 1 + i // 720,
+            "page_index": i // 720,
+            "bbox": [x, y, x + 0.05, y + 0.012],
+            "line_id": None,
+            "category": "cell",
+        })
+    return toks
+
+
+def make_fields(tokens: List[Dict[str, Any]], f: int, seed: int = 0) -> Dict[str, Dict[str, Any]]:
+    """``f`` field values: mostly 1-3 consecutive tokens of the document, every fourth a miss."""
+    rng = random.Random(seed + 1)
+    fields = {}
+    for k in range(f):
+        if k % 4 == 3 or not tokens:
+            val = "missing " + _word(rng)
+        else:
+            i = rng.randrange(len(tokens))
+            val = " ".join(t["text"] for t in tokens[i:i + rng.randint(1, 3)])
+        fields[f"field_{k}"] = {"value": val, "confidence": 0.9}
+    return fields
+
+
+def make_markdown(n: int, seed: int = 0) -> str:
+    rng = random.Random(seed)
+    paras, words = [], 0
+    while words < n:
+        k = min(n - words, rng.randint(5, 40))
+        paras.append(" ".join(_word(rng) for _ in range(k)))
+        words += k
+    return "\n\n".join(paras)
+
+
+def make_pdf(n: int, seed: int = 0, per_page: int = 500) -> bytes:
+    """A digital PDF with ``n`` words of text layer, ``per_page`` per page in lines of 10."""
+    import fitz
+    rng = random.Random(seed)
+    doc = fitz.open()
+    for p in range(max(1, math.ceil(n / per_page))):
+        k = min(per_page, n - p * per_page)
+        words = [_word(rng) for _ in range(k)]
+        lines = [" ".join(words[i:i + 10]) for i in range(0, k, 10)]
+        doc.new_page().insert_text((36, 40), "\n".join(lines), fontsize=7)
+    return doc.tobytes()
+
+
+def make_pages_blocks(n: int, seed: int = 0, per_block: int = 12, per_page: int = 500) -> List[Dict[str, Any]]:
+    rng = random.Random(seed)
+    pages, left = [], n
+    while left > 0:
+        blocks, on_page = [], min(per_page, left)
+        while on_page > 0:
+            k = min(per_block, on_page)
+            blocks.append({"type": "text", "text": " ".join(_word(rng) for _ in range(k))})
+            on_page -= k
+            left -= k
+        pages.append({"page": len(pages) + 1, "blocks": blocks})
+    return pages
+
+
+# ---------------- cases ----------------
+# each case: (uses_fields, setup(n, f) -> zero-arg callable)
+def _case_align(n: int, f: int) -> Callable[[], Any]:
+    import align
+    toks = make_tokens(n)
+    values = [v["value"] for v in make_fields(toks, f).values()]
+    return lambda: [align.align_value_to_tokens(v, toks) for v in values]
+
+
+def _case_bbox_mapper(n: int, f: int) -> Callable[[], Any]:
+    from services.bbox_mapper import map_bboxes_to_fields
+    toks = make_tokens(n)
+    fields = make_fields(toks, f)
+    return lambda: map_bboxes_to_fields({k: dict(v) for k, v in fields.items()}, toks)
+
+
+def _case_split_markdown(n: int, f: int) -> Callable[[], Any]:
+    import indexer
+    md = make_markdown(n)
+    return lambda: indexer.split_markdown_into_chunks(md)
+
+
+def _case_cosine(n: int, f: int) -> Callable[[], Any]:
+    from retriever import _cosine
+    rng = random.Random(0)
+    q = [rng.random() for _ in range(384)]
+    vecs = [[rng.random() for _ in range(384)] for _ in range(min(n, 1000))]
+    reps = max(1, n // len(vecs))
+    return lambda: [_cosine(q, v) for _ in range(reps) for v in vecs]
+
+
+def _case_search(n: int, f: int) -> Callable[[], Any]:
+    import numpy as np
+    import clients
+    from retriever import EphemeralIndex
+
+    def _embed(texts):
+        return [np.random.default_rng(zlib.crc32(t.encode())).random(384) for t in texts]
+
+    chunks = [{"text": f"chunk {i}", "kind": "para"} for i in range(max(1, n // 50))]
+    queries = [f"field_{k}" for k in range(f)]
+    prev = getattr(clients, "llm_embed", None)
+    clients.llm_embed = _embed
+    try:
+        idx = EphemeralIndex(chunks)
+        qvecs = _embed(queries)
+    finally:
+        clients.llm_embed = prev
+    return lambda: [idx.search(q, topk=5, query_vec=v) for q, v in zip(queries, qvecs)]
+
+
+def _case_build_markdown(n: int, f: int) -> Callable[[], Any]:
+    from parse import build_markdown_from_ocr
+    pages = make_pages_blocks(n)
+    return lambda: build_markdown_from_ocr(pages)
+
+
+def _case_pdf_tokens(n: int, f: int) -> Callable[[], Any]:
+    from parse import extract_pdf_tokens
+    pdf = make_pdf(n)
+    return lambda: extract_pdf_tokens(pdf)
+
+
+def _case_token_table_io(n: int, f: int) -> Callable[[], Any]:
+    import io
+    from token_table import TokenTable
+    table = TokenTable.from_dicts(make_tokens(n))
+
+    def _roundtrip():
+        buf = io.BytesIO()
+        table.write(buf)
+        buf.seek(0)
+        return TokenTable.read(buf)
+    return _roundtrip
+
+
+CASES: Dict[str, Tuple[bool, Callable[[int, int], Callable[[], Any]]]] = {
+    "align_value_to_tokens": (True, _case_align),
+    "map_bboxes_to_fields": (True, _case_bbox_mapper),
+    "split_markdown_into_chunks": (False, _case_split_markdown),
+    "retriever_cosine": (False, _case_cosine),
+    "retriever_search": (True, _case_search),
+    "build_markdown_from_ocr": (False, _case_build_markdown),
+    "extract_pdf_tokens": (False, _case_pdf_tokens),
+    "token_table_write_read": (False, _case_token_table_io),
+}
+
+
+# ---------------- measurement ----------------
+def measure(fn: Callable[[], Any], min_time_s: float = 0.05, max_repeat: int = 7) -> Dict[str, float]:
+    """Best-of wall time (ms, GC disabled like ``timeit``) and peak traced allocation (KiB) of ``fn()``."""
+    best, total, runs = float("inf"), 0.0, 0
+    gc_was_enabled = gc.isenabled()
+    gc.disable()
+    try:
+        while runs < max_repeat and (runs < 3 or total < min_time_s):
+            t0 = time.perf_counter()
+            fn()
+            dt = time.perf_counter() - t0
+            best, total, runs = min(best, dt), total + dt, runs + 1
+    finally:
+        if gc_was_enabled:
+            gc.enable()
+    tracemalloc.start()
+    try:
+        tracemalloc.reset_peak()
+        base = tracemalloc.get_traced_memory()[0]
+        fn()
+        peak = tracemalloc.get_traced_memory()[1] - base
+    finally:
+        tracemalloc.stop()
+    return {"time_ms": round(best * 1000.0, 4), "alloc_kb": round(max(0, peak) / 1024.0, 1)}
+
+
+def _key(case: str, n: int, f: Optional[int]) -> str:
+    return f"{case}/n={n}" + (f"/f={f}" if f is not None else "")
+
+
+def slope(points: List[Tuple[int, float]]) -> Optional[float]:
+    """Least-squares log-log slope of time vs. n over points with n >= 1000."""
+    pts = [(math.log(n), math.log(max(t, 1e-6))) for n, t in points if n >= 1000]
+    if len(pts) < 2:
+        return None
+    mx = sum(x for x, _ in pts) / len(pts)
+    my = sum(y for _, y in pts) / len(pts)
+    den = sum((x - mx) ** 2 for x, _ in pts)
+    return round(sum((x - mx) * (y - my) for x, y in pts) / den, 3) if den else None
+
+
+def run_suite(sizes=SIZES, fields=FIELDS, cases: Optional[List[str]] = None) -> Dict[str, Any]:
+    results: Dict[str, Any] = {}
+    curves: Dict[str, Any] = {}
+    for name in cases or list(CASES):
+        uses_fields, setup = CASES[name]
+        for f in (fields if uses_fields else (None,)):
+            curve = []
+            for n in sizes:
+                m = measure(setup(n, f or 1))
+                results[_key(name, n, f)] = m
+                curve.append((n, m["time_ms"]))
+            ckey = name + (f"/f={f}" if f is not None else "")
+            curves[ckey] = {"points": curve, "slope": slope(curve)}
+    return {"results": results, "scaling": curves}
+
+
+def check(report: Dict[str, Any], budgets: Dict[str, Any], timing: bool = True) -> List[str]:
+    """Budget violations of ``report``; entries without a budget are not checked.
+
+    ``timing=False`` checks only the allocation budgets, which do not depend on
+    the speed of the machine.
+    """
+    out = []
+    for key, m in report["results"].items():
+        b = budgets.get("results", {}).get(key)
+        if not b:
+            continue
+        if timing and m["time_ms"] > b["time_ms"]:
+            out.append(f"{key}: time {m['time_ms']:.3f} ms > budget {b['time_ms']:.3f} ms")
+        if m["alloc_kb"] > b["alloc_kb"]:
+            out.append(f"{key}: alloc {m['alloc_kb']:.1f} KiB > budget {b['alloc_kb']:.1f} KiB")
+    for key, c in report["scaling"].items() if timing else ():
+        limit = budgets.get("max_slope", {}).get(key)
+        if limit is not None and c["slope"] is not None and c["slope"] > limit:
+            out.append(f"{key}: scaling exponent {c['slope']:.2f} > budget {limit:.2f}")
+    return out
+
+
+def make_budgets(report: Dict[str, Any]) -> Dict[str, Any]:
+    return {
+        "results": {
+            k: {
+                "time_ms": round(max(m["time_ms"] * TIME_HEADROOM, TIME_FLOOR_MS), 3),
+                "alloc_kb": round(max(m["alloc_kb"] * ALLOC_HEADROOM, ALLOC_FLOOR_KB), 1),
+            }
+            for k, m in report["results"].items()
+        },
+        "max_slope": {
+            k: round(max(1.0, c["slope"]) + SLOPE_SLACK, 2)
+            for k, c in report["scaling"].items() if c["slope"] is not None
+        },
+    }
+
+
+def load_budgets(path: str = BUDGETS_PATH) -> Dict[str, Any]:
+    try:
+        with open(path, encoding="utf-8") as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return {}
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    ap = argparse.ArgumentParser(description="docflow-ai CPU micro-benchmarks")
+    ap.add_argument("--quick", action="store_true", help=f"sizes {QUICK_SIZES}, fields {QUICK_FIELDS}")
+    ap.add_argument("--case", action="append", choices=sorted(CASES), help="run only these cases")
+    ap.add_argument("--budgets", default=BUDGETS_PATH)
+    ap.add_argument("--update-budgets", action="store_true", help="rewrite the budgets from this run")
+    ap.add_argument("--out", help="write the JSON report here (default: stdout)")
+    args = ap.parse_args(argv)
+
+    report = run_suite(QUICK_SIZES if args.quick else SIZES, QUICK_FIELDS if args.quick else FIELDS, args.case)
+    rc = 0
+    if args.update_budgets:
+        with open(args.budgets, "w", encoding="utf-8") as f:
+            json.dump(make_budgets(report), f, indent=1, sort_keys=True)
+    else:
+        report["violations"] = check(report, load_budgets(args.budgets))
+        rc = 1 if report["violations"] else 0
+    text = json.dumps(report, indent=2)
+    if args.out:
+        with open(args.out, "w", encoding="utf-8") as f:
+            f.write(text)
+    else:
+        print(text)
+    for v in report.get("violations", []):
+        print(f"BUDGET: {v}", file=sys.stderr)
+    return rc
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,263 @@
+"""
+bench/replay.py
+---------------
+Replays captured request traffic against the service, in-process (``main.app``
+over an ASGI transport) or over HTTP (``--url``), and reports latency
+histograms, error rates and queue-wait breakdowns as JSON.
+
+Traffic file: JSON Lines, one request per line::
+
+    {"file": "docs/inv1.pdf", "template": "tpl/invoice.json", "policy": "auto", "offset_s": 0.0}
+    {"file": "docs/scan.png", "template": {"name": "t", "fields": ["iban"]}, "offset_s": 0.35,
+     "endpoint": "/jobs", "priority": 3}
+
+``file`` and string ``template`` paths are relative to the traffic file;
+``offset_s`` (or ``offset_ms``) is the arrival time from the start of the
+capture; ``endpoint`` is ``/extract`` (default), ``/process-document`` or
+``/jobs`` (``/process-document`` uses the server's default template).
+Lines without ``file`` are ignored.
+
+Modes:
+    open   open-loop, requests are sent at their recorded offsets (``--speed`` scales time)
+    rps    open-loop at a fixed rate, recorded offsets ignored
+
+Run with:
+    python -m bench.replay traffic.jsonl --mode open --speed 2 --out replay.json
+    JOB_WORKERS=4 python -m bench.replay traffic.jsonl --mode rps --rps 20
+    python -m bench.replay traffic.jsonl --url http://localhost:8000 --api-key $API_KEY
+"""
+
+from __future__ import annotations
+import argparse
+import asyncio
+import json
+import os
+import sys
+import time
+from typing import Any, Dict, List, Optional
+
+from bench.run import percentiles, peak_rss_mb
+
+HIST_BUCKETS_MS = (10, 25, 50, 100, 250, 500, 1000, 2500, 5000, 10000, 30000, 60000)
+ENDPOINTS = ("/extract", "/process-document", "/jobs")
+
+
+def load_traffic(path: str) -> List[Dict[str, Any]]:
+    """Parse a traffic file into entries sorted by arrival offset."""
+    base = os.path.dirname(os.path.abspath(path))
+    files: Dict[str, bytes] = {}
+    entries = []
+    with open(path, encoding="utf-8") as f:
+        for n, line in enumerate(f, 1):
+            line = line.strip()
+            if not line or line.startswith("#"):
+                continue
+            rec = json.loads(line)
+            if "file" not in rec:
+                continue
+            fpath = os.path.join(base, rec["file"])
+            if fpath not in files:
+                with open(fpath, "rb") as fh:
+                    files[fpath] = fh.read()
+            tpl = rec.get("template", {})
+            if isinstance(tpl, str):
+                with open(os.path.join(base, tpl), encoding="utf-8") as fh:
+                    tpl = json.load(fh)
+            endpoint = rec.get("endpoint", "/extract")
+            if endpoint not in ENDPOINTS:
+                raise ValueError(f"line {n}: unsupported endpoint {endpoint!r}")
+            offset = rec["offset_ms"] / 1000.0 if "offset_ms" in rec else float(rec.get("offset_s", 0.0))
+            entries.append({
+                "filename": os.path.basename(fpath),
+                "data": files[fpath],
+                "template": tpl,
+                "policy": rec.get("policy"),
+                "endpoint": endpoint,
+                "priority": int(rec.get("priority", 5)),
+                "offset_s": offset,
+            })
+    entries.sort(key=lambda e: e["offset_s"])
+    return entries
+
+
+def send_times(entries: List[Dict[str, Any]], mode: str = "open", rps: float = 1.0, speed: float = 1.0) -> List[float]:
+    """Seconds from the start of the replay at which each entry is sent."""
+    if mode == "rps":
+        return [i / rps for i in range(len(entries))]
+    t0 = entries[0]["offset_s"] if entries else 0.0
+    return [(e["offset_s"] - t0) / speed for e in entries]
+
+
+def histogram(values: List[float]) -> Dict[str, int]:
+    """Cumulative ``le`` buckets, Prometheus-style."""
+    out = {str(b): sum(1 for v in values if v <= b) for b in HIST_BUCKETS_MS}
+    out["+Inf"] = len(values)
+    return out
+
+
+async def _sse_events(client, job_id: str, headers: Dict[str, str]) -> List[tuple]:
+    """Follow ``/jobs/{id}/events`` to the terminal event; returns ``(event, arrival)``."""
+    seen = []
+    async with client.stream("GET", f"/jobs/{job_id}/events", headers=headers) as r:
+        async for line in r.aiter_lines():
+            if line.startswith("event:"):
+                seen.append((line.split(":", 1)[1].strip(), time.perf_counter()))
+    return seen
+
+
+def _executor_waits(request_id: str) -> Dict[str, float]:
+    """Executor queue wait per pool from the request's ``trace.json`` (in-process only).
+
+    Coalesced requests have no trace of their own; their report points at the
+    trace of the request whose computation they shared.
+    """
+    from config import REPORTS_DIR
+    try:
+        with open(os.path.join(REPORTS_DIR, request_id, "report.json"), encoding="utf-8") as f:
+            path = json.load(f)["artifacts"]["trace.json"]
+        with open(path, encoding="utf-8") as f:
+            events = json.load(f)["traceEvents"]
+    except (OSError, KeyError, ValueError):
+        return {}
+    waits: Dict[str, float] = {}
+    for ev in events:
+        if ev.get("ph") == "X" and ev["name"].startswith("queue_wait:"):
+            name = ev["name"].split(":", 1)[1]
+            waits[name] = waits.get(name, 0.0) + ev["dur"] / 1000.0
+    return waits
+
+
+async def _issue(client, entry: Dict[str, Any], headers: Dict[str, str], local: bool) -> Dict[str, Any]:
+    form = {"template": json.dumps(entry["template"])}
+    if entry["policy"]:
+        form["ocr_policy"] = entry["policy"]
+    files = {"file": (entry["filename"], entry["data"])}
+    rec: Dict[str, Any] = {"endpoint": entry["endpoint"], "filename": entry["filename"]}
+    t0 = time.perf_counter()
+    try:
+        if entry["endpoint"] == "/jobs":
+            form["priority"] = str(entry["priority"])
+            r = await client.post("/jobs", headers=headers, files=files, data=form)
+            rec["status"] = r.status_code
+            if r.status_code == 200:
+                submitted = time.perf_counter()
+                seen = dict((e, t) for e, t in await _sse_events(client, r.json()["job_id"], headers))
+                if "started" in seen:
+                    rec["job_wait_ms"] = (seen["started"] - submitted) * 1000.0
+                if "done" not in seen:
+                    rec["status"] = "job_error"
+        else:
+            r = await client.post(entry["endpoint"], headers=headers, files=files, data=form)
+            rec["status"] = r.status_code
+            if r.status_code == 200 and local:
+                rec["executor_wait_ms"] = _executor_waits(r.json().get("request_id", ""))
+    except Exception as e:  # connection errors count as failed requests
+        rec["status"] = type(e).__name__
+    rec["latency_ms"] = (time.perf_counter() - t0) * 1000.0
+    return rec
+
+
+def summarize(records: List[Dict[str, Any]], wall_s: float) -> Dict[str, Any]:
+    def _block(recs: List[Dict[str, Any]]) -> Dict[str, Any]:
+        ok = [r["latency_ms"] for r in recs if r["status"] == 200]
+        errors: Dict[str, int] = {}
+        for r in recs:
+            if r["status"] != 200:
+                errors[str(r["status"])] = errors.get(str(r["status"]), 0) + 1
+        return {
+            "requests": len(recs),
+            "ok": len(ok),
+            "error_rate": round(1 - len(ok) / len(recs), 4) if recs else 0.0,
+            "errors": errors,
+            "latency_ms": percentiles(ok),
+            "histogram_ms": histogram(ok),
+        }
+
+    out = _block(records)
+    out["by_endpoint"] = {ep: _block([r for r in records if r["endpoint"] == ep])
+                          for ep in sorted({r["endpoint"] for r in records})}
+    waits: Dict[str, List[float]] = {}
+    for r in records:
+        if "job_wait_ms" in r:
+            waits.setdefault("job_queue", []).append(r["job_wait_ms"])
+        for name, ms in r.get("executor_wait_ms", {}).items():
+            waits.setdefault(f"executor:{name}", []).append(ms)
+    out["queue_wait_ms"] = {k: percentiles(v) for k, v in sorted(waits.items())}
+    out["lateness_ms"] = percentiles([r["lateness_ms"] for r in records])
+    out["wall_s"] = round(wall_s, 3)
+    out["achieved_rps"] = round(len(records) / wall_s, 3) if wall_s else 0.0
+    out["peak_rss_mb"] = peak_rss_mb()
+    return out
+
+
+async def replay(entries: List[Dict[str, Any]], mode: str = "open", rps: float = 1.0, speed: float = 1.0,
+                 url: Optional[str] = None, api_key: Optional[str] = None) -> Dict[str, Any]:
+    """Send ``entries`` open-loop (never waiting for earlier responses) and summarize."""
+    import httpx
+
+    headers = {"x-api-key": api_key if api_key is not None else os.getenv("API_KEY", "")}
+    started_queue = False
+    if url:
+        client = httpx.AsyncClient(base_url=url, timeout=None)
+    else:
+        import jobs
+        import main
+        from config import JOB_WORKERS
+        if any(e["endpoint"] == "/jobs" for e in entries):
+            jobs.global_q.start(max(1, JOB_WORKERS), main._job_worker)
+            started_queue = True
+        client = httpx.AsyncClient(transport=httpx.ASGITransport(app=main.app), base_url="http://replay", timeout=None)
+
+    schedule = send_times(entries, mode, rps, speed)
+
+    async def _at(entry: Dict[str, Any], due: float, t0: float):
+        delay = t0 + due - time.perf_counter()
+        if delay > 0:
+            await asyncio.sleep(delay)
+        lateness = (time.perf_counter() - t0 - due) * 1000.0
+        rec = await _issue(client, entry, headers, local=url is None)
+        rec["lateness_ms"] = max(0.0, lateness)
+        return rec
+
+    try:
+        t0 = time.perf_counter()
+        records = await asyncio.gather(*(_at(e, due, t0) for e, due in zip(entries, schedule)))
+        wall = time.perf_counter() - t0
+    finally:
+        await client.aclose()
+        if started_queue:
+            await jobs.global_q.stop()
+    out = summarize(list(records), wall)
+    out["config"] = {"mode": mode, "rps": rps if mode == "rps" else None, "speed": speed,
+                     "target": url or "in-process"}
+    return out
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    ap = argparse.ArgumentParser(description="Replay captured traffic against docflow-ai")
+    ap.add_argument("traffic", help="JSON Lines traffic file")
+    ap.add_argument("--mode", choices=("open", "rps"), default="open")
+    ap.add_argument("--rps", type=float, default=1.0, help="request rate for --mode rps")
+    ap.add_argument("--speed", type=float, default=1.0, help="time compression for --mode open")
+    ap.add_argument("--url", help="replay over HTTP against this base URL (default: in-process)")
+    ap.add_argument("--api-key", help="x-api-key header (default: $API_KEY)")
+    ap.add_argument("--out", help="write the JSON report here (default: stdout)")
+    args = ap.parse_args(argv)
+    if args.rps <= 0 or args.speed <= 0:
+        ap.error("--rps and --speed must be positive")
+
+    entries = load_traffic(args.traffic)
+    if not entries:
+        ap.error("no requests in traffic file")
+    result = asyncio.run(replay(entries, args.mode, args.rps, args.speed, args.url, args.api_key))
+    text = json.dumps(result, indent=2)
+    if args.out:
+        with open(args.out, "w", encoding="utf-8") as f:
+            f.write(text)
+    else:
+        print(text)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,202 @@
+"""
+bench/run.py
+------------
+Offline end-to-end benchmark: drives the ASGI app in-process over a set of
+synthetic documents (see ``bench/synth.py``) and reports latency percentiles,
+per-stage percentiles (from each request's manifest ``timings_ms``),
+throughput and peak RSS as JSON.
+
+Mocked backends are used unless ``--real`` is given (then the local models
+configured for the service are loaded as usual).
+
+Run with:
+    python -m bench.run --kinds digital,scanned,mixed --pages 1,10,100 \
+        --concurrency 4 --out bench.json
+    python -m bench.run --baseline bench.json --threshold 0.15   # exit 1 on regression
+"""
+
+from __future__ import annotations
+import argparse
+import asyncio
+import json
+import os
+import resource
+import sys
+import time
+from typing import Any, Dict, List, Optional
+
+import numpy as np
+
+from bench.synth import KINDS, make_document
+
+DEFAULT_TEMPLATE = {
+    "name": "bench",
+    "fields": ["iban", "codice_fiscale", "totale", "data"],
+    "llm_text": "Estrai IBAN, codice fiscale, totale e data della fattura.",
+}
+
+
+def percentiles(values: List[float]) -> Dict[str, float]:
+    if not values:
+        return {"p50": 0.0, "p95": 0.0, "p99": 0.0, "n": 0}
+    p50, p95, p99 = np.percentile(np.asarray(values, dtype=float), [50, 95, 99])
+    return {"p50": round(float(p50), 2), "p95": round(float(p95), 2), "p99": round(float(p99), 2), "n": len(values)}
+
+
+def peak_rss_mb() -> float:
+    # ru_maxrss is in KiB on Linux, bytes on macOS
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return round(rss / (1024 * 1024 if sys.platform == "darwin" else 1024), 1)
+
+
+def build_corpus(kinds: List[str], pages: List[int], repeat: int = 1) -> List[Dict[str, Any]]:
+    docs = []
+    for kind in kinds:
+        for n in pages:
+            for r in range(repeat):
+                docs.append({
+                    "name": f"{kind}_{n}p_{r}.pdf",
+                    "kind": kind,
+                    "pages": n,
+                    "data": make_document(kind, n, seed=len(docs)),
+                })
+    return docs
+
+
+async def run_benchmark(docs: List[Dict[str, Any]], template: Dict[str, Any], concurrency: int = 1) -> Dict[str, Any]:
+    """Send every document to ``POST /extract`` with at most ``concurrency`` in flight."""
+    import httpx
+    import main
+    from config import REPORTS_DIR
+
+    headers = {"x-api-key": os.getenv("API_KEY", "")}
+    tpl = json.dumps(template)
+    sem = asyncio.Semaphore(max(1, concurrency))
+    latencies: List[float] = []
+    done_pages = 0
+    stages: Dict[str, List[float]] = {}
+    errors: List[Dict[str, Any]] = []
+
+    async def _one(client: "httpx.AsyncClient", doc: Dict[str, Any]):
+        nonlocal done_pages
+        async with sem:
+            t0 = time.perf_counter()
+            r = await client.post(
+                "/extract",
+                headers=headers,
+                files={"file": (doc["name"], doc["data"], "application/pdf")},
+                data={"template": tpl},
+            )
+            ms = (time.perf_counter() - t0) * 1000.0
+        if r.status_code != 200:
+            errors.append({"name": doc["name"], "status": r.status_code, "body": r.text[:200]})
+            return
+        latencies.append(ms)
+        done_pages += doc["pages"]
+        try:
+            with open(os.path.join(REPORTS_DIR, r.json()["request_id"], "report.json"), encoding="utf-8") as f:
+                timings = json.load(f)["manifest"].get("timings_ms", {})
+        except (OSError, KeyError, ValueError):
+            timings = {}
+        for stage, v in timings.items():
+            stages.setdefault(stage, []).append(float(v))
+
+    transport = httpx.ASGITransport(app=main.app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=None) as client:
+        t0 = time.perf_counter()
+        await asyncio.gather(*(_one(client, d) for d in docs))
+        wall = time.perf_counter() - t0
+
+    return {
+        "docs": len(docs),
+        "pages": sum(d["pages"] for d in docs),
+        "errors": errors,
+        "concurrency": concurrency,
+        "wall_s": round(wall, 3),
+        "docs_per_s": round(len(latencies) / wall, 3) if wall else 0.0,
+        "pages_per_s": round(done_pages / wall, 3) if wall else 0.0,
+        "peak_rss_mb": peak_rss_mb(),
+        "latency_ms": percentiles(latencies),
+        "stages_ms": {k: percentiles(v) for k, v in sorted(stages.items())},
+    }
+
+
+def compare(current: Dict[str, Any], baseline: Dict[str, Any], threshold: float = 0.1,
+            min_delta_ms: float = 5.0) -> List[str]:
+    """Regressions of ``current`` against ``baseline``: p95 latencies (overall
+    and per stage) more than ``threshold`` slower, throughput more than
+    ``threshold`` lower, or peak RSS more than ``threshold`` higher."""
+    out = []
+
+    def _lat(label: str, cur: Optional[Dict[str, float]], base: Optional[Dict[str, float]]):
+        if not cur or not base:
+            return
+        c, b = cur["p95"], base["p95"]
+        if c > b * (1 + threshold) and c - b >= min_delta_ms:
+            out.append(f"{label} p95 {b:.1f} -> {c:.1f} ms")
+
+    _lat("latency", current.get("latency_ms"), baseline.get("latency_ms"))
+    for stage, cur in current.get("stages_ms", {}).items():
+        _lat(f"stage {stage}", cur, baseline.get("stages_ms", {}).get(stage))
+    for key in ("docs_per_s", "pages_per_s"):
+        c, b = current.get(key, 0.0), baseline.get(key, 0.0)
+        if b and c < b * (1 - threshold):
+            out.append(f"{key} {b:.2f} -> {c:.2f}")
+    c, b = current.get("peak_rss_mb", 0.0), baseline.get("peak_rss_mb", 0.0)
+    if b and c > b * (1 + threshold):
+        out.append(f"peak_rss_mb {b:.1f} -> {c:.1f}")
+    return out
+
+
+def _csv(s: str) -> List[str]:
+    return [x.strip() for x in s.split(",") if x.strip()]
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    ap = argparse.ArgumentParser(description="docflow-ai offline end-to-end benchmark")
+    ap.add_argument("--kinds", default=",".join(KINDS), help=f"comma-separated subset of {','.join(KINDS)}")
+    ap.add_argument("--pages", default="1,10", help="comma-separated page counts (1..500)")
+    ap.add_argument("--repeat", type=int, default=1, help="documents per (kind, pages) combination")
+    ap.add_argument("--concurrency", type=int, default=1)
+    ap.add_argument("--template", help="template JSON file (default: built-in invoice template)")
+    ap.add_argument("--real", action="store_true", help="use the configured local models instead of mocks")
+    ap.add_argument("--out", help="write the JSON report here (default: stdout)")
+    ap.add_argument("--baseline", help="previous report to compare against")
+    ap.add_argument("--threshold", type=float, default=0.1, help="relative regression threshold")
+    args = ap.parse_args(argv)
+
+    kinds = _csv(args.kinds)
+    pages = [int(p) for p in _csv(args.pages)]
+    if any(k not in KINDS for k in kinds) or any(not 1 <= p <= 500 for p in pages):
+        ap.error("invalid --kinds or --pages")
+    if not args.real:
+        for k in ("MOCK_LLM", "MOCK_OCR", "BACKENDS_MOCK"):
+            os.environ[k] = "1"
+    template = DEFAULT_TEMPLATE
+    if args.template:
+        with open(args.template, encoding="utf-8") as f:
+            template = json.load(f)
+
+    docs = build_corpus(kinds, pages, args.repeat)
+    result = asyncio.run(run_benchmark(docs, template, args.concurrency))
+    result["config"] = {"kinds": kinds, "pages": pages, "repeat": args.repeat, "real": args.real}
+
+    rc = 0
+    if args.baseline:
+        with open(args.baseline, encoding="utf-8") as f:
+            regressions = compare(result, json.load(f), args.threshold)
+        result["regressions"] = regressions
+        rc = 1 if regressions else 0
+    text = json.dumps(result, indent=2)
+    if args.out:
+        with open(args.out, "w", encoding="utf-8") as f:
+            f.write(text)
+    else:
+        print(text)
+    for r in result.get("regressions", []):
+        print(f"REGRESSION: {r}", file=sys.stderr)
+    return rc
+
+
+if __name__ == "__main__":
+    sys.exit(main())
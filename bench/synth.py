@@ -0,0 +1,70 @@
+"""
+bench/synth.py
+--------------
+Synthetic invoice-like PDFs for benchmarks, built with PyMuPDF.
+
+Kinds:
+    digital  every page has a text layer
+    scanned  every page is a rendered image, no text layer (goes through OCR)
+    mixed    alternates digital and scanned pages
+"""
+
+from __future__ import annotations
+import random
+from typing import List
+
+import fitz
+
+KINDS = ("digital", "scanned", "mixed")
+
+_ITEMS = ("Consulenza", "Licenza software", "Manutenzione", "Trasporto", "Assistenza", "Formazione")
+
+
+def _page_lines(rng: random.Random, page_no: int) -> List[str]:
+    iban = "IT%02dX%022d" % (rng.randint(10, 99), rng.randrange(10 ** 21, 10 ** 22))
+    lines = [
+        f"FATTURA N. {rng.randint(1000, 9999)}/{page_no + 1}",
+        f"Data: {rng.randint(1, 28):02d}/{rng.randint(1, 12):02d}/2024",
+        f"Codice fiscale: {rng.randint(10 ** 10, 10 ** 11 - 1)}",
+        f"IBAN: {iban}",
+        "",
+        "Descrizione            Qta     Prezzo     Importo",
+    ]
+    total = 0.0
+    for _ in range(rng.randint(5, 15)):
+        qty, price = rng.randint(1, 9), rng.randint(500, 50000) / 100
+        total += qty * price
+        lines.append(f"{rng.choice(_ITEMS):<22} {qty:>3} {price:>10.2f} {qty * price:>10.2f}")
+    lines += ["", f"Totale: {total:.2f} EUR"]
+    return lines
+
+
+def _digital_page(doc: fitz.Document, lines: List[str]) -> None:
+    page = doc.new_page()
+    page.insert_text((56, 72), "\n".join(lines), fontsize=10, fontname="cour")
+
+
+def _scanned_page(doc: fitz.Document, lines: List[str], dpi: int) -> None:
+    src = fitz.open()
+    _digital_page(src, lines)
+    pix = src[0].get_pixmap(dpi=dpi, colorspace=fitz.csGRAY)
+    page = doc.new_page(width=src[0].rect.width, height=src[0].rect.height)
+    page.insert_image(page.rect, stream=pix.tobytes("png"))
+    src.close()
+
+
+def make_document(kind: str, pages: int, seed: int = 0, dpi: int = 100) -> bytes:
+    """Return the bytes of a ``pages``-page PDF of the given ``kind``."""
+    if kind not in KINDS:
+        raise ValueError(f"unknown kind {kind!r}; expected one of {KINDS}")
+    rng = random.Random(seed)
+    doc = fitz.open()
+    for i in range(pages):
+        lines = _page_lines(rng, i)
+        if kind == "digital" or (kind == "mixed" and i % 2 == 0):
+            _digital_page(doc, lines)
+        else:
+            _scanned_page(doc, lines, dpi)
+    data = doc.tobytes(garbage=3, deflate=True)
+    doc.close()
+    return data
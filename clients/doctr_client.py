@@ -1,43 +1,91 @@
 from __future__ import annotations
-import os, asyncio, tempfile
+import os, tempfile
+from functools import lru_cache
 from typing import List, Dict, Any, Optional
 
 import clients
+import executors
+import metrics
 from logger import get_logger
-
-_DOCTR_IMPORT_ERROR: Optional[Exception] = None
-try:  # pragma: no cover - optional heavy dependency
-    from doctr.io import DocumentFile  # type: ignore
-    from doctr.models import ocr_predictor  # type: ignore
-except Exception as e:  # pragma: no cover - doctr not installed
-    DocumentFile = None  # type: ignore
-    ocr_predictor = None  # type: ignore
-    _DOCTR_IMPORT_ERROR = e
+from services.image_prep import prepare_image
 
 log = get_logger(__name__)
 
 __all__ = ["DocTRClient", "analyze_async"]
 
+# images are downscaled to about this DPI before OCR (0 = keep full resolution)
+OCR_TARGET_DPI = float(os.getenv("OCR_TARGET_DPI", "200"))
+OCR_MAX_PIXELS = int(os.getenv("OCR_MAX_PIXELS", "0"))  # optional hard cap, 0 = none
+
+# adaptive mode: whole pages at OCR_LOW_DPI, then only words below OCR_MIN_WORD_CONF
+# are re-rasterised at OCR_HIGH_DPI and recognised again
+OCR_ADAPTIVE = os.getenv("OCR_ADAPTIVE", "0") == "1"
+OCR_LOW_DPI = float(os.getenv("OCR_LOW_DPI", "100"))
+OCR_HIGH_DPI = float(os.getenv("OCR_HIGH_DPI", "300"))
+OCR_MIN_WORD_CONF = float(os.getenv("OCR_MIN_WORD_CONF", "0.6"))
+_CROP_PAD = 0.15  # of the word height, on every side
+
+# torch intra-op threads per DocTR pass (the process-wide torch setting; only OCR uses torch)
+OCR_TORCH_THREADS = int(os.getenv("OCR_TORCH_THREADS", str(max(1, (os.cpu_count() or 4) // 4))))
+
+
+def set_torch_threads(n: int) -> None:
+    try:
+        import torch  # type: ignore
+        torch.set_num_threads(n)
+    except Exception:
+        pass
+
+
+@lru_cache(maxsize=1)
+def _import_doctr():
+    """Import python-doctr (and torch) on first use: it takes seconds, so not at module import."""
+    from doctr.io import DocumentFile  # type: ignore
+    from doctr.models import ocr_predictor  # type: ignore
+    return DocumentFile, ocr_predictor
+
 
 class DocTRClient:
     def __init__(self) -> None:
-        if DocumentFile is None or ocr_predictor is None:
-            raise RuntimeError("python-doctr is not installed")
+        try:
+            self._document_file, ocr_predictor = _import_doctr()
+        except Exception as e:
+            raise RuntimeError("python-doctr is not installed") from e
         self.model = ocr_predictor(pretrained=True)
+        self._threads_set = False
 
     def _load(self, path: str):
+        """Pages to OCR and, for downscaled images, their original ``(w, h)``."""
         if path.lower().endswith(".pdf"):
-            return DocumentFile.from_pdf(path)
-        return DocumentFile.from_images(path)
+            if OCR_ADAPTIVE:
+                return self._document_file.from_pdf(path, scale=OCR_LOW_DPI / 72.0), None
+            return self._document_file.from_pdf(path), None
+        target = OCR_LOW_DPI if OCR_ADAPTIVE else OCR_TARGET_DPI
+        try:
+            with open(path, "rb") as f:
+                img, size, scale = prepare_image(f.read(), target, OCR_MAX_PIXELS)
+        except Exception as e:
+            log.debug("Image preprocessing failed, OCR at full size: %s", e)
+            return self._document_file.from_images(path), None
+        if scale < 1.0:
+            log.info("OCR input downscaled x%.2f from %dx%d", scale, size[0], size[1])
+        return [img], [size]
 
     def extract_pages(self, path: str) -> List[Dict[str, Any]]:
-        doc = self._load(path)
+        if not self._threads_set:
+            # on first inference rather than at load, so a pre-fork load stays single-threaded
+            set_torch_threads(OCR_TORCH_THREADS)
+            self._threads_set = True
+        doc, sizes = self._load(path)
         result = self.model(doc)
         doc_pages = getattr(doc, "pages", doc)
         result_pages = getattr(result, "pages", result)
+        if OCR_ADAPTIVE:
+            self._refine(path, result_pages)
         pages: List[Dict[str, Any]] = []
         for pidx, (img, page) in enumerate(zip(doc_pages, result_pages)):
-            h, w = img.shape[0], img.shape[1]
+            # geometry is relative, so scaling by the original size undoes any downscale
+            w, h = sizes[pidx] if sizes else (img.shape[1], img.shape[0])
             blocks = []
             for block in page.blocks:
                 for line in block.lines:
@@ -60,6 +108,71 @@ class DocTRClient:
             )
         return pages
 
+    def _refine(self, path: str, result_pages) -> int:
+        """Re-recognise low-confidence words from high-DPI crops, in place.
+
+        A word keeps the new reading only if the recogniser is more confident
+        about it; detection and geometry stay those of the low-DPI pass.
+        """
+        weak = [
+            (pidx, word)
+            for pidx, page in enumerate(result_pages)
+            for block in page.blocks
+            for line in block.lines
+            for word in line.words
+            if getattr(word, "confidence", 1.0) < OCR_MIN_WORD_CONF
+        ]
+        if not weak:
+            return 0
+        crops = _high_dpi_crops(path, [(pidx, word.geometry) for pidx, word in weak])
+        preds = self.model.reco_predictor(crops)
+        improved = 0
+        for (_, word), (value, conf) in zip(weak, preds):
+            if conf > word.confidence:
+                word.value, word.confidence = value, conf
+                improved += 1
+        metrics.ocr_rerecognized_words_total.labels(outcome="improved").inc(improved)
+        metrics.ocr_rerecognized_words_total.labels(outcome="kept").inc(len(weak) - improved)
+        log.info("Adaptive OCR: %d/%d low-confidence words improved at %d dpi", improved, len(weak), OCR_HIGH_DPI)
+        return improved
+
+
+def _padded(geometry, w: float, h: float):
+    (x0, y0), (x1, y1) = geometry
+    pad = (y1 - y0) * _CROP_PAD
+    return (max(0.0, x0 - pad) * w, max(0.0, y0 - pad) * h, min(1.0, x1 + pad) * w, min(1.0, y1 + pad) * h)
+
+
+def _high_dpi_crops(path: str, boxes: List[tuple]) -> list:
+    """RGB crops of relative ``(page_index, geometry)`` boxes at ``OCR_HIGH_DPI``:
+    PDFs re-render just the clip, images crop the original (never upsampled)."""
+    import numpy as np
+
+    crops = []
+    if path.lower().endswith(".pdf"):
+        import fitz  # type: ignore
+        with fitz.open(path) as pdf:
+            for pidx, geometry in boxes:
+                page = pdf[pidx]
+                clip = fitz.Rect(*_padded(geometry, page.rect.width, page.rect.height))
+                pix = page.get_pixmap(dpi=int(OCR_HIGH_DPI), clip=clip, colorspace=fitz.csRGB, alpha=False)
+                crops.append(np.frombuffer(pix.samples, dtype=np.uint8).reshape(pix.height, pix.width, 3))
+        return crops
+    from PIL import Image, ImageOps
+    from services.image_prep import effective_dpi
+
+    with Image.open(path) as src:
+        img = ImageOps.exif_transpose(src)
+        dpi = effective_dpi(img.size, src.info.get("dpi"))
+        img = img.convert("RGB")
+    scale = min(1.0, OCR_HIGH_DPI / dpi)
+    for _, geometry in boxes:
+        crop = img.crop(tuple(round(v) for v in _padded(geometry, img.width, img.height)))
+        if scale < 1.0:
+            crop = crop.resize((max(1, round(crop.width * scale)), max(1, round(crop.height * scale))), Image.Resampling.LANCZOS)
+        crops.append(np.asarray(crop))
+    return crops
+
 
 _DOCTR_INSTANCE: DocTRClient | None = None
 
@@ -73,17 +186,19 @@ def _get_doctr() -> DocTRClient:
                     return [{"page": 1, "page_w": 1.0, "page_h": 1.0, "blocks": []}]
             log.info("MOCK_OCR=1 - using DocTR mock")
             _DOCTR_INSTANCE = _Mock()  # type: ignore[assignment]
-        elif DocumentFile is None or ocr_predictor is None:
-            class _Stub:
-                def extract_pages(self, path: str) -> List[Dict[str, Any]]:
-                    return [{"page": 1, "page_w": 1.0, "page_h": 1.0, "blocks": []}]
-            if _DOCTR_IMPORT_ERROR is not None:
-                log.warning("DocTR import failed: %s", _DOCTR_IMPORT_ERROR)
-            log.warning("python-doctr not installed; using stub")
-            _DOCTR_INSTANCE = _Stub()  # type: ignore[assignment]
         else:
-            log.info("Creating DocTRClient instance")
-            _DOCTR_INSTANCE = DocTRClient()
+            try:
+                _import_doctr()
+            except Exception as e:  # pragma: no cover - doctr not installed
+                class _Stub:
+                    def extract_pages(self, path: str) -> List[Dict[str, Any]]:
+                        return [{"page": 1, "page_w": 1.0, "page_h": 1.0, "blocks": []}]
+                log.warning("DocTR import failed: %s", e)
+                log.warning("python-doctr not installed; using stub")
+                _DOCTR_INSTANCE = _Stub()  # type: ignore[assignment]
+            else:
+                log.info("Creating DocTRClient instance")
+                _DOCTR_INSTANCE = DocTRClient()
     return _DOCTR_INSTANCE
 
 
@@ -108,7 +223,6 @@ async def analyze_async(data: bytes, filename: str, pages: Optional[list] = None
         clients._mock_counters["ocr"] += 1
     except Exception:
         pass
-    loop = asyncio.get_event_loop()
-    res = await loop.run_in_executor(None, _analyze_sync, data, filename, pages)
+    res = await executors.run("ocr", _analyze_sync, data, filename, pages)
     log.info("DocTR analyze_async completed")
     return res
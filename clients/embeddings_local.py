@@ -1,30 +1,39 @@
 # clients/embeddings_local.py
 from __future__ import annotations
 import os
-from typing import List
+from functools import lru_cache
+from typing import Any, List
 from logger import get_logger
 
 log = get_logger(__name__)
 
-# Optional heavy deps; imported lazily.  These may not be installed in test
-# environments, so we fall back to ``None`` and raise a clear error only if the
-# functionality is actually invoked.
-try:  # pragma: no cover - import is exercised indirectly
-    from llama_cpp import Llama  # type: ignore
-except Exception:  # pragma: no cover - absence is handled at runtime
-    Llama = None  # type: ignore
+# Optional heavy deps; imported on first use.  These may not be installed in
+# test environments, so we fall back to ``None`` and raise a clear error only if
+# the functionality is actually invoked.
+@lru_cache(maxsize=1)
+def _llama_cls():
+    try:  # pragma: no cover - import is exercised indirectly
+        from llama_cpp import Llama  # type: ignore
+    except Exception:  # pragma: no cover - absence is handled at runtime
+        return None
+    return Llama
 
-try:  # pragma: no cover - import is exercised indirectly
-    from huggingface_hub import hf_hub_download  # type: ignore
-except Exception:  # pragma: no cover - absence is handled at runtime
-    hf_hub_download = None  # type: ignore
+
+@lru_cache(maxsize=1)
+def _hf_hub_download():
+    try:  # pragma: no cover - import is exercised indirectly
+        from huggingface_hub import hf_hub_download  # type: ignore
+    except Exception:  # pragma: no cover - absence is handled at runtime
+        return None
+    return hf_hub_download
 
 import clients  # namespace package for optional monkeypatched funcs
 
 EMB_PATH = os.getenv("EMBEDDINGS_GGUF_PATH", "/models/embeddings.gguf")
-EMB_THREADS = int(os.getenv("EMB_THREADS", str(os.cpu_count() or 4)))
+EMB_THREADS = int(os.getenv("EMB_THREADS", str(max(1, (os.cpu_count() or 4) // 4))))  # a quarter of the cores
 EMB_N_CTX = int(os.getenv("EMB_N_CTX", "512"))
 EMB_GPU_LAYERS = int(os.getenv("EMB_GPU_LAYERS", "0"))
+EMB_USE_MMAP = os.getenv("EMB_USE_MMAP", "1") == "1"  # weights stay in the shared page cache
 # Default to a small, CPU-friendly model to ease local embedding tests.
 # The repository and file can still be overridden via environment variables
 # `EMB_HF_REPO` and `EMB_HF_FILE` if a different model is desired.
@@ -32,10 +41,10 @@ HF_REPO = os.getenv("EMB_HF_REPO", "nomic-ai/nomic-embed-text-v1.5-GGUF")
 HF_FILE = os.getenv("EMB_HF_FILE", "nomic-embed-text-v1.5.Q4_K_M.gguf")
 HF_TOKEN = os.getenv("HUGGINGFACE_TOKEN")
 
-_EMB: Llama | None = None
+_EMB: Any = None
 
 
-def get_local_embedder() -> Llama:
+def get_local_embedder():
     global _EMB
     if _EMB is None:
         model_path = EMB_PATH
@@ -45,6 +54,7 @@ def get_local_embedder() -> Llama:
                 model_path,
                 HF_REPO,
             )
+            hf_hub_download = _hf_hub_download()
             if hf_hub_download is None:
                 raise RuntimeError(
                     "huggingface-hub is required to download embeddings models"
@@ -59,6 +69,7 @@ def get_local_embedder() -> Llama:
                 log.error("Failed to download embeddings model: %s", e)
                 raise RuntimeError(f"Failed to download embeddings model: {e}") from e
             log.info("Downloaded embeddings model to %s", model_path)
+        Llama = _llama_cls()
         if Llama is None:
             raise RuntimeError(
                 "llama-cpp-python is required for local embeddings; install it or "
@@ -72,6 +83,7 @@ def get_local_embedder() -> Llama:
                 n_threads=EMB_THREADS,
                 n_ctx=EMB_N_CTX,
                 n_gpu_layers=EMB_GPU_LAYERS,
+                use_mmap=EMB_USE_MMAP,
                 verbose=False,
             )
         except Exception as e:
@@ -86,7 +98,7 @@ def _embed_llm(texts: List[str]) -> List[List[float]]:
         log.info("Using monkeypatched llm_embed for %d texts", len(texts))
         vecs = fn(texts)
         return vecs.tolist() if hasattr(vecs, "tolist") else vecs
-    if Llama is None:
+    if _llama_cls() is None:
         log.warning("llama-cpp-python not installed; returning zero embeddings for %d texts", len(texts))
         return [[0.0, 0.0, 0.0] for _ in texts]
     log.info("Using local GGUF embedder for %d texts", len(texts))
@@ -1,32 +1,41 @@
 # clients/llm_local.py
 from __future__ import annotations
-import os, json, re
-from typing import Dict, Any, List
-# ``llama_cpp`` is an optional heavy dependency. Import lazily so tests can run
-# without the package installed.  A clear error will be raised if the LLM is
-# actually used without the dependency.
-try:  # pragma: no cover - import itself is side-effect free
-    from llama_cpp import Llama  # type: ignore
-except Exception:  # pragma: no cover - handled at runtime
-    Llama = None  # type: ignore
+import os, json, re, threading, time
+from typing import Dict, Any, List, Tuple
+from functools import lru_cache
 
 from logger import get_logger
+import metrics
 
 LLM_GGUF_PATH   = os.getenv("LLM_GGUF_PATH", "/models/llm.gguf")
 LLAMA_N_CTX     = int(os.getenv("LLM_N_CTX", "4096"))
-LLAMA_N_THREADS = int(os.getenv("LLM_N_THREADS", str(os.cpu_count() or 4)))
+LLAMA_N_THREADS = int(os.getenv("LLM_N_THREADS", str(max(1, (os.cpu_count() or 4) // 2))))  # half the cores
 LLAMA_BATCH     = int(os.getenv("LLM_BATCH", "512"))
 LLAMA_GPU_LAYERS= int(os.getenv("LLM_GPU_LAYERS", "0"))
 LLM_TEMPERATURE = float(os.getenv("LLM_TEMPERATURE", "0.1"))
 LLM_SEED        = int(os.getenv("LLM_SEED", "42"))
+LLM_USE_MMAP    = os.getenv("LLM_USE_MMAP", "1") == "1"  # weights stay in the shared page cache
 
-_GLOBAL_LLM: Llama | None = None
+_GLOBAL_LLM: Any = None
 _JSON_FENCE = re.compile(r"\{.*\}", re.DOTALL)
+_STATS = threading.local()
 log = get_logger(__name__)
 
-def get_local_llm() -> Llama:
+# ``llama_cpp`` is an optional heavy dependency. Import it on first use so the
+# app starts (and tests run) without paying for it; a clear error is raised if
+# the LLM is actually used without the dependency.
+@lru_cache(maxsize=1)
+def _llama_cls():
+    try:  # pragma: no cover - import itself is side-effect free
+        from llama_cpp import Llama  # type: ignore
+    except Exception:  # pragma: no cover - handled at runtime
+        return None
+    return Llama
+
+def get_local_llm():
     global _GLOBAL_LLM
     if _GLOBAL_LLM is None:
+        Llama = _llama_cls()
         if Llama is None:
             raise RuntimeError(
                 "llama-cpp-python is required for local LLM functionality; install it "
@@ -39,11 +48,18 @@ def get_local_llm() -> Llama:
             n_threads=LLAMA_N_THREADS,
             n_gpu_layers=LLAMA_GPU_LAYERS,
             seed=LLM_SEED,
+            use_mmap=LLM_USE_MMAP,
             verbose=False,
         )
     return _GLOBAL_LLM
 
-def _build_prompt(fields: List[str], llm_text: str, context: str) -> str:
+@lru_cache(maxsize=256)
+def _prompt_prefix(fields: Tuple[str, ...], llm_text: str) -> str:
+    """Template-dependent head of the prompt, built once per (fields, guide).
+
+    It comes before the document CONTEXT, so consecutive documents of the same
+    template share a token prefix that llama.cpp can reuse from its KV cache.
+    """
     field_list = ", ".join(fields)
     return f"""
 You are an information extractor. Given the CONTEXT and the EXTRACTION_GUIDE, output a compact JSON with the requested fields.
@@ -56,7 +72,10 @@ EXTRACTION_GUIDE:
 REQUESTED_FIELDS: [{field_list}]
 
 CONTEXT:
-{context}
+"""
+
+def _build_prompt(fields: List[str], llm_text: str, context: str) -> str:
+    return _prompt_prefix(tuple(fields), llm_text) + f"""{context}
 
 JSON SCHEMA EXAMPLE:
 {{
@@ -64,17 +83,46 @@ JSON SCHEMA EXAMPLE:
 }}
 """
 
+def last_call_stats() -> Dict[str, Any]:
+    """Timing/token stats of the last ``chat_json`` call made on this thread."""
+    return dict(getattr(_STATS, "last", {}) or {})
+
 def chat_json(fields: List[str], llm_text: str, context: str) -> Dict[str, Dict[str, Any]]:
     log.info("Calling local LLM for fields %s", fields)
     llm = get_local_llm()
     prompt = _build_prompt(fields, llm_text, context).strip()
-    out = llm.create_completion(
+    _STATS.last = {}
+    # streamed so that time-to-first-token separates prompt eval from generation
+    t0 = time.perf_counter()
+    t_first = None
+    parts: List[str] = []
+    n_out = 0
+    for chunk in llm.create_completion(
         prompt=prompt,
         max_tokens=2048,
         temperature=LLM_TEMPERATURE,
         stop=[],
-    )
-    text = out["choices"][0]["text"]
+        stream=True,
+    ):
+        if t_first is None:
+            t_first = time.perf_counter()
+        parts.append(chunk["choices"][0].get("text", ""))
+        n_out += 1
+    t_end = time.perf_counter()
+    text = "".join(parts)
+    try:
+        n_in = len(llm.tokenize(prompt.encode("utf-8")))
+    except Exception:
+        n_in = 0
+    metrics.llm_tokens_total.labels(direction="in").inc(n_in)
+    metrics.llm_tokens_total.labels(direction="out").inc(n_out)
+    t_first = t_first or t_end
+    _STATS.last = {
+        "prompt_tokens": n_in,
+        "completion_tokens": n_out,
+        "prompt_eval_ms": (t_first - t0) * 1000,
+        "generation_ms": (t_end - t_first) * 1000,
+    }
     m = _JSON_FENCE.search(text)
     raw = m.group(0) if m else text
     try:
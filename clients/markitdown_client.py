@@ -1,18 +1,21 @@
-import asyncio
+from functools import lru_cache
 from typing import Optional
 from logger import get_logger
 import clients
+import executors
 
-# Il pacchetto ``markitdown`` è opzionale e non sempre disponibile nei
-# contesti di test. Importiamo in modo pigro e rimandiamo l'errore solo al
-# momento dell'utilizzo effettivo della funzionalità.
-try:  # pragma: no cover - l'import diretto è difficile da testare
-    from markitdown import MarkItDown  # type: ignore
-except Exception:  # pragma: no cover - assenza gestita a runtime
-    MarkItDown = None  # type: ignore
+log = get_logger(__name__)
 
 
-log = get_logger(__name__)
+# Il pacchetto ``markitdown`` è opzionale e pesante da importare: lo importiamo
+# al primo utilizzo e rimandiamo l'errore al momento dell'uso effettivo.
+@lru_cache(maxsize=1)
+def _markitdown_cls():
+    try:  # pragma: no cover - l'import diretto è difficile da testare
+        from markitdown import MarkItDown  # type: ignore
+    except Exception:  # pragma: no cover - assenza gestita a runtime
+        return None
+    return MarkItDown
 
 
 async def convert_bytes_to_markdown_async(
@@ -32,6 +35,7 @@ async def convert_bytes_to_markdown_async(
         clients._mock_counters["md"] += 1
     except Exception:
         pass
+    MarkItDown = _markitdown_cls()
     if MarkItDown is None:
         raise RuntimeError(
             "markitdown package is required for conversion; install it or "
@@ -50,7 +54,6 @@ async def convert_bytes_to_markdown_async(
         # .text_content è la stringa markdown
         return getattr(res, "text_content", str(res))
 
-    loop = asyncio.get_running_loop()
-    out = await loop.run_in_executor(None, _convert)
+    out = await executors.run("conversion", _convert)
     log.info("MarkItDown conversion done for %s (len=%d)", filename, len(out))
     return out
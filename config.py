@@ -69,3 +69,60 @@ BACKENDS_MOCK = get_env_int("BACKENDS_MOCK", 1)  # 1=use mock responses for exte
 HTTP_TIMEOUT_MS = get_env_int("HTTP_TIMEOUT_MS", 60000)
 
 DEBUG_DIR = get_env_str("DEBUG_DIR", "./data/debug")
+
+# Background jobs
+JOB_WORKERS            = get_env_int("JOB_WORKERS", 1)            # concurrent asyncio job workers
+JOB_QUEUE_MAXSIZE      = get_env_int("JOB_QUEUE_MAXSIZE", 100)
+JOB_RESULT_TTL_S       = get_env_int("JOB_RESULT_TTL_S", 3600)    # results/events retention
+JOB_RESULT_MAX_ENTRIES = get_env_int("JOB_RESULT_MAX_ENTRIES", 1000)
+JOB_SSE_HEARTBEAT_S    = get_env_int("JOB_SSE_HEARTBEAT_S", 15)   # keep-alive comment interval
+JOB_BACKEND            = get_env_str("JOB_BACKEND", "memory")     # memory|sqlite (shared across processes)
+JOB_DB_PATH            = get_env_str("JOB_DB_PATH", "./data/jobs.db")
+JOB_LEASE_S            = get_env_int("JOB_LEASE_S", 300)          # renewed while a job runs
+JOB_MAX_ATTEMPTS       = get_env_int("JOB_MAX_ATTEMPTS", 3)
+JOB_POLL_MS            = get_env_int("JOB_POLL_MS", 200)
+
+# Startup: heavy backends load in the background, /ready reports when they are usable
+WARMUP_BACKENDS        = get_env_str("WARMUP_BACKENDS", "ocr,embeddings,llm,markitdown")  # "" = no warmup
+READY_REQUIRED         = get_env_str("READY_REQUIRED", "ocr,embeddings,llm")  # must load for /ready=200
+PRELOAD_BACKENDS       = get_env_str("PRELOAD_BACKENDS", "ocr")   # loaded in the gunicorn master before fork
+
+# Tracing / profiling (written to the request's REPORTS_DIR bundle)
+TRACE_REQUESTS         = get_env_int("TRACE_REQUESTS", 1)         # trace.json (Chrome trace format)
+PROFILE_REQUESTS       = get_env_int("PROFILE_REQUESTS", 0)       # profile.folded for every request
+PROFILE_INTERVAL_MS    = get_env_float("PROFILE_INTERVAL_MS", 5.0)
+
+# Executors: one thread pool per pipeline stage, so a burst of one stage can't starve the others
+CONVERSION_WORKERS     = get_env_int("CONVERSION_WORKERS", 2)     # MarkItDown conversions
+PDF_WORKERS            = get_env_int("PDF_WORKERS", 2)            # PyMuPDF text/words, overlays
+OCR_WORKERS            = get_env_int("OCR_WORKERS", 1)            # DocTR passes (each uses OCR_TORCH_THREADS)
+EMBEDDING_WORKERS      = get_env_int("EMBEDDING_WORKERS", 1)      # embeddings + retrieval index (EMB_THREADS)
+LLM_WORKERS            = get_env_int("LLM_WORKERS", 1)            # llama.cpp calls (LLM_N_THREADS)
+IO_WORKERS             = get_env_int("IO_WORKERS", 4)             # report/artifact writes
+
+# Admission control (per process): 429 + Retry-After instead of accepting work that can't meet the SLO
+ADMISSION_MAX_DOCS     = get_env_int("ADMISSION_MAX_DOCS", 16)    # documents in flight (/jobs is bounded by JOB_QUEUE_MAXSIZE)
+ADMISSION_MAX_PAGES    = get_env_int("ADMISSION_MAX_PAGES", 1000) # pages in flight (a lone document is always admitted)
+LATENCY_SLO_MS         = get_env_float("LATENCY_SLO_MS", 0.0)     # 0 = only the caps apply
+ADMISSION_WINDOW_S     = get_env_float("ADMISSION_WINDOW_S", 60.0) # busy time the throughput estimate looks back
+
+# Event loop health: lag histogram + stack dump when the loop is blocked
+LOOP_LAG_INTERVAL_MS   = get_env_float("LOOP_LAG_INTERVAL_MS", 100.0)  # 0 = monitor off
+LOOP_BLOCK_THRESHOLD_MS = get_env_float("LOOP_BLOCK_THRESHOLD_MS", 500.0)  # 0 = no stack dumps
+
+# Report artifacts: tokens are saved as tokens.bin (token_table.TokenTable) and, unless disabled, as tokens.jsonl
+TOKENS_JSONL           = get_env_int("TOKENS_JSONL", 1)
+
+# Streaming: PDFs of at least STREAM_MIN_PAGES pages are parsed, chunked and indexed in page windows
+STREAM_MIN_PAGES       = get_env_int("STREAM_MIN_PAGES", 200)     # 0 = never stream
+STREAM_WINDOW_PAGES    = get_env_int("STREAM_WINDOW_PAGES", 16)   # pages held in memory at once
+
+# Layout cache: field positions learned per document layout (repeat vendors), per process
+LAYOUT_CACHE_SIZE      = get_env_int("LAYOUT_CACHE_SIZE", 512)    # known layouts kept (LRU); 0 = off
+LAYOUT_MATCH_MIN       = get_env_float("LAYOUT_MATCH_MIN", 0.8)   # share of a layout's fingerprint a document must have
+LAYOUT_LEARN_MIN_CONFIDENCE = get_env_float("LAYOUT_LEARN_MIN_CONFIDENCE", 0.8)  # field results worth remembering
+LAYOUT_VERIFY          = get_env_int("LAYOUT_VERIFY", 0)          # 1 = still ask the LLM and compare
+
+# Batch extraction (/extract/batch)
+BATCH_PREFLIGHT_CONCURRENCY = get_env_int("BATCH_PREFLIGHT_CONCURRENCY", 2)  # docs parsed/OCR'd at once
+BATCH_PREFETCH              = get_env_int("BATCH_PREFETCH", 2)               # parsed docs waiting for the LLM
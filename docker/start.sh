@@ -1,11 +1,21 @@
 #!/usr/bin/env bash
 set -euo pipefail
 cd /app
-HOST="${HOST:-0.0.0.0}"; PORT="${PORT:-8000}"; WORKERS="${WORKERS:-1}"
+HOST="${HOST:-0.0.0.0}"; PORT="${PORT:-8000}"; WORKERS="${WORKERS:-1}"; ROLE="${ROLE:-api}"
+if [ "${ROLE}" = "worker" ]; then
+  # Compute-only process consuming the shared SQLite queue (JOB_BACKEND=sqlite)
+  echo "Starting standalone job worker (JOB_WORKERS=${JOB_WORKERS:-1})"
+  exec python worker.py
+fi
 MODULE=$(python - <<'PY'
 import importlib.util
 print("serve:app" if importlib.util.find_spec("serve") else "main:app")
 PY
 )
+if [ "${SERVER:-uvicorn}" = "gunicorn" ]; then
+  # Pre-fork server: model weights loaded once in the master and shared by the workers
+  echo "Starting gunicorn ${MODULE} on ${HOST}:${PORT} (workers=${WORKERS}, preload=${PRELOAD_BACKENDS:-ocr})"
+  exec gunicorn -c gunicorn.conf.py --bind "${HOST}:${PORT}" --workers "${WORKERS}" "${MODULE}"
+fi
 echo "Starting uvicorn ${MODULE} on ${HOST}:${PORT} (workers=${WORKERS})"
 exec uvicorn "${MODULE}" --host "${HOST}" --port "${PORT}" --workers "${WORKERS}"
@@ -0,0 +1,97 @@
+# executors.py — instrumented offloading of blocking work to per-stage thread pools
+from __future__ import annotations
+import asyncio, os, threading, time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, Optional
+import config, metrics, tracing
+
+# size of asyncio's default ThreadPoolExecutor (stages without a pool of their own)
+DEFAULT_MAX_WORKERS = min(32, (os.cpu_count() or 1) + 4)
+
+# pool -> config knob holding its size
+POOLS = {
+    "conversion": "CONVERSION_WORKERS",
+    "pdf": "PDF_WORKERS",
+    "ocr": "OCR_WORKERS",
+    "embeddings": "EMBEDDING_WORKERS",
+    "llm": "LLM_WORKERS",
+    "io": "IO_WORKERS",
+}
+# stages sharing another stage's pool
+STAGE_POOLS = {
+    "overlay": "pdf",
+    "markitdown": "conversion",
+}
+
+_pools: Dict[str, ThreadPoolExecutor] = {}
+_lock = threading.Lock()
+
+
+def pool_for(stage: str) -> str:
+    """Name of the pool ``stage`` runs on (``default`` = the loop's default executor)."""
+    stage = STAGE_POOLS.get(stage, stage)
+    return stage if stage in POOLS else "default"
+
+
+def size(pool: str) -> int:
+    if pool not in POOLS:
+        return DEFAULT_MAX_WORKERS
+    return max(1, int(getattr(config, POOLS[pool])))
+
+
+def get(pool: str) -> Optional[ThreadPoolExecutor]:
+    """The pool's executor, created on first use (so never before a fork)."""
+    if pool not in POOLS:
+        return None
+    ex = _pools.get(pool)
+    if ex is None:
+        with _lock:
+            ex = _pools.get(pool)
+            if ex is None:
+                ex = _pools[pool] = ThreadPoolExecutor(size(pool), thread_name_prefix=f"docflow-{pool}")
+    return ex
+
+
+def shutdown(wait: bool = True) -> None:
+    with _lock:
+        pools = list(_pools.values())
+        _pools.clear()
+    for ex in pools:
+        ex.shutdown(wait=wait)
+
+
+async def run(stage: str, fn: Callable[..., Any], *args: Any) -> Any:
+    """Run ``fn(*args)`` on the thread pool of ``stage``, tracking queue/active gauges per pool.
+
+    With a request trace active, the wait for a free thread is recorded as a
+    ``queue_wait:<stage>`` span and the work itself on the worker thread's track.
+    """
+    pool = pool_for(stage)
+    metrics.executor_max_workers.labels(executor=pool).set(size(pool))
+    queued = metrics.executor_queued.labels(executor=pool)
+    active = metrics.executor_active.labels(executor=pool)
+    started = False
+    trace = tracing.current.get()
+    track = tracing.current_track()
+    t_submit = time.perf_counter()
+
+    def _call():
+        nonlocal started
+        started = True
+        t_start = time.perf_counter()
+        queued.dec(); active.inc()
+        try:
+            return fn(*args)
+        finally:
+            active.dec()
+            metrics.executor_completed_total.labels(executor=pool).inc()
+            if trace is not None:
+                trace.add(f"queue_wait:{stage}", t_submit, t_start, cat="executor", track=track)
+                trace.add(f"{stage}:{getattr(fn, '__name__', 'call')}", t_start, time.perf_counter(), cat="executor")
+
+    queued.inc()
+    try:
+        return await asyncio.get_running_loop().run_in_executor(get(pool), _call)
+    finally:
+        if not started:
+            queued.dec()
@@ -0,0 +1,40 @@
+"""
+gunicorn.conf.py
+----------------
+Multi-process serving with model memory shared between workers.
+
+The app is imported in the gunicorn master (``preload_app``) and the backends
+in ``PRELOAD_BACKENDS`` (DocTR/torch weights) are loaded there before the
+workers are forked, so every worker maps the same physical pages
+copy-on-write; ``gc.freeze()`` keeps the collector from touching (and so
+copying) them. GGUF models (LLM, embedder) are loaded per worker with mmap,
+so their weights are shared through the page cache instead of copied.
+Each worker still runs the normal background warmup; ``/ready`` and
+``process_memory_bytes{kind="uss"}`` report its unique memory.
+
+Run with:
+    WORKERS=4 gunicorn -c gunicorn.conf.py main:app
+"""
+
+import gc
+import os
+
+bind = f"{os.getenv('HOST', '0.0.0.0')}:{os.getenv('PORT', '8000')}"
+workers = int(os.getenv("WORKERS", "2"))
+worker_class = "uvicorn.workers.UvicornWorker"
+preload_app = True
+timeout = int(os.getenv("GUNICORN_TIMEOUT", "300"))
+
+
+def when_ready(server):
+    # runs in the master after the app import, before any worker is forked
+    import warmup
+    from config import PRELOAD_BACKENDS
+    loaded = warmup.preload(PRELOAD_BACKENDS)
+    gc.freeze()
+    server.log.info("Preloaded before fork: %s", ", ".join(loaded) or "nothing")
+
+
+def post_fork(server, worker):
+    import warmup
+    warmup.after_fork()
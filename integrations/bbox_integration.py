@@ -1,12 +1,19 @@
 # integrations/bbox_integration.py
 from __future__ import annotations
-from typing import Dict, Any
+from typing import Dict, Any, List, Optional
 from clients.doctr_client import _get_doctr
 from services.bbox_mapper import map_bboxes_to_fields
 
-def attach_locations_to_response(doc_path: str, response: Dict[str, Any]) -> Dict[str, Any]:
+def attach_locations_to_response(doc_path: str, response: Dict[str, Any],
+                                 cells: Optional[List[Dict[str, Any]]] = None) -> Dict[str, Any]:
+    """Add ``locations`` to the response fields. ``cells`` (table cell tokens read
+    from a PDF text layer) are used as-is; otherwise the document is OCR'd."""
     if not isinstance(response, dict) or "fields" not in response:
         return response
+    if cells:
+        fields_map = response.get("fields") if isinstance(response.get("fields"), dict) else {}
+        response["fields"] = map_bboxes_to_fields(fields_map, cells)
+        return response
     doctr = _get_doctr()
     pages = doctr.extract_pages(doc_path)
     tokens = []
@@ -1,66 +1,545 @@
 from __future__ import annotations
-import threading, queue, time, uuid, json
-from typing import Any, Dict, Callable
+import asyncio, itertools, queue, threading, time, uuid, json, os, socket, sqlite3
+from contextlib import closing
+from collections import OrderedDict
+from typing import Any, Dict, Callable, Awaitable, Optional
 from logger import get_logger
 from config import *
+import metrics
 log = get_logger(__name__)
 
-class JobQueue:
-    def __init__(self, maxsize: int = 100):
-        self.q = queue.PriorityQueue(maxsize=maxsize)
-        self.events = {}  # job_id -> list of SSE events (dict)
-        self.results = {} # job_id -> result
+
+class QueueFull(RuntimeError):
+    """The job queue is at ``JOB_QUEUE_MAXSIZE``."""
+
+class TTLStore:
+    """Thread-safe mapping bounded by entry count (LRU) and age (TTL)."""
+
+    def __init__(self, max_entries: int = 1000, ttl_s: float = 3600.0):
+        self.max_entries = max(1, int(max_entries))
+        self.ttl_s = float(ttl_s)
+        self._data: "OrderedDict[str, tuple]" = OrderedDict()  # key -> (ts, value)
         self.lock = threading.Lock()
-        self.workers = []
-        self.stop = False
 
-    def start(self, n_workers: int, handler: Callable[[dict], dict]):
+    def _expire(self, now: float):
+        if self.ttl_s <= 0:
+            return
+        while self._data:
+            key, (ts, _) = next(iter(self._data.items()))
+            if now - ts <= self.ttl_s:
+                break
+            self._data.popitem(last=False)
+
+    def set(self, key: str, value: Any):
+        now = time.time()
+        with self.lock:
+            self._data.pop(key, None)
+            self._data[key] = (now, value)
+            self._expire(now)
+            while len(self._data) > self.max_entries:
+                self._data.popitem(last=False)
+
+    def append(self, key: str, item: Any):
+        """Append ``item`` to the list stored at ``key`` and refresh its age."""
+        now = time.time()
+        with self.lock:
+            old = self._data.pop(key, None)
+            lst = old[1] if old is not None else []
+            lst.append(item)
+            self._data[key] = (now, lst)
+            self._expire(now)
+            while len(self._data) > self.max_entries:
+                self._data.popitem(last=False)
+
+    def get(self, key: str, default: Any = None) -> Any:
+        with self.lock:
+            self._expire(time.time())
+            item = self._data.get(key)
+            return item[1] if item is not None else default
+
+    def __contains__(self, key: str) -> bool:
+        return self.get(key) is not None
+
+    def __len__(self) -> int:
+        with self.lock:
+            self._expire(time.time())
+            return len(self._data)
+
+TERMINAL_EVENTS = ("done", "error")
+
+class JobQueue:
+    """Priority job queue served by asyncio worker tasks on the app's event loop."""
+
+    def __init__(self, maxsize: int = 100, max_entries: int = 1000, ttl_s: float = 3600.0):
+        self.maxsize = maxsize
+        self.q: Optional[asyncio.PriorityQueue] = None
+        self.events = TTLStore(max_entries, ttl_s)   # job_id -> list of SSE events (dict)
+        self.results = TTLStore(max_entries, ttl_s)  # job_id -> result
+        self.workers: list = []
+        self._seq = itertools.count()
+        self._waiters: Dict[str, set] = {}  # job_id -> futures awaiting new events
+
+    def start(self, n_workers: int, handler: Callable[[dict], Awaitable[dict]]):
+        """Spawn ``n_workers`` worker tasks on the running loop."""
+        loop = asyncio.get_running_loop()
+        self.workers = [t for t in self.workers if not t.done()]
+        if self.workers:
+            return
+        old, self.q = self.q, asyncio.PriorityQueue(maxsize=self.maxsize)
+        while old is not None and not old.empty():
+            self.q.put_nowait(old.get_nowait())
         for i in range(n_workers):
-            t = threading.Thread(target=self._worker, args=(handler,), daemon=True)
-            t.start(); self.workers.append(t)
+            self.workers.append(loop.create_task(self._worker(handler), name=f"job-worker-{i}"))
+        log.info("Started %d job workers", n_workers)
+
+    async def stop(self):
+        for t in self.workers:
+            t.cancel()
+        await asyncio.gather(*self.workers, return_exceptions=True)
+        self.workers = []
 
     def _put_event(self, job_id: str, typ: str, **data):
         ev = {"event": typ, "data": data, "ts": int(time.time()*1000)}
-        with self.lock:
-            self.events.setdefault(job_id, []).append(ev)
+        self.events.append(job_id, ev)
         log.debug("SSE %s %s", job_id, typ)
+        for fut in self._waiters.pop(job_id, ()):
+            fut.get_loop().call_soon_threadsafe(_wake, fut)
+
+    def emitter(self, job_id: str) -> Callable[[str], None]:
+        """Return an ``emit`` hook that records pipeline events for ``job_id``."""
+        return lambda typ, **data: self._put_event(job_id, typ, **data)
 
     def submit(self, payload: dict, priority: int = 5) -> str:
+        if self.q is None:
+            self.q = asyncio.PriorityQueue(maxsize=self.maxsize)
         job_id = str(uuid.uuid4())
-        payload = dict(payload); payload["job_id"] = job_id
+        payload = dict(payload); payload["job_id"] = job_id; payload["enqueued_at"] = time.time()
         try:
-            self.q.put_nowait((priority, time.time(), payload))
-        except queue.Full:
-            raise RuntimeError("QueueFull")
+            self.q.put_nowait((priority, next(self._seq), payload))
+        except asyncio.QueueFull:
+            raise QueueFull("QueueFull")
+        metrics.jobs_enqueued_total.inc()
         self._put_event(job_id, "queued", priority=priority)
         return job_id
 
-    def _worker(self, handler: Callable[[dict], dict]):
-        while not self.stop:
-            try:
-                prio, ts, payload = self.q.get(timeout=0.25)
-            except queue.Empty:
-                continue
+    async def _worker(self, handler: Callable[[dict], Awaitable[dict]]):
+        while True:
+            prio, seq, payload = await self.q.get()
             job_id = payload["job_id"]
+            metrics.job_wait_ms.observe((time.time() - payload["enqueued_at"]) * 1000)
             self._put_event(job_id, "started")
             try:
-                res = handler(payload)
-                with self.lock:
-                    self.results[job_id] = res
+                res = await handler(payload)
+                self.results.set(job_id, res)
+                metrics.jobs_completed_total.inc()
                 self._put_event(job_id, "done")
+            except asyncio.CancelledError:
+                raise
             except Exception as e:
-                with self.lock:
-                    self.results[job_id] = {"error": str(e)}
+                self.results.set(job_id, {"job_id": job_id, "status": "error", "error": str(e)})
+                metrics.jobs_failed_total.inc()
                 self._put_event(job_id, "error", error=str(e))
             finally:
                 self.q.task_done()
 
+    def depth(self) -> int:
+        return self.q.qsize() if self.q is not None else 0
+
+    cached_depth = depth
+
     def get_events(self, job_id: str):
-        with self.lock:
-            return list(self.events.get(job_id, []))
+        return list(self.events.get(job_id) or [])
+
+    # the API awaits these; in memory they never block
+    async def asubmit(self, payload: dict, priority: int = 5) -> str:
+        return self.submit(payload, priority)
+
+    async def adepth(self) -> int:
+        return self.depth()
+
+    async def aget_events(self, job_id: str) -> list:
+        return self.get_events(job_id)
+
+    async def aget_result(self, job_id: str):
+        return self.get_result(job_id)
 
     def get_result(self, job_id: str):
-        with self.lock:
-            return self.results.get(job_id)
+        return self.results.get(job_id)
+
+    async def wait_events(self, job_id: str, after: int = 0, timeout: Optional[float] = None) -> list:
+        """Return events past index ``after``, waiting up to ``timeout`` seconds for new ones."""
+        evs = self.get_events(job_id)
+        if len(evs) > after:
+            return evs[after:]
+        fut = asyncio.get_running_loop().create_future()
+        self._waiters.setdefault(job_id, set()).add(fut)
+        try:
+            await asyncio.wait_for(fut, timeout)
+        except asyncio.TimeoutError:
+            pass
+        finally:
+            waiters = self._waiters.get(job_id)
+            if waiters is not None:
+                waiters.discard(fut)
+                if not waiters:
+                    self._waiters.pop(job_id, None)
+        return self.get_events(job_id)[after:]
+
+def _wake(fut: asyncio.Future):
+    if not fut.done():
+        fut.set_result(None)
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    job_id      TEXT PRIMARY KEY,
+    priority    INTEGER NOT NULL,
+    status      TEXT NOT NULL,              -- queued|running|done|error
+    payload     TEXT NOT NULL,              -- JSON payload without the file bytes
+    data        BLOB,                       -- file bytes, dropped once the job ends
+    attempts    INTEGER NOT NULL DEFAULT 0,
+    available_at REAL NOT NULL,             -- not claimable before (retry backoff)
+    lease_until REAL,
+    worker      TEXT,
+    result      TEXT,
+    created_at  REAL NOT NULL,
+    updated_at  REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS jobs_claim ON jobs (status, priority, created_at);
+CREATE TABLE IF NOT EXISTS job_events (
+    job_id TEXT NOT NULL,
+    seq    INTEGER NOT NULL,
+    event  TEXT NOT NULL,
+    data   TEXT NOT NULL,
+    ts     INTEGER NOT NULL,
+    PRIMARY KEY (job_id, seq)
+);
+"""
+
+class SQLiteJobQueue:
+    """Durable job queue on a local SQLite database in WAL mode.
+
+    Every uvicorn worker and every standalone ``worker.py`` process opening the
+    same file shares one queue: jobs are claimed with a lease (renewed while the
+    handler runs), re-queued when a lease expires or a handler fails, and
+    dispatched by priority then submission order. Same interface as ``JobQueue``.
+
+    SQLite calls block (up to the 30 s busy timeout while another process holds
+    the write lock), so the event loop only uses the ``a*`` methods, which run
+    them in a thread, and pipeline events from ``emitter`` are queued and
+    written in batches by one writer thread.
+    """
+
+    def __init__(self, path: str, maxsize: int = 100, max_entries: int = 1000, ttl_s: float = 3600.0,
+                 lease_s: float = 300.0, max_attempts: int = 3, poll_s: float = 0.2):
+        self.path = path
+        self.maxsize = maxsize
+        self.max_entries = max_entries
+        self.ttl_s = ttl_s
+        self.lease_s = lease_s
+        self.max_attempts = max(1, max_attempts)
+        self.poll_s = poll_s
+        self.workers: list = []
+        self._kick: Optional[asyncio.Event] = None
+        self._last_purge = 0.0
+        self._cached_depth = 0
+        self._pending: "queue.Queue[tuple]" = queue.Queue()
+        self._writer: Optional[threading.Thread] = None
+        self._writer_lock = threading.Lock()
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        with closing(self._connect()) as db:
+            db.execute("PRAGMA journal_mode=WAL")
+            db.executescript(_SCHEMA)
+
+    def _connect(self) -> sqlite3.Connection:
+        db = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+        db.execute("PRAGMA synchronous=NORMAL")
+        return db
+
+    # ---- events ----
+    @staticmethod
+    def _insert_event(db: sqlite3.Connection, job_id: str, typ: str, data: dict, ts: int):
+        db.execute(
+            "INSERT INTO job_events (job_id, seq, event, data, ts) "
+            "SELECT ?, COALESCE(MAX(seq), 0) + 1, ?, ?, ? FROM job_events WHERE job_id = ?",
+            (job_id, typ, json.dumps(data), ts, job_id),
+        )
+        log.debug("SSE %s %s", job_id, typ)
+
+    def _put_event(self, job_id: str, typ: str, db: Optional[sqlite3.Connection] = None, **data):
+        if db is not None:
+            self._insert_event(db, job_id, typ, data, int(time.time()*1000))
+            return
+        with closing(self._connect()) as db:
+            self._insert_event(db, job_id, typ, data, int(time.time()*1000))
+
+    def emitter(self, job_id: str) -> Callable[[str], None]:
+        """Return an ``emit`` hook that records pipeline events for ``job_id``;
+        it only queues the event for the writer thread, so it never blocks."""
+        def emit(typ: str, **data):
+            self._ensure_writer()
+            self._pending.put((job_id, typ, data, int(time.time()*1000)))
+        return emit
+
+    def _ensure_writer(self):
+        with self._writer_lock:
+            if self._writer is None or not self._writer.is_alive():
+                self._writer = threading.Thread(target=self._write_events, name="job-events-writer", daemon=True)
+                self._writer.start()
+
+    def _write_events(self):
+        while True:
+            batch = [self._pending.get()]
+            while True:
+                try:
+                    batch.append(self._pending.get_nowait())
+                except queue.Empty:
+                    break
+            try:
+                with closing(self._connect()) as db:
+                    db.execute("BEGIN IMMEDIATE")
+                    for ev in batch:
+                        self._insert_event(db, *ev)
+                    db.execute("COMMIT")
+            except Exception:
+                log.exception("Failed to write %d job events", len(batch))
+            finally:
+                for _ in batch:
+                    self._pending.task_done()
+
+    def flush_events(self):
+        """Block until every event queued by ``emitter`` is written."""
+        self._pending.join()
+
+    def get_events(self, job_id: str, after: int = 0):
+        with closing(self._connect()) as db:
+            rows = db.execute(
+                "SELECT event, data, ts FROM job_events WHERE job_id = ? AND seq > ? ORDER BY seq",
+                (job_id, after),
+            ).fetchall()
+        return [{"event": e, "data": json.loads(d), "ts": ts} for e, d, ts in rows]
+
+    async def wait_events(self, job_id: str, after: int = 0, timeout: Optional[float] = None) -> list:
+        """Poll for events past ``after`` (other processes can't notify us directly)."""
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while True:
+            evs = await asyncio.to_thread(self.get_events, job_id, after)
+            if evs or (deadline is not None and time.monotonic() >= deadline):
+                return evs
+            await asyncio.sleep(self.poll_s)
+
+    def get_result(self, job_id: str):
+        with closing(self._connect()) as db:
+            row = db.execute("SELECT result FROM jobs WHERE job_id = ?", (job_id,)).fetchone()
+        return json.loads(row[0]) if row and row[0] is not None else None
+
+    def depth(self) -> int:
+        with closing(self._connect()) as db:
+            self._cached_depth = db.execute("SELECT COUNT(*) FROM jobs WHERE status = 'queued'").fetchone()[0]
+        return self._cached_depth
+
+    def cached_depth(self) -> int:
+        """Queued jobs as of the last query (for the metrics gauge, which must not block)."""
+        return self._cached_depth
+
+    async def asubmit(self, payload: dict, priority: int = 5) -> str:
+        return await asyncio.to_thread(self.submit, payload, priority)
+
+    async def adepth(self) -> int:
+        return await asyncio.to_thread(self.depth)
+
+    async def aget_events(self, job_id: str) -> list:
+        return await asyncio.to_thread(self.get_events, job_id)
+
+    async def aget_result(self, job_id: str):
+        return await asyncio.to_thread(self.get_result, job_id)
+
+    # ---- producer ----
+    def submit(self, payload: dict, priority: int = 5) -> str:
+        job_id = str(uuid.uuid4())
+        payload = dict(payload); payload["job_id"] = job_id
+        data = payload.pop("data", b"")
+        now = time.time()
+        with closing(self._connect()) as db:
+            db.execute("BEGIN IMMEDIATE")
+            try:
+                queued = self._cached_depth = db.execute("SELECT COUNT(*) FROM jobs WHERE status = 'queued'").fetchone()[0]
+                if queued >= self.maxsize:
+                    raise QueueFull("QueueFull")
+                db.execute(
+                    "INSERT INTO jobs (job_id, priority, status, payload, data, available_at, created_at, updated_at) "
+                    "VALUES (?, ?, 'queued', ?, ?, ?, ?, ?)",
+                    (job_id, priority, json.dumps(payload), data, now, now, now),
+                )
+                self._put_event(job_id, "queued", db=db, priority=priority)
+                db.execute("COMMIT")
+            except BaseException:
+                db.execute("ROLLBACK")
+                raise
+        metrics.jobs_enqueued_total.inc()
+        if self._kick is not None:
+            self._kick.set()
+        return job_id
+
+    # ---- consumer ----
+    def _claim(self, worker: str) -> Optional[dict]:
+        """Lease the next runnable job, failing those whose leases ran out too often."""
+        with closing(self._connect()) as db:
+            while True:
+                now = time.time()
+                db.execute("BEGIN IMMEDIATE")
+                try:
+                    row = db.execute(
+                        "SELECT job_id, payload, data, attempts, status, available_at FROM jobs "
+                        "WHERE (status = 'queued' AND available_at <= ?) OR (status = 'running' AND lease_until < ?) "
+                        "ORDER BY priority, created_at LIMIT 1",
+                        (now, now),
+                    ).fetchone()
+                    self._cached_depth = db.execute("SELECT COUNT(*) FROM jobs WHERE status = 'queued'").fetchone()[0]
+                    if row is None:
+                        db.execute("COMMIT")
+                        return None
+                    job_id, payload, data, attempts, status, available_at = row
+                    if status == "running":
+                        self._put_event(job_id, "lease_expired", db=db, attempt=attempts)
+                    if attempts >= self.max_attempts:
+                        self._finish(db, job_id, "error", {"job_id": job_id, "status": "error", "error": "LeaseExpired"})
+                        self._put_event(job_id, "error", db=db, error="LeaseExpired")
+                        db.execute("COMMIT")
+                        continue
+                    db.execute(
+                        "UPDATE jobs SET status = 'running', attempts = attempts + 1, lease_until = ?, worker = ?, "
+                        "updated_at = ? WHERE job_id = ?",
+                        (now + self.lease_s, worker, now, job_id),
+                    )
+                    self._put_event(job_id, "started", db=db, attempt=attempts + 1, worker=worker)
+                    db.execute("COMMIT")
+                except BaseException:
+                    db.execute("ROLLBACK")
+                    raise
+                metrics.job_wait_ms.observe(max(0.0, now - available_at) * 1000)
+                payload = json.loads(payload)
+                payload["data"] = data or b""
+                payload["attempt"] = attempts + 1
+                return payload
+
+    def _finish(self, db: sqlite3.Connection, job_id: str, status: str, result: dict):
+        db.execute(
+            "UPDATE jobs SET status = ?, result = ?, data = NULL, lease_until = NULL, updated_at = ? WHERE job_id = ?",
+            (status, json.dumps(result, ensure_ascii=False), time.time(), job_id),
+        )
+
+    def _complete(self, job_id: str, result: dict):
+        self.flush_events()  # the job's pipeline events come before "done"
+        with closing(self._connect()) as db:
+            db.execute("BEGIN IMMEDIATE")
+            self._finish(db, job_id, "done", result)
+            self._put_event(job_id, "done", db=db)
+            db.execute("COMMIT")
+        metrics.jobs_completed_total.inc()
+
+    def _fail(self, job_id: str, attempt: int, error: str, retryable: bool):
+        self.flush_events()
+        with closing(self._connect()) as db:
+            db.execute("BEGIN IMMEDIATE")
+            if retryable and attempt < self.max_attempts:
+                delay = min(60.0, 2.0 ** attempt)
+                db.execute(
+                    "UPDATE jobs SET status = 'queued', lease_until = NULL, available_at = ?, updated_at = ? "
+                    "WHERE job_id = ?",
+                    (time.time() + delay, time.time(), job_id),
+                )
+                self._put_event(job_id, "retry", db=db, attempt=attempt, error=error, delay_s=delay)
+            else:
+                self._finish(db, job_id, "error", {"job_id": job_id, "status": "error", "error": error})
+                self._put_event(job_id, "error", db=db, error=error)
+                metrics.jobs_failed_total.inc()
+            db.execute("COMMIT")
+
+    def _renew(self, job_id: str, worker: str):
+        with closing(self._connect()) as db:
+            db.execute(
+                "UPDATE jobs SET lease_until = ? WHERE job_id = ? AND worker = ? AND status = 'running'",
+                (time.time() + self.lease_s, job_id, worker),
+            )
+
+    def purge(self):
+        """Drop finished jobs past the TTL or beyond ``max_entries``."""
+        with closing(self._connect()) as db:
+            db.execute("BEGIN IMMEDIATE")
+            db.execute(
+                "DELETE FROM jobs WHERE status IN ('done', 'error') AND "
+                "(updated_at < ? OR job_id IN (SELECT job_id FROM jobs WHERE status IN ('done', 'error') "
+                "ORDER BY updated_at DESC LIMIT -1 OFFSET ?))",
+                (time.time() - self.ttl_s if self.ttl_s > 0 else 0, self.max_entries),
+            )
+            db.execute("DELETE FROM job_events WHERE job_id NOT IN (SELECT job_id FROM jobs)")
+            db.execute("COMMIT")
+
+    def start(self, n_workers: int, handler: Callable[[dict], Awaitable[dict]]):
+        """Spawn ``n_workers`` polling worker tasks on the running loop."""
+        loop = asyncio.get_running_loop()
+        self.workers = [t for t in self.workers if not t.done()]
+        if self.workers:
+            return
+        self._kick = asyncio.Event()
+        for i in range(n_workers):
+            name = f"{socket.gethostname()}:{os.getpid()}:{i}"
+            self.workers.append(loop.create_task(self._worker(handler, name), name=f"job-worker-{i}"))
+        log.info("Started %d job workers on %s", n_workers, self.path)
+
+    async def stop(self):
+        for t in self.workers:
+            t.cancel()
+        await asyncio.gather(*self.workers, return_exceptions=True)
+        self.workers = []
+
+    async def _keep_lease(self, job_id: str, worker: str):
+        while True:
+            await asyncio.sleep(self.lease_s / 3)
+            await asyncio.to_thread(self._renew, job_id, worker)
+
+    async def _worker(self, handler: Callable[[dict], Awaitable[dict]], name: str):
+        while True:
+            if time.time() - self._last_purge > 60:
+                self._last_purge = time.time()
+                await asyncio.to_thread(self.purge)
+            payload = await asyncio.to_thread(self._claim, name)
+            if payload is None:
+                self._kick.clear()
+                try:
+                    await asyncio.wait_for(self._kick.wait(), self.poll_s)
+                except asyncio.TimeoutError:
+                    pass
+                continue
+            job_id = payload["job_id"]
+            lease = asyncio.create_task(self._keep_lease(job_id, name))
+            try:
+                res = await handler(payload)
+                await asyncio.to_thread(self._complete, job_id, res)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                # client errors (e.g. a bad template) won't succeed on retry
+                retryable = int(getattr(e, "code", 500) or 500) >= 500
+                await asyncio.to_thread(self._fail, job_id, payload["attempt"], str(e), retryable)
+            finally:
+                lease.cancel()
+
+def make_queue():
+    if JOB_BACKEND == "sqlite":
+        return SQLiteJobQueue(
+            JOB_DB_PATH,
+            maxsize=JOB_QUEUE_MAXSIZE,
+            max_entries=JOB_RESULT_MAX_ENTRIES,
+            ttl_s=JOB_RESULT_TTL_S,
+            lease_s=JOB_LEASE_S,
+            max_attempts=JOB_MAX_ATTEMPTS,
+            poll_s=JOB_POLL_MS / 1000.0,
+        )
+    return JobQueue(
+        maxsize=JOB_QUEUE_MAXSIZE,
+        max_entries=JOB_RESULT_MAX_ENTRIES,
+        ttl_s=JOB_RESULT_TTL_S,
+    )
 
-global_q = JobQueue(maxsize=int(os.getenv("JOB_QUEUE_MAXSIZE","100")))
+global_q = make_queue()
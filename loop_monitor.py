@@ -0,0 +1,89 @@
+# loop_monitor.py — event loop lag histogram and blocked-loop watchdog
+from __future__ import annotations
+import asyncio, sys, threading, time, traceback
+from typing import Optional
+
+import metrics
+from logger import get_logger
+
+log = get_logger(__name__)
+
+
+class LoopMonitor:
+    """Measures how late a periodic loop callback fires (``event_loop_lag_ms``).
+
+    A watchdog thread checks the ticker's heartbeat: when the loop has not
+    ticked for ``block_threshold_ms`` it logs the loop thread's current stack
+    once per stall, pointing at the code that is blocking it.
+    """
+
+    def __init__(self, interval_ms: float = 100.0, block_threshold_ms: float = 500.0):
+        self.interval = max(0.001, interval_ms / 1000.0)
+        self.threshold = block_threshold_ms / 1000.0
+        self.stalls = 0
+        self._beat = time.monotonic()
+        self._loop_thread: Optional[int] = None
+        self._task: Optional[asyncio.Task] = None
+        self._stop = threading.Event()
+        self._watchdog: Optional[threading.Thread] = None
+
+    async def _tick(self):
+        while True:
+            due = time.monotonic() + self.interval
+            await asyncio.sleep(self.interval)
+            now = time.monotonic()
+            metrics.event_loop_lag_ms.observe(max(0.0, now - due) * 1000.0)
+            self._beat = now
+
+    def _watch(self):
+        reported = None
+        while not self._stop.wait(min(self.interval, self.threshold / 4)):
+            beat = self._beat
+            stalled = time.monotonic() - beat
+            if stalled < self.threshold or reported == beat:
+                continue
+            reported = beat
+            self.stalls += 1
+            metrics.event_loop_blocked_total.inc()
+            frame = sys._current_frames().get(self._loop_thread)
+            stack = "".join(traceback.format_stack(frame)) if frame is not None else "(unavailable)\n"
+            log.warning("Event loop blocked for %d ms; loop thread stack:\n%s", stalled * 1000, stack.rstrip())
+
+    def start(self) -> "LoopMonitor":
+        self._loop_thread = threading.get_ident()
+        self._beat = time.monotonic()
+        self._task = asyncio.get_running_loop().create_task(self._tick(), name="loop-monitor")
+        if self.threshold > 0:
+            self._watchdog = threading.Thread(target=self._watch, name="docflow-loop-watchdog", daemon=True)
+            self._watchdog.start()
+        return self
+
+    async def stop(self):
+        self._stop.set()
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+        if self._watchdog is not None:
+            self._watchdog.join()
+
+
+_monitor: Optional[LoopMonitor] = None
+
+
+def start(interval_ms: float, block_threshold_ms: float) -> Optional[LoopMonitor]:
+    """Start monitoring the running loop (no-op when ``interval_ms`` is 0)."""
+    global _monitor
+    if interval_ms <= 0 or _monitor is not None:
+        return _monitor
+    _monitor = LoopMonitor(interval_ms, block_threshold_ms).start()
+    return _monitor
+
+
+async def stop():
+    global _monitor
+    mon, _monitor = _monitor, None
+    if mon is not None:
+        await mon.stop()
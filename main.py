@@ -2,8 +2,9 @@
 # FastAPI app with full pipeline and locations integration
 from __future__ import annotations
 
-import os, time, json, re, uuid, mimetypes, asyncio
-from typing import List, Dict, Any, Optional, Callable
+import os, io, time, json, re, uuid, asyncio, zipfile, copy, hashlib, heapq, functools
+from typing import List, Dict, Any, Optional, Callable, Literal
+from collections import Counter
 
 from fastapi import FastAPI, UploadFile, File, Form, Depends, Response, HTTPException, Header
 from fastapi.responses import JSONResponse, StreamingResponse
@@ -12,14 +13,28 @@ from prometheus_client import generate_latest, CONTENT_TYPE_LATEST
 
 from config import *
 from logger import setup_logging, get_logger
-import indexer, retriever, align, reports
+import indexer, retriever, align, reports, metrics, executors, tracing, warmup, loop_monitor, admission
 from parse import (
+    count_pages,
+    markdown_has_table,
+    extract_pdf_tables,
+    find_table_regions,
+    render_regions,
+    merge_region_ocr,
+    pdf_page_window,
+    shift_pages,
+    plan_stages,
     convert_markdown_async,
-    extract_words_with_bboxes_pdf,
+    extract_pdf_tokens,
     parse_with_ocr_async,
     build_markdown_from_ocr,
 )
 from llm import extract_fields_async
+from services.bbox_mapper import map_bboxes_to_fields
+from services.spatial import extract_by_labels
+from services.typed_fields import TypedField, scan as scan_patterns
+from services.layout_cache import LayoutCache, fingerprint
+from token_table import TokenTable
 import jobs
 
 # integration hook (added)
@@ -28,9 +43,9 @@ try:
 except Exception:
     attach_locations_to_response = None  # type: ignore
 
-# keep import side-effects for clients pkg (if any)
+# keep import side-effects for clients pkg (if any); the client modules themselves load lazily
 import clients as clients_pkg  # noqa: F401
-from clients import *  # noqa: F401,F403
+from clients import get_mock_counters, reset_mock_counters  # noqa: F401
 
 setup_logging()
 log = get_logger(__name__)
@@ -49,29 +64,42 @@ app = FastAPI(
 
 @app.on_event("startup")
 async def _warmup_backends() -> None:
-    """Preload heavy backends so the first request doesn't time out."""
-    try:
-        from clients.doctr_client import _get_doctr
-        _get_doctr()
-        from clients.embeddings_local import get_local_embedder
-        get_local_embedder()
-        log.info("Warmup finished: DocTR and GGUF embedder loaded")
-    except Exception as e:  # pragma: no cover - defensive
-        log.exception("Warmup failure: %s", e)
+    """Preload heavy backends in the background so startup isn't blocked; see ``/ready``."""
+    warmup.mark("startup")
+    warmup.start(WARMUP_BACKENDS)
+    loop_monitor.start(LOOP_LAG_INTERVAL_MS, LOOP_BLOCK_THRESHOLD_MS)
+
+
+@app.on_event("shutdown")
+async def _stop_warmup() -> None:
+    await loop_monitor.stop()
+    await warmup.stop()
 
 # ---------------- Job Queue Setup ----------------
-def _job_worker(payload: dict) -> dict:
+async def _job_worker(payload: dict) -> dict:
     """Background worker for the /jobs endpoints."""
-    return asyncio.run(
-        _process_request(
-            payload.get("data", b""),
-            payload.get("filename", "input.bin"),
-            payload.get("tpl", {}),
-            payload.get("job_id", str(uuid.uuid4())),
-        )
+    job_id = payload.get("job_id", str(uuid.uuid4()))
+    return await _process_coalesced(
+        "/jobs",
+        admission_ctl.admit("/jobs", None, int(payload.get("pages", 1)), enforce=False),
+        payload.get("data", b""),
+        payload.get("filename", "input.bin"),
+        payload.get("tpl", {}),
+        job_id,
+        emit=jobs.global_q.emitter(job_id),
+        n_pages=payload.get("pages"),
     )
 
-jobs.global_q.start(int(os.getenv("JOB_WORKERS", "1")), _job_worker)
+
+@app.on_event("startup")
+async def _start_job_workers() -> None:
+    jobs.global_q.start(JOB_WORKERS, _job_worker)
+    metrics.job_queue_depth.set_function(jobs.global_q.cached_depth)
+
+
+@app.on_event("shutdown")
+async def _stop_job_workers() -> None:
+    await jobs.global_q.stop()
 
 # ---------------- Security ----------------
 def get_api_key(x_api_key: Optional[str] = Header(None)):
@@ -81,10 +109,24 @@ def get_api_key(x_api_key: Optional[str] = Header(None)):
     return True
 
 # ---------------- Models ----------------
+class LabelRule(BaseModel):
+    """Printed label(s) a field's value sits next to, read without the LLM."""
+    labels: List[str]
+    direction: Literal["right", "below", "auto"] = "auto"
+    max_words: int = Field(default=6, ge=1)
+
+class FieldExtractor(BaseModel):
+    """Typed value (validated) or regex a field is matched with before the LLM."""
+    type: Literal["regex", "iban", "vat", "date", "amount"] = "regex"
+    pattern: Optional[str] = None
+    near: List[str] = Field(default_factory=list)
+
 class Template(BaseModel):
     name: str = Field(default="default")
     fields: List[str]
     llm_text: str
+    labels: Dict[str, LabelRule] = Field(default_factory=dict)
+    extractors: Dict[str, FieldExtractor] = Field(default_factory=dict)
 
 class AppError(Exception):
     def __init__(self, code: int, kind: str, msg: str):
@@ -94,157 +136,293 @@ class AppError(Exception):
 async def app_error_handler(_, exc: AppError):
     return JSONResponse({"error": exc.kind, "message": exc.msg}, status_code=exc.code)
 
+@app.exception_handler(admission.Overloaded)
+async def overloaded_handler(_, exc: admission.Overloaded):
+    return JSONResponse({"error": "Overloaded", "reason": exc.reason, "message": exc.msg},
+                        status_code=429, headers={"Retry-After": str(exc.retry_after)})
+
+# in-flight caps and latency SLO for /extract, /process-document and /jobs
+admission_ctl = admission.AdmissionController(ADMISSION_MAX_DOCS, ADMISSION_MAX_PAGES, LATENCY_SLO_MS, ADMISSION_WINDOW_S)
+# field positions learned on earlier documents of the same layout
+layout_cache = LayoutCache(LAYOUT_CACHE_SIZE, LAYOUT_MATCH_MIN)
+# per template and field, share of documents answered without the LLM
+field_tally = metrics.FieldTally()
+
 def jlog(event: str, **k):
     rec = {"evt": event, "ts": int(time.time() * 1000), **k}
     log.info(json.dumps(rec))
 
 # ---------------- Core processing ----------------
-async def _process_request(
+class PreparedTemplate:
+    """Template validated once and reused for every document that uses it.
+
+    Batch runs share one instance, so parsing and the per-field RAG query
+    embeddings are paid once per batch instead of once per file.
+    """
+
+    def __init__(self, tpl_json: dict):
+        try:
+            self.schema = Template(**tpl_json)
+        except (ValidationError, TypeError) as e:
+            raise AppError(400, "BadTemplate", f"Invalid template: {str(e)}")
+        self.anchors = [str(f).lower() for f in self.schema.fields]
+        for what in ("labels", "extractors"):
+            unknown = set(getattr(self.schema, what)) - set(self.schema.fields)
+            if unknown:
+                raise AppError(400, "BadTemplate", f"Invalid template: {what} for unknown fields {sorted(unknown)}")
+        self.label_rules = {f: r.model_dump() for f, r in self.schema.labels.items()}
+        try:
+            self.typed = {f: TypedField(e.type, e.pattern, e.near) for f, e in self.schema.extractors.items()}
+        except (ValueError, re.error) as e:
+            raise AppError(400, "BadTemplate", f"Invalid template: {e}")
+        self.layout_key = (self.schema.name, tuple(self.schema.fields))
+        self._field_vecs: Optional[Dict[str, Any]] = None
+
+    def field_vecs(self) -> Dict[str, Any]:
+        """Query embeddings of the field names, computed on first RAG use."""
+        if self._field_vecs is None:
+            fields = list(self.schema.fields)
+            self._field_vecs = dict(zip(fields, retriever.embed_texts(fields)))
+        return self._field_vecs
+
+
+async def _preflight(
     data: bytes,
     filename: str,
-    tpl_json: dict,
     req_id: str,
     emit: Callable[[str], None] | None = None,
-) -> dict:  # noqa: C901
-    log.info("Starting _process_request for %s", filename)
-    try:
-        schema = Template(**tpl_json)
-    except (ValidationError, TypeError) as e:
-        raise AppError(400, "BadTemplate", f"Invalid template: {str(e)}")
+    timings: metrics.StageTimings | None = None,
+) -> Dict[str, Any]:
+    """Parsing stage: markdown conversion, PDF text layer and OCR.
 
-    field_details: Dict[str, Any] = {}
-    manifest = {
-        "request_id": req_id,
-        "file": filename,
-        "template": schema.name,
-        "policy": {
-            "ocr_policy": os.getenv("OCR_POLICY", "auto"),
-        },
-    }
-    artifacts: Dict[str, str] = {}
-
-    if emit:
-        emit("markdown_start")
-    t_markdown0 = time.time()
-    log.info("Converting document to markdown")
-    markdown = await convert_markdown_async(data, filename)
-    t_markdown = time.time() - t_markdown0
-    log.info("Markdown conversion completed in %.3fs", t_markdown)
-
-    mime = mimetypes.guess_type(filename)[0] or "application/octet-stream"
-    is_pdf = (mime == "application/pdf") or (data[:4] == b"%PDF")
-    log.info("Extracting words with bboxes from PDF: %s", is_pdf)
-    pages_words = extract_words_with_bboxes_pdf(data) if is_pdf else []
-    log.info("PDF extraction produced %d pages", len(pages_words))
-
-    total_chars = 0
-    for p in pages_words:
-        for w in p.get("words", []):
-            t = w.get("text", "") or ""
-            total_chars += len(t)
-    thr = int(os.getenv("TEXT_LAYER_MIN_CHARS", "1"))
-    is_digital_text = bool(pages_words and total_chars >= thr)
-    log.info("Detected digital text=%s (chars=%d, threshold=%d)", is_digital_text, total_chars, thr)
-
-    tokens = []
-    if is_digital_text:
-        for p in pages_words:
-            pw, ph = float(p.get("page_w", 1.0)), float(p.get("page_h", 1.0))
-            for w in p.get("words", []):
-                x0, y0, x1, y1 = w.get("bbox", [0, 0, 0, 0])
-                tokens.append(
-                    {
-                        "text": w.get("text", ""),
-                        "page": p.get("page", 1),
-                        "bbox": [x0 / pw, y0 / ph, x1 / pw, y1 / ph],
-                        "line_id": None,
-                    }
-                )
-    log.info("Generated %d tokens from digital text", len(tokens))
+    Stages are planned up front from the media type and ``OCR_POLICY``
+    (``parse.plan_stages``); independent ones run concurrently and those whose
+    output would be discarded are skipped.
+    """
+    timings = timings or metrics.StageTimings()
+    OCR_POLICY = os.getenv("OCR_POLICY", "auto")
+    plan = plan_stages(data, filename, OCR_POLICY)
+    log.info("Preflight plan for %s: %s", filename, plan)
+    is_pdf = plan["kind"] == "pdf"
 
-    # simple heuristic for OCR
-    def markdown_has_table(md: str) -> bool:
-        lines = md.splitlines()
-        for i in range(len(lines) - 1):
-            if "|" in lines[i] and re.search(r"\|", lines[i]) and re.search(r"^\s*[:\-\| ]+$", lines[i + 1]):
-                return True
-        return False
+    async def _markdown():
+        if emit:
+            emit("markdown_start")
+        t0 = time.time()
+        log.info("Converting document to markdown")
+        with timings.stage("markdown"):
+            md = await convert_markdown_async(data, filename)
+        log.info("Markdown conversion completed in %.3fs", time.time() - t0)
+        return md
 
-    OCR_POLICY = os.getenv("OCR_POLICY", "auto")
-    ocr_should_run_global = OCR_POLICY == "always" or (OCR_POLICY in ("auto", "auto_pages") and markdown_has_table(markdown))
-    need_ocr_for_content = (not is_pdf) or (not is_digital_text)
+    async def _words():
+        log.info("Extracting words with bboxes from PDF")
+        with timings.stage("words"):
+            return await executors.run("pdf", extract_pdf_tokens, data)
 
-    pages_blocks: List[Dict[str, Any]] = []
-    t_ocr = 0.0
-    if (ocr_should_run_global or need_ocr_for_content) and OCR_POLICY != "auto_pages":
+    async def _ocr():
         if emit:
             emit("ocr_start")
         log.info("Calling OCR analysis")
-        t_ocr0 = time.time()
-        pages_blocks = await parse_with_ocr_async(data, filename, pages=None)
-        t_ocr = time.time() - t_ocr0
-        log.info("OCR returned %d pages in %.3fs", len(pages_blocks), t_ocr)
+        t0 = time.time()
+        with timings.stage("ocr"):
+            blocks = await parse_with_ocr_async(data, filename, pages=None)
+        t_ocr = time.time() - t0
+        log.info("OCR returned %d pages in %.3fs", len(blocks), t_ocr)
+        for _ in blocks:
+            metrics.observe_page_latency("ocr", int(t_ocr * 1000 / len(blocks)), timings.template)
         jlog(
             "ocr_done",
             id=req_id,
-            pages=len(pages_blocks),
-            total_blocks=sum(len(pg.get("blocks", [])) for pg in pages_blocks),
+            pages=len(blocks),
+            total_blocks=sum(len(pg.get("blocks", [])) for pg in blocks),
         )
+        return blocks
+
+    async def _ocr_regions(regions, text_tokens):
+        if emit:
+            emit("ocr_start")
+        with timings.stage("ocr"):
+            crops = await executors.run("pdf", render_regions, data, regions, int(os.getenv("OCR_TABLE_DPI", "200")))
+            results = await asyncio.gather(*(parse_with_ocr_async(c["png"], c["name"]) for c in crops))
+        log.info("OCR of %d table regions on pages %s", len(crops), sorted(regions))
+        jlog("ocr_done", id=req_id, pages=len(regions), regions=len(crops),
+             total_blocks=sum(len(pg.get("blocks", [])) for res in results for pg in res))
+        return await executors.run("pdf", merge_region_ocr, text_tokens, crops, results)
+
+    thr = int(os.getenv("TEXT_LAYER_MIN_CHARS", "1"))
+    no_tables = {"pages_blocks": [], "cells": [], "markdown": None}
+
+    async def _words_and_tables():
+        # the table finder only runs on a usable text layer (scans go to OCR anyway)
+        tokens = await _words()
+        if os.getenv("PDF_TABLES", "1") != "1" or not len(tokens) or tokens.n_chars < thr:
+            return tokens, no_tables
+        with timings.stage("tables"):
+            return tokens, await executors.run("pdf", extract_pdf_tables, data, int(os.getenv("PDF_TABLES_MAX_PAGES", "50")))
+
+    markdown = ""
+    tokens = TokenTable.empty()
+    pages_blocks: List[Dict[str, Any]] = []
+    native = no_tables
+    if is_pdf:
+        markdown, (tokens, native) = await asyncio.gather(_markdown(), _words_and_tables())
+        log.info("PDF extraction produced %d words", len(tokens))
+    else:
+        stages = []
+        if plan["markdown"] == "run":
+            stages.append(_markdown())
+        if plan["ocr"] == "run":
+            stages.append(_ocr())
+        outs = await asyncio.gather(*stages)
+        if plan["markdown"] == "run":
+            markdown = outs.pop(0)
+        if plan["ocr"] == "run":
+            pages_blocks = outs.pop(0)
+        if plan["markdown"] == "fallback" and not pages_blocks:
+            markdown = await _markdown()
+
+    is_digital_text = bool(len(tokens) and tokens.n_chars >= thr)
+    log.info("Detected digital text=%s (chars=%d, threshold=%d)", is_digital_text, tokens.n_chars, thr)
+
+    if not is_digital_text:
+        tokens = TokenTable.empty()
+    log.info("Generated %d tokens from digital text", len(tokens))
+
+    table_cells: List[Dict[str, Any]] = []
+    if is_digital_text and native["pages_blocks"]:
+        # tables read from the text layer: markdown tables for chunking, cells for locations
+        markdown, pages_blocks, table_cells = native["markdown"], native["pages_blocks"], native["cells"]
+        plan["tables"] = {"source": "text_layer", "count": sum(len(p["blocks"]) for p in pages_blocks)}
+        log.info("Found %d tables in the text layer", plan["tables"]["count"])
+
+    if plan["ocr"] == "decide":
+        table_triggered = OCR_POLICY == "auto" and markdown_has_table(markdown)
+        if OCR_POLICY == "always" or not is_digital_text:
+            pages_blocks, table_cells = await _ocr(), []
+        elif table_triggered and not table_cells:
+            # digital text layer: OCR only the pages/areas holding tables, keep the text layer elsewhere
+            regions = {}
+            if os.getenv("OCR_TABLE_REGIONS", "1") == "1":
+                regions = await executors.run("pdf", find_table_regions, data)
+            if regions:
+                pages_blocks, tokens = await _ocr_regions(regions, tokens)
+                plan["ocr_scope"] = {"pages": sorted(regions), "regions": sum(len(r) for r in regions.values())}
+            else:
+                pages_blocks = await _ocr()
 
     if not is_digital_text and pages_blocks:
         markdown = build_markdown_from_ocr(pages_blocks)
         log.info("Markdown rebuilt from OCR output")
 
+    return {
+        "plan": plan,
+        "markdown": markdown,
+        "tokens": tokens,
+        "pages_blocks": pages_blocks,
+        "table_cells": table_cells,
+        "timings": timings,
+        "trace": tracing.current.get(),
+    }
+
+
+async def _extract(
+    data: bytes,
+    filename: str,
+    prepared: PreparedTemplate,
+    req_id: str,
+    pre: Dict[str, Any],
+    profiler: tracing.SamplingProfiler | None = None,
+) -> dict:  # noqa: C901
+    """Extraction stage: chunking, LLM calls, alignment and report persistence."""
+    schema = prepared.schema
+    markdown, tokens, pages_blocks = pre["markdown"], pre["tokens"], pre["pages_blocks"]
+    timings: metrics.StageTimings = pre["timings"]
+    field_details: Dict[str, Any] = {}
+    manifest = {
+        "request_id": req_id,
+        "file": filename,
+        "template": schema.name,
+        "policy": {
+            "ocr_policy": os.getenv("OCR_POLICY", "auto"),
+        },
+    }
+    artifacts: Dict[str, str] = {}
+
     log.info("Splitting markdown into chunks")
-    chunks = indexer.split_markdown_into_chunks(markdown)
-    md_tokens_est = indexer.approximate_tokens(markdown)
+    with timings.stage("chunking"):
+        chunks = indexer.split_markdown_into_chunks(markdown)
+        md_tokens_est = indexer.approximate_tokens(markdown)
     log.info("Markdown split into %d chunks (est %d tokens)", len(chunks), md_tokens_est)
     overhead = int(os.getenv("RAG_CTX_MARGIN_TOKENS", "256")) + 256
     LLM_N_CTX = int(os.getenv("LLM_N_CTX", "4096"))
     c_eff = max(1, LLM_N_CTX - overhead)
     use_single_pass = (md_tokens_est <= c_eff) and (len(chunks) < int(os.getenv("RAG_MIN_SEGMENTS", "12")))
 
+    manifest["plan"] = pre["plan"]
     manifest["llm_context_mode"] = "single_pass" if use_single_pass else "rag_field_wise"
     manifest["md_token_estimate"] = md_tokens_est
     manifest["c_eff"] = c_eff
 
     log.info("LLM context mode: %s", manifest["llm_context_mode"])
 
-    artifacts_dir = os.path.join(os.getenv("REPORTS_DIR", "reports"), req_id)
-    os.makedirs(artifacts_dir, exist_ok=True)
-    with open(os.path.join(artifacts_dir, "md.txt"), "w", encoding="utf-8") as f:
-        f.write(markdown)
-
-    tok_path = os.path.join(artifacts_dir, "tokens.jsonl")
-    with open(tok_path, "w", encoding="utf-8") as f:
-        for tkn in tokens:
-            f.write(json.dumps(tkn, ensure_ascii=False) + "\n")
-    artifacts["tokens.jsonl"] = tok_path
+    artifacts_dir = os.path.join(REPORTS_DIR, req_id)
+    with timings.stage("persistence"):
+        artifacts.update(await executors.run("io", _write_parse_artifacts, artifacts_dir, markdown, tokens, pages_blocks))
 
-    if pages_blocks:
-        tbl_path = os.path.join(artifacts_dir, "tables.json")
-        with open(tbl_path, "w", encoding="utf-8") as f:
-            json.dump(pages_blocks, f, ensure_ascii=False, indent=2)
-        artifacts["tables.json"] = tbl_path
+    # before the LLM: template extractors (one validated match), the positions learned on
+    # earlier documents of a known layout, template labels; the LLM gets the rest
+    sources: Dict[str, str] = {}
+    resolved: Dict[str, Dict[str, Any]] = {}
+    if prepared.typed:
+        with timings.stage("patterns"):
+            hits = await executors.run("align", _pattern_hits, markdown, tokens, prepared.typed)
+        # several valid values (two IBANs, many amounts) are left to the LLM
+        resolved = {f: r for f, (values, r) in hits.items() if len(values) == 1}
+        sources.update(dict.fromkeys(resolved, "pattern"))
+    fp, layout_key = set(), None
+    if layout_cache.max_entries and len(tokens):
+        with timings.stage("layout"):
+            fp = await executors.run("align", fingerprint, tokens)
+            layout_key, score = await executors.run("align", layout_cache.match, prepared.layout_key, fp)
+            if layout_key:
+                cached = await executors.run("align", layout_cache.read, layout_key, tokens, score)
+                cached = {f: r for f, r in cached.items() if f not in resolved}
+                resolved.update(cached)
+                sources.update(dict.fromkeys(cached, "layout"))
+        manifest["layout"] = {"match": round(score, 4), "hit": layout_key is not None}
+    rules = {f: r for f, r in prepared.label_rules.items() if f not in resolved}
+    if rules and len(tokens):
+        with timings.stage("labels"):
+            labelled = await executors.run("align", _resolve_labels, tokens, rules)
+        resolved.update(labelled)
+        sources.update(dict.fromkeys(labelled, "label"))
+    # LAYOUT_VERIFY: layout values are only kept where the LLM gives the same one
+    to_verify = {f: resolved.pop(f) for f in list(resolved) if sources[f] == "layout"} if LAYOUT_VERIFY else {}
+    llm_fields = [f for f in schema.fields if f not in resolved]
 
-    results: List[Dict[str, Any]] = []
-    if use_single_pass:
+    results: List[Dict[str, Any]] = [resolved[f] for f in schema.fields if f in resolved]
+    if not llm_fields:
+        log.info("All %d fields resolved without the LLM (%s)", len(resolved), dict(Counter(sources.values())))
+    elif use_single_pass:
         t_llm0 = time.time()
-        log.info("Calling LLM for all fields in single pass")
-        fields_out = await extract_fields_async([f for f in schema.fields], schema.llm_text, markdown)
+        log.info("Calling LLM for %d fields in single pass", len(llm_fields))
+        with timings.stage("llm"):
+            fields_out = await extract_fields_async(llm_fields, schema.llm_text, markdown, timings=timings)
         t_llm = int((time.time() - t_llm0) * 1000)
         log.info("LLM single pass completed in %d ms", t_llm)
         jlog("llm_single_pass_done", id=req_id, ms=t_llm)
 
         global_chunk_tokens = tokens
-        for key in schema.fields:
+        for key in llm_fields:
             item = fields_out.get(key, {}) or {}
             val = (item.get("value") or "")
             llm_conf = float(item.get("confidence") or 0.0)
             # simple alignment (no-op if tokens empty)
-            tok_idx, coverage = align.align_value_to_tokens(val, global_chunk_tokens)
-            bboxes = [global_chunk_tokens[i]["bbox"] for i in tok_idx]
-            pages = [global_chunk_tokens[i]["page"] for i in tok_idx]
+            with timings.stage("alignment"):
+                tok_idx, coverage = await executors.run("align", align.align_value_to_tokens, val, global_chunk_tokens)
+            bboxes = global_chunk_tokens.bbox[tok_idx].tolist()
+            pages = global_chunk_tokens.page[tok_idx].tolist()
             confidence = max(0.0, min(1.0, 0.7 * coverage + 0.3 * llm_conf))
             results.append(
                 {
@@ -257,25 +435,29 @@ async def _process_request(
             )
     else:
         # field-wise RAG
-        anchors = [str(f).lower() for f in schema.fields]
         log.info("Creating RAG index")
-        idx = retriever.EphemeralIndex(chunks, anchors=anchors)
+        with timings.stage("embedding"):
+            idx = await executors.run("embeddings", retriever.EphemeralIndex, chunks, prepared.anchors)
+            field_vecs = await executors.run("embeddings", prepared.field_vecs)
         global_chunk_tokens = tokens
-        for key in schema.fields:
+        for key in llm_fields:
             log.info("Searching index for field %s", key)
-            hits = idx.search(key, topk=int(os.getenv("RAG_TOPK", "6")))
+            with timings.stage("retrieval"):
+                hits = idx.search(key, topk=int(os.getenv("RAG_TOPK", "6")), query_vec=field_vecs.get(key))
             ctx = "\n\n".join(chunks[h[0]]["text"] for h in hits)
             t_llm0 = time.time()
             log.info("Calling LLM for field %s", key)
-            fields_out = await extract_fields_async([key], schema.llm_text, ctx)
+            with timings.stage("llm"):
+                fields_out = await extract_fields_async([key], schema.llm_text, ctx, timings=timings)
             t_llm = int((time.time() - t_llm0) * 1000)
             log.info("LLM returned for field %s in %d ms", key, t_llm)
             item = fields_out.get(key, {}) or {}
             val = (item.get("value") or "")
             llm_conf = float(item.get("confidence") or 0.0)
-            tok_idx, coverage = align.align_value_to_tokens(val, global_chunk_tokens)
-            bboxes = [global_chunk_tokens[i]["bbox"] for i in tok_idx]
-            pages = [global_chunk_tokens[i]["page"] for i in tok_idx]
+            with timings.stage("alignment"):
+                tok_idx, coverage = await executors.run("align", align.align_value_to_tokens, val, global_chunk_tokens)
+            bboxes = global_chunk_tokens.bbox[tok_idx].tolist()
+            pages = global_chunk_tokens.page[tok_idx].tolist()
             confidence = max(0.0, min(1.0, 0.7 * coverage + 0.3 * llm_conf))
             results.append(
                 {
@@ -287,6 +469,72 @@ async def _process_request(
                 }
             )
 
+    forget = []
+    for i, r in enumerate(results):
+        cached = to_verify.get(r["key"])
+        if cached is None:
+            continue
+        if _norm_value(cached["value"]) == _norm_value(r["value"]):
+            results[i] = {**cached, "confidence": max(cached["confidence"], r["confidence"])}
+            metrics.layout_cache_verifications_total.labels(outcome="agree").inc()
+        else:
+            forget.append(r["key"])
+            sources.pop(r["key"])
+            metrics.layout_cache_verifications_total.labels(outcome="disagree").inc()
+    if fp:
+        await executors.run("align", layout_cache.learn, prepared.layout_key, fp, layout_key,
+                            [r for r in results if sources.get(r["key"]) != "layout"], LAYOUT_LEARN_MIN_CONFIDENCE, tuple(forget))
+    results.sort(key=lambda r: schema.fields.index(r["key"]))
+    manifest["field_sources"] = {f: sources.get(f, "llm") for f in schema.fields}
+    manifest["bypass_rates"] = field_tally.record(schema.name, manifest["field_sources"])
+    response, input_path = await _assemble_response(data, filename, schema.name, req_id, markdown, results, timings)
+
+    # Enrich fields with locations[] (bbox+page_index) via PPStructureLight
+    if attach_locations_to_response is not None:
+        try:
+            with timings.stage("locations"):
+                cells = pre.get("table_cells") or None
+                response = await executors.run("pdf" if cells else "ocr", attach_locations_to_response, input_path, response, cells)
+        except Exception as _e:
+            jlog("locations_attach_error", id=req_id, error=str(_e))
+
+    # Save response bundle
+    with timings.stage("persistence"):
+        manifest.update({"timings_ms": dict(timings.ms)})
+        await executors.run("io", _save_bundle, req_id, artifacts_dir, response, manifest, pre.get("trace"), profiler)
+    return response
+
+
+def _norm_value(v: Any) -> str:
+    return re.sub(r"\s+", "", str(v or "")).lower()
+
+
+def _pattern_hits(markdown: str, tokens: TokenTable, typed: Dict[str, TypedField]) -> Dict[str, tuple]:
+    """Per field matched by a template extractor: its distinct valid values and the result for the first."""
+    out = {}
+    for key, hit in scan_patterns(markdown, typed).items():
+        tok_idx, coverage = align.align_value_to_tokens(hit["text"], tokens)
+        out[key] = (hit["values"], {"key": key, "value": hit["value"], "confidence": round(0.7 * coverage + 0.3, 4),
+                                    "bboxes": tokens.bbox[tok_idx].tolist(), "bbox_pages": tokens.page[tok_idx].tolist()})
+    return out
+
+
+def _resolve_labels(tokens: TokenTable, rules: Dict[str, dict], min_conf: Optional[float] = None) -> Dict[str, Dict[str, Any]]:
+    """Field results read next to their labels, kept when at least ``LABEL_MIN_CONFIDENCE``."""
+    if min_conf is None:
+        min_conf = float(os.getenv("LABEL_MIN_CONFIDENCE", "0.8"))
+    out = {}
+    for key, hit in extract_by_labels(tokens, rules).items():
+        if hit["confidence"] >= min_conf:
+            idx = hit["tokens"]
+            out[key] = {"key": key, "value": hit["value"], "confidence": hit["confidence"],
+                        "bboxes": tokens.bbox[idx].tolist(), "bbox_pages": tokens.page[idx].tolist()}
+    return out
+
+
+async def _assemble_response(data: bytes, filename: str, template: str, req_id: str, markdown: str,
+                             results: List[Dict[str, Any]], timings: metrics.StageTimings) -> tuple:
+    """Debug overlays, the stored input and the response for per-field ``results``."""
     # Optional debug overlays
     debug_files = []
     if os.getenv("DEBUG_OVERLAY", "0") in ("1", "true", "yes"):
@@ -300,7 +548,10 @@ async def _process_request(
         out_dir = os.path.join(os.getenv("DEBUG_DIR", "debug"), req_id)
         try:
             import overlay as _overlay
-            debug_files = _overlay.save_overlays(data, matches_per_page, out_dir, filename or "input.bin")
+            with timings.stage("overlays"):
+                debug_files = await executors.run(
+                    "overlay", _overlay.save_overlays, data, matches_per_page, out_dir, filename or "input.bin"
+                )
             log.info("Saved %d overlay debug files", len(debug_files))
         except Exception as _e:
             jlog("overlay_error", id=req_id, error=str(_e))
@@ -311,45 +562,430 @@ async def _process_request(
         fields_map[r["key"]] = {"value": r.get("value"), "confidence": r.get("confidence", 0.0)}
 
     # Persist input for PP integration
-    artifacts_dir = os.path.join(os.getenv("REPORTS_DIR", "reports"), req_id)
-    os.makedirs(artifacts_dir, exist_ok=True)
+    artifacts_dir = os.path.join(REPORTS_DIR, req_id)
     input_path = os.path.join(artifacts_dir, filename or "input.bin")
     try:
-        with open(input_path, "wb") as f:
-            f.write(data)
+        with timings.stage("persistence"):
+            await executors.run("io", _write_bytes, input_path, data)
     except Exception as _e:
         jlog("input_save_error", id=req_id, error=str(_e))
 
     response = {
         "request_id": req_id,
-        "template": schema.name,
+        "template": template,
         "text": markdown,
         "fields": fields_map,
         "debug_overlays": debug_files,
         "status": "done",
     }
+    return response, input_path
 
-    # Enrich fields with locations[] (bbox+page_index) via PPStructureLight
-    if attach_locations_to_response is not None:
-        try:
-            response = attach_locations_to_response(input_path, response)
-        except Exception as _e:
-            jlog("locations_attach_error", id=req_id, error=str(_e))
 
-    manifest.update({"timings_ms": {"markdown": int(t_markdown * 1000)}})
+def _emit_window(emit: Callable[[str], None], pages: List[int], typ: str, **data) -> None:
+    """``emit`` for one window's preflight: its events carry the window's page range."""
+    emit(typ, pages=pages, **data)
 
-    # Save response bundle
-    rdir = artifacts_dir
+
+async def _extract_streaming(
+    data: bytes,
+    filename: str,
+    prepared: PreparedTemplate,
+    req_id: str,
+    n_pages: int,
+    emit: Callable[[str], None] | None = None,
+    timings: metrics.StageTimings | None = None,
+    profiler: tracing.SamplingProfiler | None = None,
+) -> dict:
+    """``_preflight`` + ``_extract`` for long PDFs, ``STREAM_WINDOW_PAGES`` pages at a time.
+
+    Each window is parsed on its own (same text layer / tables / OCR decisions),
+    appended to the report artifacts, chunked and searched for every field.
+    Only the best ``RAG_TOPK`` chunks per field survive a window, and tokens and
+    table cells are read back from disk for the windows a field's context came
+    from, so memory follows the window size rather than the page count.
+    """
+    schema = prepared.schema
+    timings = timings or metrics.StageTimings(schema.name)
+    window = max(1, STREAM_WINDOW_PAGES)
+    topk = int(os.getenv("RAG_TOPK", "6"))
+    artifacts_dir = os.path.join(REPORTS_DIR, req_id)
+    sink = await executors.run("io", _WindowArtifacts, artifacts_dir)
+    with timings.stage("embedding"):
+        field_vecs = await executors.run("embeddings", prepared.field_vecs)
+    # per field, a min-heap of (score, seq, chunk text, window)
+    best: Dict[str, List[tuple]] = {key: [] for key in schema.fields}
+    # per labelled field, value -> (confidence, bboxes, pages) of its best window
+    labelled: Dict[str, Dict[str, tuple]] = {key: {} for key in prepared.label_rules}
+    # per field with an extractor, value -> result of its first match (None until one is located)
+    matched: Dict[str, Dict[str, Any]] = {key: {} for key in prepared.typed}
+    windows: List[Dict[str, Any]] = []
+    md_tokens_est = seq = 0
+    try:
+        for w, start in enumerate(range(0, n_pages, window)):
+            end = min(n_pages, start + window)
+            with tracing.span(f"window:{start + 1}-{end}"):
+                part = await executors.run("pdf", pdf_page_window, data, start, end)
+                win_emit = functools.partial(_emit_window, emit, [start + 1, end]) if emit else None
+                pre = await _preflight(part, filename, req_id, win_emit, timings)
+                del part
+                shift_pages(pre["tokens"], pre["pages_blocks"], pre["table_cells"], start)
+                with timings.stage("persistence"):
+                    await executors.run("io", sink.append, pre["markdown"], pre["tokens"], pre["pages_blocks"], pre["table_cells"])
+                if matched:
+                    with timings.stage("patterns"):
+                        hits = await executors.run("align", _pattern_hits, pre["markdown"], pre["tokens"], prepared.typed)
+                    for key, (values, result) in hits.items():
+                        for v in values:
+                            matched[key].setdefault(v, None)
+                        if matched[key][result["value"]] is None:
+                            matched[key][result["value"]] = result
+                if labelled and len(pre["tokens"]):
+                    with timings.stage("labels"):
+                        hits = await executors.run("align", _resolve_labels, pre["tokens"], prepared.label_rules, 0.0)
+                    for key, hit in hits.items():
+                        if hit["confidence"] > labelled[key].get(hit["value"], (0.0,))[0]:
+                            labelled[key][hit["value"]] = (hit["confidence"], hit["bboxes"], hit["bbox_pages"])
+                with timings.stage("chunking"):
+                    chunks = indexer.split_markdown_into_chunks(pre["markdown"])
+                    md_tokens_est += indexer.approximate_tokens(pre["markdown"])
+                if chunks:
+                    with timings.stage("embedding"):
+                        idx = await executors.run("embeddings", retriever.EphemeralIndex, chunks, prepared.anchors)
+                    with timings.stage("retrieval"):
+                        for key in schema.fields:
+                            for i, score in idx.search(key, topk=topk, query_vec=field_vecs.get(key)):
+                                seq += 1
+                                push = heapq.heappush if len(best[key]) < topk else heapq.heappushpop
+                                push(best[key], (score, seq, chunks[i]["text"], w))
+            info: Dict[str, Any] = {"pages": [start + 1, end]}
+            if "tables" in pre["plan"]:
+                info["tables"] = pre["plan"]["tables"]["count"]
+            if "ocr_scope" in pre["plan"]:
+                info["ocr_pages"] = [p + start for p in pre["plan"]["ocr_scope"]["pages"]]
+            elif pre["pages_blocks"] and not pre["table_cells"]:
+                info["ocr_pages"] = [pg["page"] for pg in pre["pages_blocks"]]
+            windows.append(info)
+            log.info("Streamed pages %d-%d of %d", start + 1, end, n_pages)
+            if emit:
+                emit("window_done", pages=[start + 1, end])
+    finally:
+        await executors.run("io", sink.close)
+
+    # a label read in several windows with different values is as ambiguous as on one page
+    min_conf = float(os.getenv("LABEL_MIN_CONFIDENCE", "0.8"))
+    results: List[Dict[str, Any]] = []
+    sources: Dict[str, str] = {}
+    for key in schema.fields:
+        if len(matched.get(key, ())) == 1:
+            sources[key] = "pattern"
+            results.append(next(iter(matched[key].values())))
+            continue
+        found = labelled.get(key)
+        if found:
+            value, (conf, bboxes, pages) = max(found.items(), key=lambda kv: kv[1][0])
+            if conf / len(found) >= min_conf:
+                sources[key] = "label"
+                results.append({"key": key, "value": value, "confidence": round(conf / len(found), 4),
+                                "bboxes": bboxes, "bbox_pages": pages})
+                continue
+        sources[key] = "llm"
+        hits = sorted(best[key], reverse=True)
+        log.info("Calling LLM for field %s", key)
+        with timings.stage("llm"):
+            fields_out = await extract_fields_async([key], schema.llm_text, "\n\n".join(h[2] for h in hits), timings=timings)
+        item = fields_out.get(key, {}) or {}
+        val = (item.get("value") or "")
+        llm_conf = float(item.get("confidence") or 0.0)
+        # only the tokens of the windows the LLM context came from
+        chunk_tokens = await executors.run("io", sink.read_tokens, {h[3] for h in hits}) if val else TokenTable.empty()
+        with timings.stage("alignment"):
+            tok_idx, coverage = await executors.run("align", align.align_value_to_tokens, val, chunk_tokens)
+        confidence = max(0.0, min(1.0, 0.7 * coverage + 0.3 * llm_conf))
+        results.append(
+            {
+                "key": key,
+                "value": val or None,
+                "confidence": round(confidence, 4),
+                "bboxes": chunk_tokens.bbox[tok_idx].tolist(),
+                "bbox_pages": chunk_tokens.page[tok_idx].tolist(),
+            }
+        )
+
+    bypass = field_tally.record(schema.name, sources)
+    markdown = await executors.run("io", sink.markdown)
+    response, _ = await _assemble_response(data, filename, schema.name, req_id, markdown, results, timings)
+    if any(n for _, n in sink.cell_spans):
+        with timings.stage("locations"):
+            response["fields"] = await executors.run("pdf", _locate_streamed, sink, response["fields"])
+
+    manifest = {
+        "request_id": req_id,
+        "file": filename,
+        "template": schema.name,
+        "policy": {"ocr_policy": os.getenv("OCR_POLICY", "auto")},
+        "plan": {"kind": "pdf", "stream": {"pages": n_pages, "window_pages": window, "windows": windows}},
+        "llm_context_mode": "rag_field_wise",
+        "md_token_estimate": md_tokens_est,
+        "field_sources": sources,
+        "bypass_rates": bypass,
+    }
+    with timings.stage("persistence"):
+        manifest.update({"timings_ms": dict(timings.ms)})
+        await executors.run("io", _save_bundle, req_id, artifacts_dir, response, manifest, tracing.current.get(), profiler)
+    return response
+
+
+class _WindowArtifacts:
+    """Parse artifacts of a streamed document (md.txt, tokens.bin, tables.json,
+    cells.jsonl), appended window by window.
+
+    Only the byte span of each window is kept, so its tokens or cells can be
+    read back later without holding the whole document.
+    """
+
+    def __init__(self, rdir: str):
+        os.makedirs(rdir, exist_ok=True)
+        self.rdir = rdir
+        self._md = open(os.path.join(rdir, "md.txt"), "w", encoding="utf-8")
+        self._tokens = open(os.path.join(rdir, "tokens.bin"), "wb")
+        self._cells = open(os.path.join(rdir, "cells.jsonl"), "wb")
+        self._jsonl = open(os.path.join(rdir, "tokens.jsonl"), "w", encoding="utf-8") if TOKENS_JSONL else None
+        self._tables = None
+        self.token_spans: List[int] = []
+        self.cell_spans: List[tuple] = []
+
+    def append(self, markdown: str, tokens: TokenTable, pages_blocks: List[Dict[str, Any]],
+               cells: List[Dict[str, Any]]) -> None:
+        if self._md.tell():
+            self._md.write("\n\n")
+        self._md.write(markdown)
+        self._md.flush()
+        self.token_spans.append(self._tokens.tell())
+        tokens.write(self._tokens)
+        self._tokens.flush()
+        if self._jsonl is not None:
+            _write_jsonl(self._jsonl, tokens)
+        pos = self._cells.tell()
+        for c in cells:
+            self._cells.write((json.dumps(c, ensure_ascii=False) + "\n").encode("utf-8"))
+        self._cells.flush()
+        self.cell_spans.append((pos, self._cells.tell() - pos))
+        for pg in pages_blocks:
+            if self._tables is None:
+                self._tables = open(os.path.join(self.rdir, "tables.json"), "w", encoding="utf-8")
+                self._tables.write("[\n")
+            else:
+                self._tables.write(",\n")
+            json.dump(pg, self._tables, ensure_ascii=False)
+        if self._tables is not None:
+            self._tables.flush()
+
+    def close(self) -> None:
+        if self._tables is not None:
+            self._tables.write("\n]\n")
+            self._tables.close()
+        for f in (self._md, self._tokens, self._cells, self._jsonl):
+            if f is not None:
+                f.close()
+
+    def read_tokens(self, windows) -> TokenTable:
+        """Tokens of the given windows, in page order."""
+        with open(os.path.join(self.rdir, "tokens.bin"), "rb") as f:
+            parts = []
+            for w in sorted(windows):
+                f.seek(self.token_spans[w])
+                parts.append(TokenTable.read(f))
+        return TokenTable.concat(parts)
+
+    def read_cells(self, w: int) -> List[Dict[str, Any]]:
+        pos, n = self.cell_spans[w]
+        with open(os.path.join(self.rdir, "cells.jsonl"), "rb") as f:
+            f.seek(pos)
+            return [json.loads(line) for line in f.read(n).splitlines() if line]
+
+    def markdown(self) -> str:
+        with open(os.path.join(self.rdir, "md.txt"), encoding="utf-8") as f:
+            return f.read()
+
+
+def _locate_streamed(sink: _WindowArtifacts, fields: Dict[str, Dict[str, Any]]) -> Dict[str, Dict[str, Any]]:
+    """``locations`` of the answered fields from table cells, one window at a time."""
+    answered = {k: v for k, v in fields.items() if v.get("value")}
+    for w, (_, n) in enumerate(sink.cell_spans):
+        if not n or not answered:
+            continue
+        found = map_bboxes_to_fields({k: {"value": v["value"]} for k, v in answered.items()}, sink.read_cells(w))
+        for k, v in found.items():
+            answered[k].setdefault("locations", []).extend(v.get("locations", []))
+    for v in answered.values():
+        if v.get("locations"):
+            v["bbox"], v["page_index"] = v["locations"][0]["bbox"], v["locations"][0]["page_index"]
+    return fields
+
+
+def _write_jsonl(f, tokens: TokenTable) -> None:
+    for tkn in tokens:
+        f.write(json.dumps(tkn, ensure_ascii=False) + "\n")
+
+
+def _write_parse_artifacts(rdir: str, markdown: str, tokens: TokenTable, pages_blocks: List[Dict[str, Any]]) -> Dict[str, str]:
+    os.makedirs(rdir, exist_ok=True)
+    with open(os.path.join(rdir, "md.txt"), "w", encoding="utf-8") as f:
+        f.write(markdown)
+    out = {"tokens.bin": os.path.join(rdir, "tokens.bin")}
+    tokens.save(out["tokens.bin"])
+    if TOKENS_JSONL:
+        out["tokens.jsonl"] = os.path.join(rdir, "tokens.jsonl")
+        with open(out["tokens.jsonl"], "w", encoding="utf-8") as f:
+            _write_jsonl(f, tokens)
+    if pages_blocks:
+        out["tables.json"] = os.path.join(rdir, "tables.json")
+        with open(out["tables.json"], "w", encoding="utf-8") as f:
+            json.dump(pages_blocks, f, ensure_ascii=False, indent=2)
+    return out
+
+
+def _write_bytes(path: str, data: bytes) -> None:
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, "wb") as f:
+        f.write(data)
+
+
+def _save_bundle(req_id: str, rdir: str, response: dict, manifest: dict,
+                 trace: tracing.Trace | None, profiler: tracing.SamplingProfiler | None) -> None:
     with open(os.path.join(rdir, "response.json"), "w", encoding="utf-8") as f:
         json.dump(response, f, ensure_ascii=False, indent=2)
+    bundle = {"response.json": os.path.join(rdir, "response.json")}
+    if profiler is not None:
+        profiler.stop()
+        bundle["profile.folded"] = profiler.save(rdir)
+    if trace is not None:
+        bundle["trace.json"] = trace.save(rdir)
+    reports.save_report_bundle(req_id, manifest, {}, bundle)
 
-    reports.save_report_bundle(
-        req_id, manifest, {}, {"response.json": os.path.join(rdir, "response.json")}
-    )
+
+async def _process_request(
+    data: bytes,
+    filename: str,
+    tpl_json: dict,
+    req_id: str,
+    emit: Callable[[str], None] | None = None,
+    prepared: PreparedTemplate | None = None,
+    profile: bool = False,
+    n_pages: Optional[int] = None,
+) -> dict:
+    """Preflight and extraction of one document (windowed for long PDFs);
+    ``n_pages`` is the page count when the caller already has it."""
+    log.info("Starting _process_request for %s", filename)
+    prepared = prepared or PreparedTemplate(tpl_json)
+    timings = metrics.StageTimings(prepared.schema.name)
+    trace = tracing.Trace(req_id) if TRACE_REQUESTS else None
+    profiler = None
+    if profile or PROFILE_REQUESTS:
+        profiler = tracing.SamplingProfiler(PROFILE_INTERVAL_MS).start()
+    try:
+        with tracing.activate(trace):
+            if n_pages is None and STREAM_MIN_PAGES > 0:
+                n_pages = await executors.run("pdf", count_pages, data, filename or "")
+            n_pages = n_pages or 0
+            if n_pages >= STREAM_MIN_PAGES > 0 and plan_stages(data, filename or "")["kind"] == "pdf":
+                with tracing.span("stream"):
+                    response = await _extract_streaming(data, filename, prepared, req_id, n_pages, emit, timings, profiler)
+            else:
+                with tracing.span("preflight"):
+                    pre = await _preflight(data, filename, req_id, emit, timings)
+                with tracing.span("extract"):
+                    response = await _extract(data, filename, prepared, req_id, pre, profiler)
+    finally:
+        if profiler is not None:
+            profiler.stop()
     log.info("Completed _process_request for %s", filename)
     return response
 
+
+# ---------------- In-flight deduplication ----------------
+# coalescing key -> (request_id, task) of the computation identical requests wait on
+_inflight: Dict[str, tuple] = {}
+
+
+def _coalesce_key(data: bytes, filename: str, tpl_json: dict) -> str:
+    """Content hash + template + OCR policy (+ extension, which drives the MIME guess)."""
+    h = hashlib.sha256(data)
+    for part in (json.dumps(tpl_json, sort_keys=True, ensure_ascii=False), os.getenv("OCR_POLICY", "auto"),
+                 os.path.splitext(filename or "")[1].lower()):
+        h.update(b"\0" + part.encode("utf-8"))
+    return h.hexdigest()
+
+
+async def _process_coalesced(
+    endpoint: str,
+    admit,
+    data: bytes,
+    filename: str,
+    tpl_json: dict,
+    req_id: str,
+    emit: Callable[[str], None] | None = None,
+    profile: bool = False,
+    n_pages: Optional[int] = None,
+) -> dict:
+    """``_process_request`` shared by concurrent identical requests.
+
+    The first request (admitted through the ``admit`` context manager, which
+    is held until the pipeline run ends even if that request is cancelled)
+    runs the pipeline; the others await it and get a copy of its response and
+    report under their own ``request_id``. Profiled requests always run alone.
+    """
+    key = await executors.run("io", _coalesce_key, data, filename, tpl_json)
+    leader = None if profile else _inflight.get(key)
+    if leader is None:
+        admit.__enter__()  # raises Overloaded before anything runs
+        task = asyncio.ensure_future(_process_request(data, filename, tpl_json, req_id, emit=emit, profile=profile,
+                                                   n_pages=n_pages))
+        # the slot is held by the computation, which outlives a cancelled leader while followers wait on it
+        task.add_done_callback(functools.partial(_release_admission, admit))
+        if not profile:
+            _inflight[key] = (req_id, task)
+            task.add_done_callback(lambda t: _inflight.pop(key, None) if _inflight.get(key, (None, None))[1] is t else None)
+        return await asyncio.shield(task)
+    leader_id, task = leader
+    log.info("Request %s coalesced with in-flight %s", req_id, leader_id)
+    metrics.requests_coalesced_total.labels(endpoint=endpoint).inc()
+    if emit:
+        emit("coalesced", request_id=leader_id)
+    res = await asyncio.shield(task)
+    return await executors.run("io", _save_coalesced, res, leader_id, req_id)
+
+
+def _release_admission(admit, task: asyncio.Future) -> None:
+    """Leave the ``admit`` context once ``task`` is finished, with its outcome."""
+    exc = asyncio.CancelledError() if task.cancelled() else task.exception()
+    admit.__exit__(type(exc) if exc else None, exc, exc.__traceback__ if exc else None)
+
+
+def _save_coalesced(res: dict, leader_id: str, req_id: str) -> dict:
+    """Response and report of a coalesced request; artifacts stay in the leader's bundle."""
+    res = copy.deepcopy(res)
+    res["request_id"] = req_id
+    try:
+        with open(os.path.join(REPORTS_DIR, leader_id, "report.json"), encoding="utf-8") as f:
+            rep = json.load(f)
+    except (OSError, ValueError):
+        rep = {"manifest": {}, "artifacts": {}}
+    manifest = {**rep.get("manifest", {}), "request_id": req_id, "coalesced_with": leader_id}
+    rdir = os.path.join(REPORTS_DIR, req_id)
+    os.makedirs(rdir, exist_ok=True)
+    with open(os.path.join(rdir, "response.json"), "w", encoding="utf-8") as f:
+        json.dump(res, f, ensure_ascii=False, indent=2)
+    artifacts = {**rep.get("artifacts", {}), "response.json": os.path.join(rdir, "response.json")}
+    reports.save_report_bundle(req_id, manifest, {}, artifacts)
+    return res
+
+
 # ---------------- Routes ----------------
+def _profile_requested(x_profile: Optional[str]) -> bool:
+    """Opt-in sampling profile via the ``X-Profile`` request header."""
+    return (x_profile or "").lower() in ("1", "true", "yes")
+
 
 @app.post("/extract")
 async def extract(
@@ -357,6 +993,8 @@ async def extract(
     template: str = Form(...),
     ocr_policy: str = Form("auto"),
     overlays: bool = Form(False),
+    x_profile: Optional[str] = Header(None),
+    x_api_key: Optional[str] = Header(None),
     _auth_ok: bool = Depends(get_api_key),
 ):
     log.info(
@@ -372,9 +1010,12 @@ async def extract(
     except Exception:
         raise HTTPException(status_code=400, detail="Invalid template")
     req_id = str(uuid.uuid4())
+    pages = await executors.run("pdf", count_pages, data, file.filename or "")
     try:
-        res = await _process_request(data, file.filename, tpl, req_id)
-    except AppError:
+        res = await _process_coalesced("/extract", admission_ctl.admit("/extract", x_api_key, pages),
+                                       data, file.filename, tpl, req_id, profile=_profile_requested(x_profile),
+                                       n_pages=pages)
+    except (AppError, admission.Overloaded):
         raise
     except Exception as e:
         log.exception("/extract internal error for %s", file.filename)
@@ -387,6 +1028,8 @@ async def process_document(
     ocr_policy: str = Form("auto"),
     llm_model: Optional[str] = Form(None),
     overlays: bool = Form(False),
+    x_profile: Optional[str] = Header(None),
+    x_api_key: Optional[str] = Header(None),
     _auth_ok: bool = Depends(get_api_key),
 ):
     log.info(
@@ -406,9 +1049,12 @@ async def process_document(
     except Exception:
         raise HTTPException(status_code=400, detail="Invalid template")
     req_id = str(uuid.uuid4())
+    pages = await executors.run("pdf", count_pages, data, file.filename or "")
     try:
-        res = await _process_request(data, file.filename, tpl, req_id)
-    except AppError:
+        res = await _process_coalesced("/process-document", admission_ctl.admit("/process-document", x_api_key, pages),
+                                       data, file.filename, tpl, req_id, profile=_profile_requested(x_profile),
+                                       n_pages=pages)
+    except (AppError, admission.Overloaded):
         raise
     except Exception as e:
         log.exception("/process-document internal error for %s", file.filename)
@@ -417,6 +1063,105 @@ async def process_document(
     return JSONResponse(res)
 
 
+def _iter_batch_docs(uploads: List[tuple]):
+    """Yield ``(filename, bytes)`` per document, expanding zip archives lazily."""
+    for name, data in uploads:
+        if data[:4] == b"PK\x03\x04" or (name or "").lower().endswith(".zip"):
+            try:
+                zf = zipfile.ZipFile(io.BytesIO(data))
+            except zipfile.BadZipFile:
+                yield name, data
+                continue
+            for info in zf.infolist():
+                base = os.path.basename(info.filename)
+                if info.is_dir() or not base or base.startswith(".") or info.filename.startswith("__MACOSX/"):
+                    continue
+                yield base, zf.read(info)
+        else:
+            yield name, data
+
+
+async def _run_batch(docs, prepared: PreparedTemplate):
+    """Pipelined batch scheduler.
+
+    Parsing/OCR (``_preflight``) of upcoming documents runs in background
+    tasks while the current document is in the LLM stage (``_extract``); at
+    most ``BATCH_PREFETCH`` parsed documents wait for the LLM, which bounds
+    memory. Yields one result dict per document, in completion order.
+    """
+    ready: asyncio.Queue = asyncio.Queue(maxsize=max(1, BATCH_PREFETCH))
+    slots = asyncio.Semaphore(max(1, BATCH_PREFLIGHT_CONCURRENCY))
+
+    async def _parse_one(i: int, name: str, data: bytes):
+        req_id = str(uuid.uuid4())
+        try:
+            with tracing.activate(tracing.Trace(req_id) if TRACE_REQUESTS else None), tracing.span("preflight"):
+                pre = await _preflight(data, name, req_id, timings=metrics.StageTimings(prepared.schema.name))
+            await ready.put((i, name, data, req_id, pre, None))
+        except Exception as e:
+            await ready.put((i, name, data, req_id, None, e))
+        finally:
+            slots.release()
+
+    async def _produce():
+        tasks = []
+        try:
+            for i, (name, data) in enumerate(docs):
+                await slots.acquire()
+                tasks.append(asyncio.create_task(_parse_one(i, name, data)))
+            await asyncio.gather(*tasks)
+        finally:
+            for t in tasks:
+                t.cancel()
+            await ready.put(None)
+
+    producer = asyncio.create_task(_produce())
+    try:
+        while True:
+            item = await ready.get()
+            if item is None:
+                break
+            i, name, data, req_id, pre, err = item
+            res = None
+            if err is None:
+                try:
+                    with tracing.activate(pre["trace"]), tracing.span("extract"):
+                        res = await _extract(data, name, prepared, req_id, pre)
+                except Exception as e:
+                    err = e
+            if err is not None:
+                if isinstance(err, AppError):
+                    res = {"request_id": req_id, "status": "error", "error": err.kind, "message": err.msg}
+                else:
+                    log.error("/extract/batch failed for %s: %s", name, err)
+                    res = {"request_id": req_id, "status": "error", "error": "ProcessingFailed"}
+            yield {"index": i, "filename": name, **res}
+    finally:
+        producer.cancel()
+
+
+@app.post("/extract/batch")
+async def extract_batch(
+    files: List[UploadFile] = File(...),
+    template: str = Form(...),
+    _auth_ok: bool = Depends(get_api_key),
+):
+    """Extract many documents (or one zip) with one template; streams NDJSON as documents finish."""
+    try:
+        tpl = json.loads(template)
+    except Exception:
+        raise HTTPException(status_code=400, detail="Invalid template")
+    prepared = PreparedTemplate(tpl)
+    uploads = [(f.filename, await f.read()) for f in files]
+    log.info("Received /extract/batch request: %d uploads", len(uploads))
+
+    async def _ndjson():
+        async for res in _run_batch(_iter_batch_docs(uploads), prepared):
+            yield json.dumps(res, ensure_ascii=False) + "\n"
+
+    return StreamingResponse(_ndjson(), media_type="application/x-ndjson")
+
+
 @app.get("/reports/{rid}")
 async def get_report(rid: str, ok: bool = Depends(get_api_key)):
     path = os.path.join(REPORTS_DIR, rid, "report.json")
@@ -441,6 +1186,7 @@ async def submit_job(
     file: UploadFile = File(...),
     template: str = Form(...),
     priority: int = Form(5),
+    x_api_key: Optional[str] = Header(None),
     _auth_ok: bool = Depends(get_api_key),
 ):
     data = await file.read()
@@ -448,19 +1194,69 @@ async def submit_job(
         tpl = json.loads(template)
     except Exception:
         raise HTTPException(status_code=400, detail="Invalid template")
-    job_id = jobs.global_q.submit({"data": data, "filename": file.filename, "tpl": tpl}, int(priority))
+    pages = await executors.run("pdf", count_pages, data, file.filename or "")
+    # a job is admitted while the queue has room; the in-flight limits apply when
+    # a worker picks it up (JOB_WORKERS bounds how many run at once)
+    try:
+        job_id = await jobs.global_q.asubmit({"data": data, "filename": file.filename, "tpl": tpl, "pages": pages}, int(priority))
+    except jobs.QueueFull:
+        admission_ctl.reject("/jobs", admission.key_label(x_api_key), "queue_full",
+                             f"Job queue is full ({JOB_QUEUE_MAXSIZE} queued)")
     return {"job_id": job_id}
 
 
+@app.get("/jobs/{job_id}")
+async def job_result(job_id: str, _auth_ok: bool = Depends(get_api_key)):
+    res = await jobs.global_q.aget_result(job_id)
+    if res is not None:
+        return JSONResponse(res)
+    events = await jobs.global_q.aget_events(job_id)
+    if not events:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return JSONResponse({"job_id": job_id, "status": events[-1]["event"]}, status_code=202)
+
+
 @app.get("/jobs/{job_id}/events")
-async def job_events(job_id: str, _auth_ok: bool = Depends(get_api_key)):
-    events = jobs.global_q.get_events(job_id)
-    lines = []
-    for ev in events:
-        lines.append(f"event: {ev['event']}")
-        lines.append(f"data: {json.dumps(ev['data'])}")
-        lines.append("")
-    return Response("\n".join(lines), media_type="text/event-stream")
+async def job_events(
+    job_id: str,
+    last_event_id: Optional[str] = Header(None),
+    _auth_ok: bool = Depends(get_api_key),
+):
+    """Stream job events as SSE until the job is done or fails.
+
+    Event ids are 1-based positions in the job's event log, so a client can
+    resume with ``Last-Event-ID``.
+    """
+    if not await jobs.global_q.aget_events(job_id):
+        raise HTTPException(status_code=404, detail="Job not found")
+    try:
+        after = max(0, int(last_event_id or 0))
+    except ValueError:
+        after = 0
+
+    async def _stream():
+        nonlocal after
+        while True:
+            backlog = await jobs.global_q.aget_events(job_id)
+            if not backlog:
+                return  # expired from the event store
+            if after >= len(backlog) and backlog[-1]["event"] in jobs.TERMINAL_EVENTS:
+                return
+            evs = await jobs.global_q.wait_events(job_id, after, timeout=JOB_SSE_HEARTBEAT_S)
+            if not evs:
+                yield ": keep-alive\n\n"
+                continue
+            for ev in evs:
+                after += 1
+                yield f"id: {after}\nevent: {ev['event']}\ndata: {json.dumps(ev['data'])}\n\n"
+                if ev["event"] in jobs.TERMINAL_EVENTS:
+                    return
+
+    return StreamingResponse(
+        _stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
 
 @app.get("/metrics")
 async def metrics_route():
@@ -469,3 +1265,12 @@ async def metrics_route():
 @app.get("/")
 async def health():
     return JSONResponse({"ok": True})
+
+@app.get("/ready")
+async def ready():
+    """Readiness: 200 once the backends in ``READY_REQUIRED`` are loaded, 503 before."""
+    st = warmup.status(READY_REQUIRED)
+    return JSONResponse(st, status_code=200 if st["ready"] else 503)
+
+
+warmup.mark("import")
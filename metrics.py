@@ -1,11 +1,125 @@
-from prometheus_client import Counter, Histogram
+from __future__ import annotations
+import threading, time
+from collections import OrderedDict
+from contextlib import contextmanager
+from typing import Dict
+from prometheus_client import Counter, Gauge, Histogram
+import tracing
 jobs_enqueued_total = Counter("jobs_enqueued_total","Jobs enqueued")
 jobs_completed_total = Counter("jobs_completed_total","Jobs completed")
+jobs_failed_total = Counter("jobs_failed_total","Jobs failed")
+job_queue_depth = Gauge("job_queue_depth","Jobs waiting in the queue")
+job_wait_ms = Histogram("job_wait_ms","Time from submission to start of a job",
+                        buckets=(10,50,100,250,500,1000,2500,5000,10000,30000,60000,300000))
 page_latency_ms_by_template = Histogram("page_latency_ms_by_template","OCR/PP page latency",
                                         ["step","template"], buckets=(10,50,100,250,500,1000,2000,5000,10000))
+stage_latency_ms = Histogram("stage_latency_ms","Pipeline stage latency",
+                             ["stage","template"], buckets=(1,5,10,25,50,100,250,500,1000,2500,5000,10000,30000,60000,120000))
+llm_tokens_total = Counter("llm_tokens_total","LLM tokens processed",["direction"])  # in|out
+executor_active = Gauge("executor_active","Executor tasks running",["executor"])
+executor_queued = Gauge("executor_queued","Executor tasks waiting for a thread",["executor"])
+executor_completed_total = Counter("executor_completed_total","Executor tasks completed",["executor"])
+executor_max_workers = Gauge("executor_max_workers","Executor thread pool size",["executor"])
+process_memory_bytes = Gauge("process_memory_bytes","Memory of this worker process (uss = private pages only)",["kind"])
+cold_start_seconds = Gauge("cold_start_seconds","Seconds from process start to each startup phase",["phase"])
+admission_rejected_total = Counter("admission_rejected_total","Requests rejected with 429 by admission control",
+                                   ["endpoint","reason","api_key"])  # api_key = sha256 prefix
+ocr_rerecognized_words_total = Counter("ocr_rerecognized_words_total","Low-confidence words OCR'd again at OCR_HIGH_DPI",["outcome"])  # improved|kept
+fields_resolved_total = Counter("fields_resolved_total","Template fields answered, by source",["source"])  # pattern|layout|label|llm
+layout_cache_lookups_total = Counter("layout_cache_lookups_total","Layout cache lookups",["outcome"])  # hit|miss
+layout_cache_evictions_total = Counter("layout_cache_evictions_total","Known layouts evicted from the layout cache")
+layout_cache_entries = Gauge("layout_cache_entries","Known layouts in the layout cache")
+layout_cache_verifications_total = Counter("layout_cache_verifications_total","Layout cache values checked by the LLM",["outcome"])  # agree|disagree
+requests_coalesced_total = Counter("requests_coalesced_total","Requests served by an identical in-flight computation",["endpoint"])
+admission_inflight = Gauge("admission_inflight","Documents/pages admitted and not finished",["kind"])
+admission_estimated_latency_ms = Gauge("admission_estimated_latency_ms","Predicted latency of the last request checked for admission")
+event_loop_lag_ms = Histogram("event_loop_lag_ms","Delay of event loop callbacks past their due time",
+                              buckets=(1,2,5,10,25,50,100,250,500,1000,2500,5000))
+event_loop_blocked_total = Counter("event_loop_blocked_total","Event loop stalls longer than LOOP_BLOCK_THRESHOLD_MS")
+backend_warmup_seconds = Gauge("backend_warmup_seconds","Load + dry-run time of each backend at startup",["backend"])
+
+def process_memory() -> Dict[str, int]:
+    """``rss``, ``pss``, ``shared`` and ``uss`` (private clean + dirty) in bytes, from
+    ``/proc/self/smaps_rollup``; empty where that file is not available."""
+    try:
+        with open("/proc/self/smaps_rollup") as f:
+            kb = {}
+            for line in f:
+                parts = line.split()
+                if len(parts) >= 2 and parts[0].endswith(":") and parts[1].isdigit():
+                    kb[parts[0][:-1]] = int(parts[1])
+    except OSError:
+        return {}
+    return {
+        "rss": kb.get("Rss", 0) * 1024,
+        "pss": kb.get("Pss", 0) * 1024,
+        "shared": (kb.get("Shared_Clean", 0) + kb.get("Shared_Dirty", 0)) * 1024,
+        "uss": (kb.get("Private_Clean", 0) + kb.get("Private_Dirty", 0)) * 1024,
+    }
+
+for _kind in ("rss", "pss", "shared", "uss"):
+    process_memory_bytes.labels(kind=_kind).set_function(lambda k=_kind: process_memory().get(k, 0))
 
 def observe_page_latency(step: str, ms: int, template: str):
     try:
         page_latency_ms_by_template.labels(step=step, template=template).observe(ms)
     except Exception:
         pass
+
+def observe_stage(stage: str, ms: float, template: str):
+    try:
+        stage_latency_ms.labels(stage=stage, template=template).observe(ms)
+    except Exception:
+        pass
+
+class StageTimings:
+    """Per-request stage clock feeding ``stage_latency_ms``, the manifest ``timings_ms``
+    and a span in the current request trace.
+
+    Repeated stages (e.g. one LLM call per field) accumulate into one entry.
+    """
+
+    def __init__(self, template: str = "default"):
+        self.template = template
+        self.ms: Dict[str, int] = {}
+
+    def add(self, stage: str, ms: float):
+        self.ms[stage] = self.ms.get(stage, 0) + int(ms)
+        observe_stage(stage, ms, self.template)
+
+    @contextmanager
+    def stage(self, name: str):
+        t0 = time.perf_counter()
+        try:
+            with tracing.span(name):
+                yield
+        finally:
+            self.add(name, (time.perf_counter() - t0) * 1000)
+
+
+class FieldTally:
+    """Per template and field, documents answered without the LLM out of all seen
+    by this process; the least recently used templates beyond ``max_templates`` are dropped."""
+
+    def __init__(self, max_templates: int = 256):
+        self.max_templates = max_templates
+        self._data: "OrderedDict[str, Dict[str, list]]" = OrderedDict()
+        self.lock = threading.Lock()
+
+    def record(self, template: str, sources: Dict[str, str]) -> Dict[str, Dict[str, float]]:
+        """Count one document (``sources``: field -> ``pattern``/``layout``/``label``/``llm``)
+        and return ``{field: {"rate", "docs"}}`` for the template so far."""
+        for src in sources.values():
+            fields_resolved_total.labels(source=src).inc()
+        with self.lock:
+            counts = self._data.pop(template, {})
+            self._data[template] = counts
+            while len(self._data) > self.max_templates:
+                self._data.popitem(last=False)
+            out = {}
+            for field, src in sources.items():
+                c = counts.setdefault(field, [0, 0])
+                c[0] += src != "llm"
+                c[1] += 1
+                out[field] = {"rate": round(c[0] / c[1], 4), "docs": c[1]}
+        return out
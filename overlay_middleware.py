@@ -128,6 +128,10 @@ async def overlay_embedder(request, call_next) -> Response:
 
     resp = await call_next(request)
 
+    # Streams (e.g. SSE job events) are never JSON payloads: don't buffer them
+    if not resp.headers.get("content-type", "").startswith("application/json"):
+        return resp
+
     # Read response body
     try:
         body = b""
@@ -1,10 +1,13 @@
 from __future__ import annotations
 from typing import List, Dict, Any, Optional
-import fitz, mimetypes, os, asyncio, re
+import mimetypes, os, asyncio, re
+import numpy as np
 
 from clients.markitdown_client import convert_bytes_to_markdown_async
 import clients.doctr_client as ocr_client
+import executors
 from logger import get_logger
+from token_table import TokenTable
 
 log = get_logger(__name__)
 
@@ -16,18 +19,42 @@ def _guess_mime(filename: str, header: bytes) -> str:
     if header[:3] == b'\xff\xd8\xff': return 'image/jpeg'
     return 'application/octet-stream'
 
+def plan_stages(data: bytes, filename: str, ocr_policy: str = "auto") -> Dict[str, Any]:
+    """Work out the preflight stages a document needs before running any of them.
+
+    ``kind`` is pdf|image|other. ``markdown`` is "run" or "fallback" (images:
+    MarkItDown only if OCR yields nothing, since OCR markdown replaces it);
+    ``words`` tells whether to read the PDF text layer; ``ocr`` is "run",
+    "skip" or "decide" (PDFs: depends on the text layer and table sniffing).
+    """
+    mime = _guess_mime(filename, data[:8])
+    if mime == 'application/pdf' or data[:4] == b'%PDF':
+        return {"kind": "pdf", "mime": "application/pdf", "markdown": "run", "words": True,
+                "ocr": "skip" if ocr_policy == "auto_pages" else "decide"}
+    if mime.startswith("image/"):
+        if ocr_policy == "auto_pages":
+            return {"kind": "image", "mime": mime, "markdown": "run", "words": False, "ocr": "skip"}
+        return {"kind": "image", "mime": mime, "markdown": "fallback", "words": False, "ocr": "run"}
+    # DocTR only reads PDFs and images
+    return {"kind": "other", "mime": mime, "markdown": "run", "words": False, "ocr": "skip"}
+
+def count_pages(data: bytes, filename: str) -> int:
+    """Page count for admission control: PDF page count, 1 for anything else."""
+    if _guess_mime(filename, data[:8]) != 'application/pdf' and data[:4] != b'%PDF':
+        return 1
+    import fitz
+    try:
+        return max(1, fitz.open(stream=data, filetype="pdf").page_count)
+    except Exception:
+        return 1
+
 async def convert_markdown_async(data: bytes, filename: str = "input.bin") -> str:
     """Async version: PDF -> PyMuPDF text, else call MarkItDown async; fallback to naive decode."""
     log.info("Entering convert_markdown_async for %s", filename)
-    import fitz
     mime = _guess_mime(filename, data[:8])
     if mime == 'application/pdf':
         try:
-            doc = fitz.open(stream=data, filetype="pdf")
-            parts = []
-            for p in doc:
-                parts.append(p.get_text("text").strip()+"\n")
-            return "\n".join(parts).strip() or "(empty)"
+            return await executors.run("pdf", _pdf_text, data)
         except Exception:
             pass
     try:
@@ -41,12 +68,21 @@ async def convert_markdown_async(data: bytes, filename: str = "input.bin") -> st
         except Exception:
             return "(binary)"
 
+def _pdf_text(data: bytes) -> str:
+    import fitz
+    doc = fitz.open(stream=data, filetype="pdf")
+    parts = []
+    for p in doc:
+        parts.append(p.get_text("text").strip()+"\n")
+    return "\n".join(parts).strip() or "(empty)"
+
 def convert_markdown(data: bytes, filename: str = "input.bin") -> str:
 
     """Markdown-first: for PDFs use PyMuPDF/plain text; for images or other types, use MarkItDown (OCR disabled).
 
     This is a *fallback* path—on raster/images we prefer DocTR to also get tokens.
     """
+    import fitz
     mime = _guess_mime(filename, data[:8])
     if mime == 'application/pdf':
         try:
@@ -68,23 +104,257 @@ def convert_markdown(data: bytes, filename: str = "input.bin") -> str:
         except Exception:
             return "(binary)"
 
-def extract_words_with_bboxes_pdf(data: bytes) -> list:
-    log.info("Extracting words and bboxes from PDF")
+def extract_pdf_tokens(data: bytes) -> TokenTable:
+    """Text-layer words of a PDF straight into a ``TokenTable`` (page-relative bboxes, no per-word dicts)."""
+    import fitz
     try:
         doc = fitz.open(stream=data, filetype="pdf")
     except Exception:
         log.info("Failed to open PDF for text extraction")
-        return []
-    pages = []
+        return TokenTable.empty()
+    texts: List[str] = []
+    pages, boxes = [], []
+    for pno, page in enumerate(doc, start=1):
+        words = page.get_text("words")
+        if not words:
+            continue
+        pw, ph = page.rect.width, page.rect.height
+        texts.extend(w[4] for w in words)
+        boxes.append(np.asarray([w[:4] for w in words], np.float32) / np.float32([pw, ph, pw, ph]))
+        pages.append(np.full(len(words), pno, np.int32))
+    log.info("Extracted %d words from %d pages", len(texts), doc.page_count)
+    if not texts:
+        return TokenTable.empty()
+    return TokenTable.from_texts(texts, np.concatenate(pages), np.concatenate(boxes))
+
+def pdf_page_window(data: bytes, start: int, end: int) -> bytes:
+    """Pages ``start``..``end - 1`` (0-based) of a PDF, as a PDF of their own."""
+    import fitz
+    src = fitz.open(stream=data, filetype="pdf")
+    out = fitz.open()
+    out.insert_pdf(src, from_page=start, to_page=end - 1, links=False)
+    return out.tobytes()
+
+def shift_pages(tokens: TokenTable, pages_blocks: List[Dict[str, Any]],
+                cells: List[Dict[str, Any]], offset: int) -> None:
+    """Renumber, in place, the preflight output of a page window by ``offset`` pages."""
+    tokens.page += offset
+    cell_ids = set()
+    for c in cells:
+        c["page_index"] += offset
+        cell_ids.add(id(c))
+    for pg in pages_blocks:
+        pg["page"] = pg.get("page", 1) + offset
+        for b in pg.get("blocks", []):
+            for c in b.get("cells", []):
+                if id(c) not in cell_ids:  # table blocks share their cell dicts with ``cells``
+                    c["page_index"] += offset
+
+def markdown_has_table(md: str) -> bool:
+    """Simple heuristic for OCR: a markdown table header followed by its separator row."""
+    lines = md.splitlines()
+    for i in range(len(lines) - 1):
+        if "|" in lines[i] and re.search(r"\|", lines[i]) and re.search(r"^\s*[:\-\| ]+$", lines[i + 1]):
+            return True
+    return False
+
+def _md_cell(v: Optional[str]) -> str:
+    return " ".join((v or "").split()).replace("|", "\\|")
+
+def _rows_to_markdown(rows: List[List[Optional[str]]]) -> str:
+    head, body = rows[0], rows[1:]
+    out = ["| " + " | ".join(_md_cell(v) for v in head) + " |", "|" + "---|" * len(head)]
+    out += ["| " + " | ".join(_md_cell(v) for v in r) + " |" for r in body]
+    return "\n".join(out)
+
+def _has_rulings(page, min_lines: int = 3) -> bool:
+    """Cheap test for a ruled table: at least ``min_lines`` horizontal and
+    vertical segments among the page's vector drawings (lines, hairline
+    rectangles, rectangle edges). PyMuPDF's table finder builds cells from
+    those same lines, so a page without them has no table for it to find."""
+    h = v = 0
+    for d in page.get_drawings():
+        for item in d["items"]:
+            if item[0] == "l":
+                p0, p1 = item[1], item[2]
+                h += abs(p0.y - p1.y) < 1 and abs(p0.x - p1.x) >= 3
+                v += abs(p0.x - p1.x) < 1 and abs(p0.y - p1.y) >= 3
+            elif item[0] == "re":
+                r = item[1]
+                if r.height < 3 and r.width >= 3:
+                    h += 1
+                elif r.width < 3 and r.height >= 3:
+                    v += 1
+                elif r.width >= 3 and r.height >= 3:
+                    h, v = h + 2, v + 2
+            if h >= min_lines and v >= min_lines:
+                return True
+    return False
+
+def extract_pdf_tables(data: bytes, max_pages: int = 100) -> Dict[str, Any]:
+    """Tables of a PDF's text layer, found by PyMuPDF's table finder (no OCR).
+
+    Returns ``pages_blocks`` (``{"type": "table", "markdown", "bbox", "cells"}``
+    blocks, the OCR block schema), ``cells`` (``category == "cell"`` tokens in
+    page points for ``map_bboxes_to_fields``) and, when any table was found,
+    ``markdown``: the page text with each table rendered as a markdown table
+    in reading position. Only the first ``max_pages`` pages are searched, and
+    only those with ruling lines (``_has_rulings``) reach the table finder.
+    """
+    import fitz
+    out: Dict[str, Any] = {"pages_blocks": [], "cells": [], "markdown": None}
+    try:
+        doc = fitz.open(stream=data, filetype="pdf")
+    except Exception:
+        return out
+    found: Dict[int, list] = {}
+    for pno, page in enumerate(doc, start=1):
+        if pno > max_pages:
+            break
+        if not _has_rulings(page):
+            continue
+        try:
+            tables = [t for t in page.find_tables().tables if t.row_count >= 2 and t.col_count >= 2]
+        except Exception:
+            tables = []
+        if tables:
+            found[pno] = tables
+    if not found:
+        return out
+    parts = []
+    for pno, page in enumerate(doc, start=1):
+        tables = found.get(pno, [])
+        items, blocks = [], []
+        for t in tables:
+            rows = t.extract()
+            md = _rows_to_markdown(rows)
+            x0, y0, x1, y1 = t.bbox
+            cells = []
+            for r, (row, texts) in enumerate(zip(t.rows, rows)):
+                for c, (bbox, text) in enumerate(zip(row.cells, texts)):
+                    if bbox is None or not (text or "").strip():
+                        continue
+                    cells.append({"category": "cell", "text": " ".join(text.split()), "page_index": pno - 1, "row": r, "col": c,
+                                  "bbox": [bbox[0], bbox[1], bbox[2] - bbox[0], bbox[3] - bbox[1]]})
+            out["cells"].extend(cells)
+            blocks.append({"type": "table", "markdown": md, "bbox": [x0, y0, x1 - x0, y1 - y0], "cells": cells})
+            items.append((y0, x0, md))
+        if blocks:
+            out["pages_blocks"].append({"page": pno, "page_w": page.rect.width, "page_h": page.rect.height, "blocks": blocks})
+        rects = [fitz.Rect(t.bbox) for t in tables]
+        for b in page.get_text("blocks"):
+            bx0, by0, bx1, by1, text = b[:5]
+            centre = fitz.Point((bx0 + bx1) / 2, (by0 + by1) / 2)
+            if b[6] == 0 and text.strip() and not any(centre in r for r in rects):
+                items.append((by0, bx0, text.strip()))
+        parts.append("\n\n".join(text for _, _, text in sorted(items, key=lambda i: (i[0], i[1]))))
+    out["markdown"] = "\n\n".join(parts).strip() or "(empty)"
+    return out
+
+def find_table_regions(data: bytes) -> Dict[int, List[List[float]]]:
+    """Pages (1-based) whose text layer holds a table, with page-relative
+    ``[x0, y0, x1, y1]`` table areas from PyMuPDF's table finder (the whole
+    page when it finds none)."""
+    import fitz
+    regions: Dict[int, List[List[float]]] = {}
+    doc = fitz.open(stream=data, filetype="pdf")
     for pno, page in enumerate(doc, start=1):
-        words = page.get_text("words")  # tuples
-        wlist = []
-        for w in words:
-            x0,y0,x1,y1, word, block_no, line_no, word_no = w
-            wlist.append({"text": word, "bbox":[x0,y0,x1,y1]})
-        pages.append({"page": pno, "page_w": page.rect.width, "page_h": page.rect.height, "words": wlist})
-    log.info("Extracted %d pages of words", len(pages))
-    return pages
+        if not markdown_has_table(page.get_text("text")):
+            continue
+        w, h = page.rect.width, page.rect.height
+        try:
+            found = [t.bbox for t in page.find_tables().tables]
+        except Exception:  # older PyMuPDF or unparsable page
+            found = []
+        regions[pno] = [[x0 / w, y0 / h, x1 / w, y1 / h] for x0, y0, x1, y1 in found] or [[0.0, 0.0, 1.0, 1.0]]
+    return regions
+
+def render_regions(data: bytes, regions: Dict[int, List[List[float]]], dpi: int = 200) -> List[Dict[str, Any]]:
+    """PNG crops of page-relative regions, for OCR of just those areas."""
+    import fitz
+    out = []
+    doc = fitz.open(stream=data, filetype="pdf")
+    for pno, boxes in sorted(regions.items()):
+        page = doc[pno - 1]
+        w, h = page.rect.width, page.rect.height
+        for k, (x0, y0, x1, y1) in enumerate(boxes):
+            pix = page.get_pixmap(dpi=dpi, clip=fitz.Rect(x0 * w, y0 * h, x1 * w, y1 * h))
+            pix.set_dpi(dpi, dpi)
+            out.append({"page": pno, "region": [x0, y0, x1, y1], "name": f"p{pno}_table{k}.png", "png": pix.tobytes("png")})
+    return out
+
+def _ocr_word_tokens(block: Dict[str, Any], page: int, to_page) -> List[Dict[str, Any]]:
+    # OCR gives line boxes; words get a share of the width proportional to their length
+    words = (block.get("text") or "").split()
+    if not words:
+        return []
+    x, y, bw, bh = block.get("bbox", [0, 0, 0, 0])
+    total = sum(len(t) for t in words) + len(words) - 1
+    out, pos = [], 0
+    for t in words:
+        x0, y0 = to_page(x + bw * pos / total, y)
+        x1, y1 = to_page(x + bw * (pos + len(t)) / total, y + bh)
+        out.append({"text": t, "page": page, "bbox": [x0, y0, x1, y1], "line_id": None, "source": "ocr"})
+        pos += len(t) + 1
+    return out
+
+def merge_region_ocr(tokens: TokenTable, crops: List[Dict[str, Any]],
+                     results: List[List[Dict[str, Any]]]) -> tuple:
+    """Combine OCR of table regions with the text layer.
+
+    Returns ``(pages_blocks, tokens)``: OCR blocks per page with page-relative
+    ``[x, y, w, h]`` bboxes, and the text-layer tokens where text-layer tokens
+    inside an OCR'd region are replaced, in place, by that region's OCR words.
+    """
+    if not isinstance(tokens, TokenTable):
+        tokens = TokenTable.from_dicts(tokens)
+    blocks_by_page: Dict[int, List[Dict[str, Any]]] = {}
+    region_words = []
+    for crop, pages in zip(crops, results):
+        rx0, ry0, rx1, ry1 = crop["region"]
+        words = []
+        for pg in pages or []:
+            pw, ph = float(pg.get("page_w", 1.0)) or 1.0, float(pg.get("page_h", 1.0)) or 1.0
+
+            def to_page(px, py, pw=pw, ph=ph):
+                return rx0 + px / pw * (rx1 - rx0), ry0 + py / ph * (ry1 - ry0)
+
+            for b in pg.get("blocks", []):
+                x, y, bw, bh = b.get("bbox", [0, 0, 0, 0])
+                (x0, y0), (x1, y1) = to_page(x, y), to_page(x + bw, y + bh)
+                blocks_by_page.setdefault(crop["page"], []).append({**b, "bbox": [x0, y0, x1 - x0, y1 - y0]})
+                words.extend(_ocr_word_tokens(b, crop["page"], to_page))
+        region_words.append(TokenTable.from_dicts(words))
+
+    # region of every text-layer token (by its centre), -1 = outside all regions
+    cx = (tokens.bbox[:, 0] + tokens.bbox[:, 2]) / 2
+    cy = (tokens.bbox[:, 1] + tokens.bbox[:, 3]) / 2
+    region_of = np.full(len(tokens), -1, np.int64)
+    for i, crop in enumerate(crops):
+        x0, y0, x1, y1 = crop["region"]
+        inside = (region_of < 0) & (tokens.page == crop["page"]) & (cx >= x0) & (cx <= x1) & (cy >= y0) & (cy <= y1)
+        region_of[inside] = i
+    keep = np.flatnonzero(region_of < 0)
+    # each region's words go where its first text-layer token was, or after its page if it had none
+    inserts = []
+    for i, crop in enumerate(crops):
+        hit = np.flatnonzero(region_of == i)
+        if len(hit):
+            inserts.append((int(np.searchsorted(keep, hit[0])), 0, int(hit[0]), i))
+        else:
+            inserts.append((int(np.searchsorted(tokens.page[keep], crop["page"], side="right")), 1, i, i))
+    base = np.cumsum([len(tokens)] + [len(w) for w in region_words])
+    order, at = [], 0
+    for pos, _, _, i in sorted(inserts):
+        order += [keep[at:pos], np.arange(base[i], base[i + 1])]
+        at = pos
+    order.append(keep[at:])
+    regions_by_page: Dict[int, List[List[float]]] = {}
+    for c in crops:
+        regions_by_page.setdefault(c["page"], []).append(c["region"])
+    pages_blocks = [{"page": p, "page_w": 1.0, "page_h": 1.0, "regions": regions_by_page[p], "blocks": blocks_by_page.get(p, [])}
+                    for p in sorted(regions_by_page)]
+    return pages_blocks, TokenTable.concat([tokens] + region_words).take(np.concatenate(order))
 
 async def parse_with_ocr_async(data: bytes, filename: str, pages: Optional[list]=None):
     """Async call to DocTR service."""
@@ -11,16 +11,24 @@ class EphemeralIndex:
         self.log = get_logger(__name__)
         self.log.info("Building ephemeral index for %d chunks", len(chunks))
         self.vecs = embed_texts([c["text"] for c in chunks])
+        self._mat = None
 
-    def search(self, query: str, topk: int = 5) -> List[Tuple[int, float]]:
+    def _matrix(self):
+        if self._mat is None:
+            mat = np.asarray(self.vecs, dtype=float).reshape(len(self.vecs), -1)
+            self._mat = (mat, np.linalg.norm(mat, axis=1) + 1e-9)
+        return self._mat
+
+    def search(self, query: str, topk: int = 5, query_vec=None) -> List[Tuple[int, float]]:
+        """Rank chunks against ``query``; pass ``query_vec`` to reuse a precomputed embedding."""
         self.log.info("Searching index with query: %s", query)
-        qv = embed_texts([query])[0]
-        sims = []
-        for i, v in enumerate(self.vecs):
-            s = _cosine(qv, v)
-            sims.append((i, float(s)))
-        sims.sort(key=lambda x: x[1], reverse=True)
-        return sims[:topk]
+        if not len(self.vecs):
+            return []
+        qv = np.asarray(query_vec if query_vec is not None else embed_texts([query])[0], dtype=float)
+        mat, norms = self._matrix()
+        sims = mat @ qv / (norms * (np.linalg.norm(qv) + 1e-9))
+        order = np.argsort(-sims, kind="stable")[:topk]
+        return [(int(i), float(sims[i])) for i in order]
 
 def _cosine(a, b):
     a = np.asarray(a, dtype=float)
@@ -9,21 +9,22 @@ def _norm(s: str) -> str:
     s = re.sub(r"\s+", " ", s)
     return s
 
-def _similar(a: str, b: str) -> float:
-    return SequenceMatcher(None, a, b).ratio()
+def _similar_at_least(a: str, b: str, min_ratio: float) -> bool:
+    # real_quick_ratio/quick_ratio are upper bounds of ratio(), so they only skip hopeless pairs
+    sm = SequenceMatcher(None, a, b)
+    return sm.real_quick_ratio() >= min_ratio and sm.quick_ratio() >= min_ratio and sm.ratio() >= min_ratio
 
 def map_bboxes_to_fields(fields_map: Dict[str, Dict[str, Any]], tokens: List[Dict[str, Any]], min_ratio: float = 0.82) -> Dict[str, Dict[str, Any]]:
-    cell_tokens = [t for t in tokens if t.get("category") == "cell" and isinstance(t.get("text"), str) and t["text"].strip()]
+    """Attach ``locations`` of the matching cell tokens (``category == "cell"``) to each field."""
+    cells = [(_norm(t["text"]), t) for t in tokens
+             if t.get("category") == "cell" and isinstance(t.get("text"), str) and t["text"].strip()]
     for fname, fobj in (fields_map or {}).items():
         val = _norm(str(fobj.get("value", "")))
         if not val:
             continue
         locs = []
-        for t in cell_tokens:
-            txt = _norm(t.get("text", ""))
-            if not txt:
-                continue
-            if val == txt or (len(val) > 3 and _similar(val, txt) >= min_ratio) or (val in txt) or (txt in val and len(txt) > 3):
+        for txt, t in cells:
+            if val == txt or (val in txt) or (txt in val and len(txt) > 3) or (len(val) > 3 and _similar_at_least(val, txt, min_ratio)):
                 locs.append({"bbox": t["bbox"], "page_index": t["page_index"]})
         if locs:
             fobj["locations"] = locs
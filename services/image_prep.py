@@ -0,0 +1,54 @@
+# services/image_prep.py
+from __future__ import annotations
+import io
+from typing import Optional, Tuple
+
+# long side of the page assumed when an image carries no usable DPI (A4 portrait, inches)
+ASSUMED_PAGE_INCHES = 11.69
+
+
+def effective_dpi(size: Tuple[int, int], meta_dpi: Optional[tuple] = None) -> float:
+    """DPI of a page image: from its metadata when plausible, else assuming the
+    long side spans an A4 page (phone photos carry a meaningless 72 dpi)."""
+    if meta_dpi:
+        try:
+            dpi = float(max(meta_dpi))
+        except (TypeError, ValueError):
+            dpi = 0.0
+        if 100.0 <= dpi <= 2400.0:
+            return dpi
+    return max(size) / ASSUMED_PAGE_INCHES
+
+
+def prepare_image(data: bytes, target_dpi: float, max_pixels: int = 0):
+    """Decode an image for OCR at roughly ``target_dpi``.
+
+    Returns ``(rgb_array, (orig_w, orig_h), scale)``; ``scale`` is output/original
+    size, so relative OCR geometry maps back onto the original pixels. JPEGs are
+    decoded at reduced size directly by the codec (DCT scaling).
+    """
+    import numpy as np
+    from PIL import Image, ImageOps
+
+    img = Image.open(io.BytesIO(data))
+    orig = img.size
+    # EXIF orientation swaps the axes of phone photos
+    transposed = (img.getexif() or {}).get(0x0112, 1) in (5, 6, 7, 8)
+    up_w, up_h = (orig[1], orig[0]) if transposed else orig
+    scale = 1.0
+    if target_dpi > 0:
+        scale = min(1.0, target_dpi / effective_dpi((up_w, up_h), img.info.get("dpi")))
+    if max_pixels > 0:
+        scale = min(scale, (max_pixels / float(up_w * up_h)) ** 0.5)
+    if scale < 0.95:
+        target = (max(1, round(orig[0] * scale)), max(1, round(orig[1] * scale)))
+        if img.format == "JPEG":
+            img.draft("RGB", target)  # decodes at 1/2, 1/4 or 1/8 size, never below target
+        img = ImageOps.exif_transpose(img).convert("RGB")
+        out = (target[1], target[0]) if transposed else target
+        if img.size != out:
+            img = img.resize(out, Image.Resampling.LANCZOS, reducing_gap=3.0)
+    else:
+        scale = 1.0
+        img = ImageOps.exif_transpose(img).convert("RGB")
+    return np.asarray(img), (up_w, up_h), scale
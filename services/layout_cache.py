@@ -0,0 +1,145 @@
+# services/layout_cache.py — layout fingerprints of known documents and the field positions learned on them
+from __future__ import annotations
+import hashlib, re, threading
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional, Tuple
+
+import numpy as np
+
+import metrics
+from token_table import TokenTable
+
+# positions of fingerprint words are snapped to a FP_GRID x FP_GRID grid of the page
+FP_GRID = 40
+# a known layout keeps at least this many words after being narrowed to the ones its documents share
+MIN_STABLE = 8
+_WORD = re.compile(r"[^\W\d_]{3,}")
+
+
+def _kind(value: str) -> str:
+    """``number`` / ``text`` / ``mixed``: what a value of a field must look like to be reused."""
+    digits = any(c.isdigit() for c in value)
+    letters = any(c.isalpha() for c in value)
+    return "mixed" if digits and letters else ("number" if digits else "text")
+
+
+def fingerprint(tokens: TokenTable) -> set:
+    """Hashes of (word, grid cell) for the digit-free words of page 1.
+
+    Headings, labels and the vendor's own details sit at the same place on every
+    document of a layout; amounts, numbers and dates are left out.
+    """
+    out = set()
+    if not len(tokens):
+        return out
+    first = int(tokens.page.min())
+    cells = np.floor(tokens.bbox[:, :2] * FP_GRID).astype(np.int32).tolist()
+    for i, (text, page) in enumerate(zip(tokens.texts(), tokens.page.tolist())):
+        if page == first and _WORD.fullmatch(text.strip(".,:;()")):
+            out.add(hash((text.lower(), cells[i][0], cells[i][1])))
+    return out
+
+
+class LayoutCache:
+    """Known layouts per template, bounded by entry count (LRU).
+
+    An entry is the fingerprint of a layout and, per field, the page and bbox
+    its value was found at. A document matches the entry containing the largest
+    share of whose fingerprint it also has (at least ``min_match``); on a match
+    the entry is narrowed to the words both share, so text that varies between
+    documents of the same layout drops out of it.
+    """
+
+    def __init__(self, max_entries: int = 512, min_match: float = 0.8):
+        self.max_entries = max(0, int(max_entries))
+        self.min_match = float(min_match)
+        self._data: "OrderedDict[str, Dict[str, Any]]" = OrderedDict()
+        self.lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+    def match(self, template: tuple, fp: set) -> Tuple[Optional[str], float]:
+        """Id and score of the best entry for ``fp`` under ``template``; counts a hit or a miss."""
+        if not self.max_entries:
+            return None, 0.0
+        best, score = None, 0.0
+        with self.lock:
+            for key, e in self._data.items():
+                if e["template"] != template:
+                    continue
+                s = len(fp & e["fp"]) / len(e["fp"])
+                if s > score:
+                    best, score = key, s
+            if best is not None and score >= self.min_match:
+                self._data.move_to_end(best)
+                metrics.layout_cache_lookups_total.labels(outcome="hit").inc()
+                return best, score
+        metrics.layout_cache_lookups_total.labels(outcome="miss").inc()
+        return None, score
+
+    def read(self, key: str, tokens: TokenTable, score: float) -> Dict[str, Dict[str, Any]]:
+        """Field results read at the learned positions of entry ``key``.
+
+        A field is left out when nothing is there or when what is there does
+        not look like the value learned (a number where text was, ...).
+        """
+        with self.lock:
+            e = self._data.get(key)
+            fields = dict(e["fields"]) if e else {}
+            stable = e["fp"] if e else set()
+        if not fields:
+            return {}
+        texts = tokens.texts()
+        cx = (tokens.bbox[:, 0] + tokens.bbox[:, 2]) / 2
+        cy = (tokens.bbox[:, 1] + tokens.bbox[:, 3]) / 2
+        cells = np.floor(tokens.bbox[:, :2] * FP_GRID).astype(np.int32).tolist()
+        out = {}
+        for field, pos in fields.items():
+            x0, y0, x1, y1 = pos["bbox"]
+            # values grow sideways (longer amounts, names), much less up or down
+            pad_x, pad_y = max(0.5 * (x1 - x0), 0.02), 0.25 * (y1 - y0)
+            near = (tokens.page == pos["page"]) & (cx >= x0 - pad_x) & (cx <= x1 + pad_x) & (cy >= y0 - pad_y) & (cy <= y1 + pad_y)
+            core = (cx >= x0) & (cx <= x1) & (cy >= y0) & (cy <= y1)
+            idx = [i for i in np.flatnonzero(near).tolist()
+                   if core[i] or hash((texts[i].lower(), cells[i][0], cells[i][1])) not in stable]
+            value = " ".join(texts[i] for i in idx).strip()
+            if not value or _kind(value) != pos["kind"]:
+                continue
+            out[field] = {"key": field, "value": value, "confidence": round(score, 4),
+                          "bboxes": tokens.bbox[idx].tolist(), "bbox_pages": tokens.page[idx].tolist()}
+        return out
+
+    def learn(self, template: tuple, fp: set, key: Optional[str], results: List[Dict[str, Any]],
+              min_confidence: float = 0.8, forget: tuple = ()) -> Optional[str]:
+        """Store the positions of the confident ``results`` under entry ``key``
+        (a new one when ``None``) and drop the fields in ``forget``."""
+        if not self.max_entries or len(fp) < MIN_STABLE:
+            return None
+        learned = {}
+        for r in results:
+            pages = set(r.get("bbox_pages") or [])
+            if not r.get("value") or float(r.get("confidence") or 0.0) < min_confidence or len(pages) != 1:
+                continue
+            b = np.asarray(r["bboxes"], dtype=np.float32)
+            learned[r["key"]] = {"page": pages.pop(), "kind": _kind(str(r["value"])),
+                                 "bbox": [float(b[:, 0].min()), float(b[:, 1].min()), float(b[:, 2].max()), float(b[:, 3].max())]}
+        with self.lock:
+            e = self._data.get(key) if key else None
+            if e is None:
+                if not learned:
+                    return None
+                key = hashlib.sha1(repr(sorted(fp)).encode()).hexdigest()[:16]
+                e = self._data.setdefault(key, {"template": template, "fp": fp, "fields": {}})
+            elif len(fp & e["fp"]) >= MIN_STABLE:
+                e["fp"] = fp & e["fp"]
+            for f in forget:
+                e["fields"].pop(f, None)
+            for f, pos in learned.items():
+                e["fields"].setdefault(f, pos)
+            self._data.move_to_end(key)
+            while len(self._data) > self.max_entries:
+                self._data.popitem(last=False)
+                metrics.layout_cache_evictions_total.inc()
+            metrics.layout_cache_entries.set(len(self._data))
+        return key
@@ -0,0 +1,155 @@
+# services/spatial.py — per-page grid index over token bboxes and label -> value lookup
+from __future__ import annotations
+import re
+from typing import Dict, Iterable, List, Optional, Sequence, Tuple
+
+from token_table import TokenTable
+
+# cells per page side; bboxes are page-relative, so a cell is 1/GRID of the page
+GRID = 32
+_PUNCT = re.compile(r"^[^\w]+|[^\w]+$")
+
+
+def _norm(s: str) -> str:
+    return _PUNCT.sub("", s.lower())
+
+
+def _overlap(a0: float, a1: float, b0: float, b1: float) -> float:
+    """Overlap of two intervals as a fraction of the shorter one."""
+    inter = min(a1, b1) - max(a0, b0)
+    return max(0.0, inter) / max(1e-9, min(a1 - a0, b1 - b0))
+
+
+class SpatialIndex:
+    """Uniform grid per page over the bboxes of a ``TokenTable``.
+
+    Each token is registered in every cell its bbox touches; neighbour queries
+    only look at the cells of the band to the right of / below a token.
+    """
+
+    def __init__(self, tokens: TokenTable, grid: int = GRID):
+        self.tokens, self.grid = tokens, grid
+        self.box = tokens.bbox.tolist()
+        self.page = tokens.page.tolist()
+        self.cells: Dict[Tuple[int, int, int], List[int]] = {}
+        for i, (x0, y0, x1, y1) in enumerate(self.box):
+            for cy in range(self._cell(y0), self._cell(y1) + 1):
+                for cx in range(self._cell(x0), self._cell(x1) + 1):
+                    self.cells.setdefault((self.page[i], cy, cx), []).append(i)
+
+    def _cell(self, v: float) -> int:
+        return min(self.grid - 1, max(0, int(v * self.grid)))
+
+    def _scan(self, page: int, rows: Iterable[int], cols: Iterable[int]) -> set:
+        cols = list(cols)
+        found = set()
+        for cy in rows:
+            for cx in cols:
+                found.update(self.cells.get((page, cy, cx), ()))
+        return found
+
+    def right_of(self, i: int, max_dx: float, min_overlap: float = 0.5) -> List[int]:
+        """Tokens on the same line as ``i`` starting within ``max_dx`` to its right, nearest first."""
+        x0, y0, x1, y1 = self.box[i]
+        cand = self._scan(self.page[i], range(self._cell(y0), self._cell(y1) + 1),
+                          range(self._cell(x1), self._cell(x1 + max_dx) + 1))
+        out = [j for j in cand if j != i and x1 - 1e-4 <= self.box[j][0] <= x1 + max_dx
+               and _overlap(y0, y1, self.box[j][1], self.box[j][3]) >= min_overlap]
+        return sorted(out, key=lambda j: self.box[j][0])
+
+    def below(self, i: int, max_dy: float, min_overlap: float = 0.3) -> List[int]:
+        """Tokens below ``i`` within ``max_dy`` whose x-range overlaps it, nearest first."""
+        x0, y0, x1, y1 = self.box[i]
+        cand = self._scan(self.page[i], range(self._cell(y1), self._cell(y1 + max_dy) + 1),
+                          range(self._cell(x0), self._cell(x1) + 1))
+        out = [j for j in cand if j != i and y1 - 1e-4 <= self.box[j][1] <= y1 + max_dy
+               and _overlap(x0, x1, self.box[j][0], self.box[j][2]) >= min_overlap]
+        return sorted(out, key=lambda j: (self.box[j][1], self.box[j][0]))
+
+
+def _find_labels(idx: SpatialIndex, texts: Sequence[str], label: str) -> List[List[int]]:
+    """Token runs spelling ``label`` word by word along a line."""
+    words = [w for w in (_norm(t) for t in label.split()) if w]
+    if not words:
+        return []
+    hits = []
+    for i, t in enumerate(texts):
+        if t != words[0]:
+            continue
+        run = [i]
+        for w in words[1:]:
+            h = idx.box[run[-1]][3] - idx.box[run[-1]][1]
+            nxt = idx.right_of(run[-1], 2 * h)
+            if not nxt or texts[nxt[0]] != w:
+                break
+            run.append(nxt[0])
+        if len(run) == len(words):
+            hits.append(run)
+    return hits
+
+
+def _line_from(idx: SpatialIndex, texts: Sequence[str], start: int, max_words: int, max_gap: float, stop: set) -> List[int]:
+    """Words following ``start`` on its line, up to a wide gap or the start of another label."""
+    line = [start]
+    while len(line) < max_words:
+        nxt = idx.right_of(line[-1], max_gap)
+        if not nxt or texts[nxt[0]] in stop:
+            break
+        line.append(nxt[0])
+    while line and not texts[line[0]]:  # a separate ":" after the label
+        line.pop(0)
+    return line
+
+
+def _value_near(idx: SpatialIndex, texts: Sequence[str], run: List[int], direction: str, max_words: int,
+                stop: set) -> Optional[Tuple[List[int], float]]:
+    """Value tokens next to a label run and how plausible the placement is (0..1)."""
+    last = run[-1]
+    x0, y0, x1, y1 = idx.box[last]
+    h = max(1e-4, y1 - y0)
+    if direction in ("right", "auto"):
+        nxt = idx.right_of(last, 12 * h)
+        if nxt and texts[nxt[0]] not in stop:
+            j = nxt[0]
+            gap = idx.box[j][0] - x1
+            overlap = _overlap(y0, y1, idx.box[j][1], idx.box[j][3])
+            return _line_from(idx, texts, j, max_words, 2 * h, stop), (1.0 - 0.5 * min(1.0, gap / (12 * h))) * (0.5 + 0.5 * overlap)
+    if direction in ("below", "auto"):
+        first = idx.box[run[0]]
+        for j in idx.below(last, 3 * h):
+            dy = idx.box[j][1] - y1
+            overlap = _overlap(first[0], x1, idx.box[j][0], idx.box[j][2])
+            return _line_from(idx, texts, j, max_words, 2 * h, stop), (1.0 - 0.5 * min(1.0, dy / (3 * h))) * (0.5 + 0.5 * overlap)
+    return None
+
+
+def extract_by_labels(tokens: TokenTable, rules: Dict[str, dict], index: Optional[SpatialIndex] = None) -> Dict[str, dict]:
+    """Resolve fields from the tokens next to their printed labels.
+
+    ``rules`` maps a field to ``{"labels": [...], "direction": "right|below|auto",
+    "max_words": n}``. Returns, per field found, ``{"value", "confidence",
+    "tokens"}`` (token indices); a label printed more than once with different
+    values around it divides the confidence by the number of distinct values.
+    """
+    if not len(tokens) or not rules:
+        return {}
+    idx = index or SpatialIndex(tokens)
+    texts = [_norm(t) for t in tokens.texts()]
+    raw = tokens.texts()
+    stop = {_norm(label.split()[0]) for rule in rules.values() for label in rule.get("labels", []) if label.split()}
+    out: Dict[str, dict] = {}
+    for field, rule in rules.items():
+        found: Dict[str, Tuple[float, List[int]]] = {}
+        for label in rule.get("labels", []):
+            for run in _find_labels(idx, texts, label):
+                hit = _value_near(idx, texts, run, rule.get("direction", "auto"), int(rule.get("max_words", 6)), stop)
+                if hit is None:
+                    continue
+                value_idx, score = hit
+                value = " ".join(raw[j] for j in value_idx).strip()
+                if value and score > found.get(value, (0.0, None))[0]:
+                    found[value] = (score, value_idx)
+        if found:
+            value, (score, value_idx) = max(found.items(), key=lambda kv: kv[1][0])
+            out[field] = {"value": value, "confidence": round(score / len(found), 4), "tokens": value_idx}
+    return out
@@ -0,0 +1,127 @@
+# services/typed_fields.py — regex / typed field extractors with validators, run before the LLM
+from __future__ import annotations
+import re
+from datetime import date
+from typing import Callable, Dict, List, Optional, Tuple
+
+# type -> (pattern, normalize: matched text -> value or None when it fails validation)
+BUILTINS: Dict[str, Tuple[str, Callable[[str], Optional[str]]]] = {}
+
+
+def _builtin(name: str, pattern: str):
+    def register(fn):
+        BUILTINS[name] = (pattern, fn)
+        return fn
+    return register
+
+
+# IBAN lengths of the usual countries; a match may run into the next word ("... 456 BIC")
+IBAN_LENGTHS = {"IT": 27, "SM": 27, "FR": 27, "MC": 27, "DE": 22, "GB": 22, "IE": 22, "ES": 24, "PT": 25,
+                "NL": 18, "BE": 16, "LU": 20, "AT": 20, "CH": 21, "SI": 19, "HR": 21, "PL": 28, "GR": 27}
+
+
+def _mod97(s: str) -> bool:
+    return int("".join(str(int(c, 36)) for c in s[4:] + s[:4])) % 97 == 1
+
+
+@_builtin("iban", r"\b[A-Z]{2}\d{2}(?: ?[A-Z0-9]){11,30}\b")
+def _iban(s: str) -> Optional[str]:
+    s = s.replace(" ", "").upper()
+    n = IBAN_LENGTHS.get(s[:2])
+    if n:
+        return s[:n] if len(s) >= n and _mod97(s[:n]) else None
+    return s if 15 <= len(s) <= 34 and _mod97(s) else None
+
+
+@_builtin("vat", r"\b(?:IT ?)?\d{11}\b")
+def _vat(s: str) -> Optional[str]:
+    """Italian partita IVA (11 digits, Luhn-style check digit)."""
+    d = [int(c) for c in s[-11:]]
+    total = sum(d[0:10:2]) + sum((2 * x) - 9 if x > 4 else 2 * x for x in d[1:10:2])
+    return s[-11:] if (10 - total % 10) % 10 == d[10] else None
+
+
+@_builtin("date", r"\b(?:\d{1,2}[/.-]\d{1,2}[/.-]\d{4}|\d{4}-\d{2}-\d{2})\b")
+def _date(s: str) -> Optional[str]:
+    """ISO ``YYYY-MM-DD``; day-first unless the year comes first."""
+    parts = [int(p) for p in re.split(r"[/.-]", s)]
+    y, m, d = parts if parts[0] > 31 else parts[::-1]
+    try:
+        return date(y, m, d).isoformat()
+    except ValueError:
+        return None
+
+
+@_builtin("amount", r"(?<![\d.,])\d{1,3}(?:\.\d{3})+,\d{2}(?![\d,])|(?<![\d.,])\d+,\d{2}(?![\d,])")
+def _amount(s: str) -> Optional[str]:
+    """Italian-formatted amount (``1.464,00``), returned as printed."""
+    return s
+
+
+class TypedField:
+    """A compiled extractor: a built-in ``type`` or a ``pattern`` (first group if any),
+    optionally only on lines mentioning one of ``near``."""
+
+    def __init__(self, type: str = "regex", pattern: Optional[str] = None, near: Optional[List[str]] = None):
+        if type == "regex":
+            if not pattern:
+                raise ValueError("a regex extractor needs a pattern")
+            self.normalize: Callable[[str], Optional[str]] = lambda s: s
+        elif type in BUILTINS:
+            builtin, self.normalize = BUILTINS[type]
+            pattern = pattern or builtin
+        else:
+            raise ValueError(f"unknown extractor type {type!r}")
+        self.type, self.pattern = type, pattern
+        self.rx = re.compile(pattern)
+        self.near = [n.lower() for n in near or []]
+
+
+def scan(markdown: str, extractors: Dict[str, TypedField]) -> Dict[str, dict]:
+    """Validated matches per field: ``{field: {"value", "text", "values"}}``.
+
+    ``values`` lists the distinct valid values (unambiguous when there is one);
+    ``value`` is the first and ``text`` its span as printed (for token alignment). Each distinct pattern is
+    scanned once, however many fields share it.
+    """
+    by_pattern: Dict[str, List[str]] = {}
+    for field, ex in extractors.items():
+        by_pattern.setdefault(ex.pattern, []).append(field)
+    lower = markdown.lower()
+    out: Dict[str, dict] = {}
+    for fields in by_pattern.values():
+        rx = extractors[fields[0]].rx
+        matches = [(m.start(), m.group(1) if rx.groups else m.group(0)) for m in rx.finditer(markdown)]
+        for field in fields:
+            ex = extractors[field]
+            found: Dict[str, str] = {}
+            for pos, text in matches:
+                if ex.near and not _line_mentions(lower, pos, ex.near):
+                    continue
+                value = ex.normalize(text)
+                if value:
+                    found.setdefault(value, _printed(text, value))
+            if found:
+                value, text = next(iter(found.items()))
+                out[field] = {"value": value, "text": text, "values": list(found)}
+    return out
+
+
+def _printed(text: str, value: str) -> str:
+    """``text`` cut after the characters of ``value`` when the value is a prefix of it (spaces aside)."""
+    compact = value.replace(" ", "")
+    if len(compact) >= len(text.replace(" ", "")) or not text.replace(" ", "").upper().startswith(compact.upper()):
+        return text
+    seen = 0
+    for i, c in enumerate(text):
+        seen += c != " "
+        if seen == len(compact):
+            return text[:i + 1]
+    return text
+
+
+def _line_mentions(lower: str, pos: int, words: List[str]) -> bool:
+    start = lower.rfind("\n", 0, pos) + 1
+    end = lower.find("\n", pos)
+    line = lower[start:end if end >= 0 else len(lower)]
+    return any(w in line for w in words)
@@ -0,0 +1,70 @@
+import os, json
+import pytest
+from fastapi.testclient import TestClient
+import main, jobs, admission
+from _pdfutils import make_pdf_text
+
+API = {"x-api-key": os.environ["API_KEY"]}
+TPL = json.dumps({"name": "adm", "fields": ["iban"], "llm_text": "estrai"})
+
+class Clock:
+    t = 100.0
+    def __call__(self):
+        return self.t
+
+def test_caps_reject_with_retry_after():
+    ctl = admission.AdmissionController(max_docs=1, max_pages=10)
+    with ctl.admit("/extract", "k", 3):
+        with pytest.raises(admission.Overloaded) as e:
+            with ctl.admit("/extract", "k", 1):
+                pass
+        assert e.value.reason == "max_docs" and e.value.retry_after >= 1
+    assert ctl.docs == 0 and ctl.pages == 0
+    ctl.max_docs = 5
+    with ctl.admit("/extract", None, 50):  # a lone large document is admitted
+        with pytest.raises(admission.Overloaded) as e:
+            ctl.check("/extract", None, 1)
+        assert e.value.reason == "max_pages"
+
+def test_slo_uses_recent_throughput(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(admission.time, "monotonic", clock)
+    ctl = admission.AdmissionController(max_docs=10, max_pages=100, slo_ms=5000)
+    with ctl.admit("/extract", "k", 10):
+        clock.t += 10.0  # 10 pages in 10 s of busy time -> 1 page/s
+    clock.t += 30.0  # idle time doesn't dilute the rate
+    assert ctl.pages_per_s() == pytest.approx(1.0)
+    with ctl.admit("/extract", "k", 4):
+        assert ctl.estimate_ms(1) == pytest.approx(5000)
+        with pytest.raises(admission.Overloaded) as e:
+            ctl.check("/extract", "k", 3)
+    assert e.value.reason == "slo" and e.value.retry_after == 2
+
+def test_endpoints_answer_429_and_count_per_key(monkeypatch):
+    monkeypatch.setattr(main, "admission_ctl", admission.AdmissionController(max_docs=0))
+    c = TestClient(main.app)
+    files = {"file": ("a.pdf", make_pdf_text(2, "IBAN IT00"), "application/pdf")}
+    r = c.post("/extract", headers=API, files=files, data={"template": TPL})
+    assert r.status_code == 429 and int(r.headers["Retry-After"]) >= 1
+    assert r.json()["reason"] == "max_docs"
+    label = admission.key_label(API["x-api-key"])
+    assert API["x-api-key"] not in label
+    text = c.get("/metrics").text
+    assert f'admission_rejected_total{{api_key="{label}",endpoint="/extract",reason="max_docs"}}' in text
+
+def test_jobs_are_admitted_up_to_queue_capacity(monkeypatch):
+    # workers paused: nothing leaves the queue, and the in-flight caps don't apply to it
+    monkeypatch.setattr(jobs, "global_q", jobs.JobQueue(maxsize=20))
+    monkeypatch.setattr(main, "admission_ctl", admission.AdmissionController(max_docs=1, max_pages=1))
+    c = TestClient(main.app)
+    files = {"file": ("a.pdf", make_pdf_text(2, "IBAN IT00"), "application/pdf")}
+    codes = [c.post("/jobs", headers=API, files=files, data={"template": TPL}).status_code for _ in range(21)]
+    assert codes == [200] * 20 + [429] and jobs.global_q.depth() == 20
+
+def test_full_job_queue_is_429(monkeypatch):
+    def _full(*a, **k):
+        raise jobs.QueueFull("QueueFull")
+    monkeypatch.setattr(jobs.global_q, "submit", _full)
+    r = TestClient(main.app).post("/jobs", headers=API, files={"file": ("a.pdf", make_pdf_text(1, "x"), "application/pdf")},
+                                  data={"template": TPL})
+    assert r.status_code == 429 and r.json()["reason"] == "queue_full" and "Retry-After" in r.headers
@@ -0,0 +1,27 @@
+import asyncio
+import fitz
+from bench.synth import make_document
+from bench.run import build_corpus, run_benchmark, compare, DEFAULT_TEMPLATE
+
+def test_synthetic_kinds_have_expected_text_layers():
+    layers = {}
+    for kind in ("digital", "scanned", "mixed"):
+        doc = fitz.open(stream=make_document(kind, 2), filetype="pdf")
+        layers[kind] = [bool(p.get_text().strip()) for p in doc]
+    assert layers == {"digital": [True, True], "scanned": [False, False], "mixed": [True, False]}
+
+def test_run_benchmark_reports_throughput_and_stages():
+    docs = build_corpus(["digital", "scanned"], [2])
+    res = asyncio.run(run_benchmark(docs, DEFAULT_TEMPLATE, concurrency=2))
+    assert res["errors"] == [] and res["docs"] == 2 and res["pages"] == 4
+    assert res["latency_ms"]["n"] == 2 and res["docs_per_s"] > 0 and res["peak_rss_mb"] > 0
+    assert {"words", "ocr", "llm", "persistence"} <= set(res["stages_ms"])
+
+def test_compare_flags_regressions_only_beyond_threshold():
+    base = {"latency_ms": {"p95": 100.0}, "stages_ms": {"ocr": {"p95": 50.0}}, "docs_per_s": 10.0, "pages_per_s": 20.0, "peak_rss_mb": 100}
+    same = {"latency_ms": {"p95": 105.0}, "stages_ms": {"ocr": {"p95": 52.0}}, "docs_per_s": 9.5, "pages_per_s": 20.0, "peak_rss_mb": 105}
+    assert compare(same, base, threshold=0.1) == []
+    slow = {"latency_ms": {"p95": 150.0}, "stages_ms": {"ocr": {"p95": 90.0}}, "docs_per_s": 6.0, "pages_per_s": 20.0, "peak_rss_mb": 100}
+    regs = compare(slow, base, threshold=0.1)
+    assert any(r.startswith("latency") for r in regs) and any("stage ocr" in r for r in regs)
+    assert any(r.startswith("docs_per_s") for r in regs)
@@ -0,0 +1,94 @@
+import os, json, asyncio
+import httpx
+import main, metrics
+from _pdfutils import make_pdf_text
+
+API = {"x-api-key": os.environ["API_KEY"]}
+TPL = {"name": "dedup", "fields": ["iban"], "llm_text": "estrai"}
+
+def _coalesced(endpoint):
+    return metrics.requests_coalesced_total.labels(endpoint=endpoint)._value.get()
+
+def _post_concurrently(monkeypatch, templates):
+    monkeypatch.setenv("MOCK_LLM", "1")
+    calls = []
+    original = main._process_request
+
+    async def slow_process(data, filename, tpl_json, req_id, **kw):
+        calls.append(req_id)
+        await asyncio.sleep(0.2)
+        return await original(data, filename, tpl_json, req_id, **kw)
+
+    monkeypatch.setattr(main, "_process_request", slow_process)
+    pdf = make_pdf_text(1, "IBAN IT00")
+
+    async def run():
+        transport = httpx.ASGITransport(app=main.app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://t") as c:
+            rs = await asyncio.gather(*(
+                c.post("/extract", headers=API, files={"file": ("inv.pdf", pdf, "application/pdf")},
+                       data={"template": json.dumps(t)})
+                for t in templates))
+            reps = [await c.get(f"/reports/{r.json()['request_id']}", headers=API) for r in rs]
+        return rs, reps
+
+    return calls, asyncio.run(run())
+
+def test_identical_concurrent_requests_share_one_computation(monkeypatch):
+    before = _coalesced("/extract")
+    calls, (rs, reps) = _post_concurrently(monkeypatch, [TPL, TPL, TPL])
+    assert len(calls) == 1
+    assert all(r.status_code == 200 for r in rs)
+    ids = [r.json()["request_id"] for r in rs]
+    assert len(set(ids)) == 3
+    assert [r.json()["fields"] for r in rs].count(rs[0].json()["fields"]) == 3
+    assert all(rep.status_code == 200 for rep in reps)
+    followers = [rep.json() for rep in reps if "coalesced_with" in rep.json()["manifest"]]
+    assert len(followers) == 2 and all(f["manifest"]["coalesced_with"] == calls[0] for f in followers)
+    assert _coalesced("/extract") - before == 2
+    assert not main._inflight
+
+def test_leader_and_followers_share_the_reports_dir(monkeypatch, tmp_path):
+    # the env var is only read once, by config: a later change must not split the bundles
+    monkeypatch.setenv("REPORTS_DIR", str(tmp_path / "elsewhere"))
+    calls, (rs, reps) = _post_concurrently(monkeypatch, [TPL, TPL])
+    assert len(calls) == 1 and all(rep.status_code == 200 for rep in reps)
+    for rep in reps:
+        paths = list(rep.json()["artifacts"].values())
+        assert paths and all(p.startswith(main.REPORTS_DIR) and os.path.exists(p) for p in paths)
+    assert not (tmp_path / "elsewhere").exists()
+
+def test_different_templates_are_not_coalesced(monkeypatch):
+    calls, (rs, _) = _post_concurrently(monkeypatch, [TPL, {**TPL, "fields": ["iban", "totale"]}])
+    assert len(calls) == 2 and all(r.status_code == 200 for r in rs)
+
+def test_cancelled_leader_keeps_its_admission_slot_until_the_work_ends(monkeypatch):
+    import pytest, admission
+    ctl = admission.AdmissionController(max_docs=4, max_pages=100)
+    monkeypatch.setattr(main, "admission_ctl", ctl)
+
+    async def scenario():
+        gate = asyncio.Event()
+
+        async def slow_process(data, filename, tpl_json, req_id, **kw):
+            await gate.wait()
+            return {"request_id": req_id, "fields": {}}
+
+        monkeypatch.setattr(main, "_process_request", slow_process)
+        run = lambda rid: asyncio.ensure_future(main._process_coalesced(
+            "/jobs", ctl.admit("/jobs", None, 3, enforce=False), b"%PDF-cancel", "c.pdf", TPL, rid))
+        leader = run("leader")
+        await asyncio.sleep(0.05)
+        assert (ctl.docs, ctl.pages) == (1, 3)
+        leader.cancel()  # e.g. jobs.global_q.stop()
+        with pytest.raises(asyncio.CancelledError):
+            await leader
+        assert (ctl.docs, ctl.pages) == (1, 3)  # the pipeline is still running
+        follower = run("follower")
+        await asyncio.sleep(0.05)
+        gate.set()
+        res = await follower
+        assert res["request_id"] == "follower"
+        assert (ctl.docs, ctl.pages) == (0, 0) and not main._inflight
+
+    asyncio.run(scenario())
@@ -0,0 +1,36 @@
+import asyncio, threading
+import executors, metrics
+
+def _gauge(g, pool):
+    return g.labels(executor=pool)._value.get()
+
+def test_stages_map_to_named_pools():
+    assert executors.pool_for("ocr") == "ocr"
+    assert executors.pool_for("overlay") == "pdf"
+    assert executors.pool_for("markitdown") == "conversion"
+    assert executors.pool_for("align") == "default"
+    assert executors.get("default") is None
+    assert executors.get("llm") is executors.get("llm") is not executors.get("ocr")
+
+def test_busy_ocr_pool_does_not_starve_llm(monkeypatch):
+    monkeypatch.setattr(executors.config, "OCR_WORKERS", 1)
+    monkeypatch.setattr(executors, "_pools", {})
+    release = threading.Event()
+
+    async def scenario():
+        ocr = [asyncio.ensure_future(executors.run("ocr", release.wait, 5)) for _ in range(2)]
+        await asyncio.sleep(0.05)
+        assert _gauge(metrics.executor_active, "ocr") == 1
+        assert _gauge(metrics.executor_queued, "ocr") == 1
+        name = await asyncio.wait_for(executors.run("llm", lambda: threading.current_thread().name), 1)
+        release.set()
+        await asyncio.gather(*ocr)
+        return name
+
+    try:
+        assert asyncio.run(scenario()).startswith("docflow-llm")
+    finally:
+        release.set()
+        executors.shutdown()
+    assert _gauge(metrics.executor_queued, "ocr") == 0
+    assert _gauge(metrics.executor_max_workers, "ocr") == 1
@@ -0,0 +1,53 @@
+import io, json, os, zipfile
+from fastapi.testclient import TestClient
+import main, clients
+from _pdfutils import make_pdf_text
+
+API = {"x-api-key": os.environ["API_KEY"]}
+
+def _tpl(fields):
+    return {"name": "batch", "fields": fields, "llm_text": "estrai"}
+
+def _lines(r):
+    return [json.loads(l) for l in r.text.splitlines() if l.strip()]
+
+def test_batch_streams_ndjson_per_document():
+    c = TestClient(main.app)
+    files = [("files", (f"d{i}.pdf", make_pdf_text(1, f"Documento {i}"), "application/pdf")) for i in range(3)]
+    r = c.post("/extract/batch", headers=API, files=files, data={"template": json.dumps(_tpl(["iban"]))})
+    assert r.status_code == 200
+    assert r.headers["content-type"].startswith("application/x-ndjson")
+    out = _lines(r)
+    assert sorted(o["index"] for o in out) == [0, 1, 2]
+    assert {o["filename"] for o in out} == {"d0.pdf", "d1.pdf", "d2.pdf"}
+    assert all(o["status"] == "done" and o["template"] == "batch" for o in out)
+    assert len({o["request_id"] for o in out}) == 3
+
+def test_batch_accepts_zip_and_embeds_fields_once(monkeypatch):
+    monkeypatch.setenv("LLM_N_CTX", "256")
+    monkeypatch.setenv("RAG_MIN_SEGMENTS", "1")
+    seen = []
+    def counting_embed(texts):
+        seen.append(list(texts))
+        return [[float(len(t)), 1.0, 0.0] for t in texts]
+    monkeypatch.setattr(clients, "llm_embed", counting_embed)
+    buf = io.BytesIO()
+    with zipfile.ZipFile(buf, "w") as z:
+        for i in range(2):
+            z.writestr(f"in/doc{i}.pdf", make_pdf_text(1, "IBAN IT00\n\n" * 50))
+        z.writestr("__MACOSX/in/._doc0.pdf", b"junk")
+    c = TestClient(main.app)
+    r = c.post("/extract/batch", headers=API,
+               files=[("files", ("docs.zip", buf.getvalue(), "application/zip"))],
+               data={"template": json.dumps(_tpl(["iban", "totale"]))})
+    out = _lines(r)
+    assert sorted(o["filename"] for o in out) == ["doc0.pdf", "doc1.pdf"]
+    # field-name query embeddings computed once for the whole batch
+    assert seen.count(["iban", "totale"]) == 1
+
+def test_batch_bad_template_400():
+    c = TestClient(main.app)
+    r = c.post("/extract/batch", headers=API,
+               files=[("files", ("a.pdf", make_pdf_text(1, "x"), "application/pdf"))],
+               data={"template": json.dumps({"name": "x"})})
+    assert r.status_code == 400
@@ -0,0 +1,95 @@
+import io
+from types import SimpleNamespace
+import pytest
+import numpy as np
+from PIL import Image, JpegImagePlugin
+import clients.doctr_client as dc
+from services.image_prep import prepare_image, effective_dpi
+
+def _jpeg(size, dpi=None, orientation=None):
+    buf = io.BytesIO()
+    img = Image.new("RGB", size, "white")
+    kw = {"dpi": dpi} if dpi else {}
+    if orientation:
+        exif = Image.Exif(); exif[0x0112] = orientation
+        kw["exif"] = exif.tobytes()
+    img.save(buf, format="JPEG", **kw)
+    return buf.getvalue()
+
+def test_effective_dpi_ignores_placeholder_metadata():
+    assert effective_dpi((2480, 3508), (300, 300)) == 300
+    assert round(effective_dpi((3000, 4000), (72, 72))) == 342
+
+def test_phone_photo_is_decoded_small(monkeypatch):
+    opened = []
+    orig_draft = JpegImagePlugin.JpegImageFile.draft
+    def draft(self, mode, size):
+        opened.append(size)
+        return orig_draft(self, mode, size)
+    monkeypatch.setattr(JpegImagePlugin.JpegImageFile, "draft", draft)
+    arr, size, scale = prepare_image(_jpeg((4000, 6000)), target_dpi=150)
+    assert size == (4000, 6000)
+    assert abs(scale - 150 / (6000 / 11.69)) < 1e-6
+    assert arr.shape[:2] == (round(6000 * scale), round(4000 * scale))
+    assert opened  # JPEG DCT-domain reduction was requested
+
+def test_rotated_photo_keeps_upright_coordinates():
+    arr, size, scale = prepare_image(_jpeg((6000, 4000), orientation=6), target_dpi=150)
+    assert size == (4000, 6000) and arr.shape[0] > arr.shape[1]
+
+def test_small_images_are_untouched():
+    arr, size, scale = prepare_image(_jpeg((800, 1100), dpi=(150, 150)), target_dpi=200)
+    assert scale == 1.0 and arr.shape[:2] == (1100, 800)
+
+def test_ocr_bboxes_map_back_to_original_pixels(tmp_path, monkeypatch):
+    monkeypatch.setattr(dc, "OCR_TARGET_DPI", 100.0)
+    seen = []
+    word = SimpleNamespace(value="IBAN")
+    line = SimpleNamespace(words=[word], geometry=((0.25, 0.5), (0.75, 0.6)))
+    page = SimpleNamespace(blocks=[SimpleNamespace(lines=[line])])
+    client = dc.DocTRClient.__new__(dc.DocTRClient)
+    client._threads_set = True
+    client.model = lambda pages: (seen.extend(p.shape for p in pages), [page])[1]
+    path = tmp_path / "photo.jpg"
+    path.write_bytes(_jpeg((3000, 4000)))
+    out = client.extract_pages(str(path))
+    assert seen[0][0] < 4000
+    assert out[0]["page_w"] == 3000.0 and out[0]["page_h"] == 4000.0
+    assert out[0]["blocks"][0]["bbox"] == pytest.approx([750.0, 2000.0, 1500.0, 400.0])
+
+def _word(value, conf, geometry):
+    return SimpleNamespace(value=value, confidence=conf, geometry=geometry)
+
+def test_adaptive_ocr_rerecognizes_only_weak_words(tmp_path, monkeypatch):
+    from _pdfutils import make_pdf_text
+    monkeypatch.setattr(dc, "OCR_ADAPTIVE", True)
+    strong = _word("Totale", 0.95, ((0.1, 0.1), (0.3, 0.12)))
+    weak = _word("IT6OX", 0.31, ((0.4, 0.1), (0.8, 0.12)))
+    line = SimpleNamespace(words=[strong, weak], geometry=((0.1, 0.1), (0.8, 0.12)))
+    result = [SimpleNamespace(blocks=[SimpleNamespace(lines=[line])])]
+    loads, crops = [], []
+
+    class Docs:
+        @staticmethod
+        def from_pdf(path, scale=2.0):
+            loads.append(scale)
+            return [np.zeros((int(842 * scale / 2), int(595 * scale / 2), 3), dtype=np.uint8)]
+
+    class Model:
+        def __call__(self, pages):
+            return result
+        def reco_predictor(self, batch):
+            crops.extend(c.shape for c in batch)
+            return [("IT60X", 0.97)]
+
+    client = dc.DocTRClient.__new__(dc.DocTRClient)
+    client._threads_set, client._document_file, client.model = True, Docs, Model()
+    path = tmp_path / "doc.pdf"
+    path.write_bytes(make_pdf_text(1, "IBAN IT60X"))
+    out = client.extract_pages(str(path))
+    assert loads == [dc.OCR_LOW_DPI / 72.0]
+    assert len(crops) == 1
+    # 0.4 of an A4 width plus padding, rendered at 300 dpi
+    assert crops[0][1] > 0.4 * 595 / 72 * dc.OCR_HIGH_DPI
+    assert out[0]["blocks"][0]["text"] == "Totale IT60X"
+    assert strong.value == "Totale"
@@ -0,0 +1,43 @@
+import json, os, time
+from fastapi.testclient import TestClient
+import main, jobs
+from _pdfutils import make_pdf_text
+
+API = {"x-api-key": os.environ["API_KEY"]}
+
+def _wait_result(client, job_id, timeout=5.0):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        r = client.get(f"/jobs/{job_id}", headers=API)
+        if r.status_code != 202:
+            return r
+        time.sleep(0.05)
+    return r
+
+def test_job_result_endpoint_returns_stored_response():
+    with TestClient(main.app) as client:
+        tpl = {"name":"t","fields":["iban"],"llm_text":"estrai"}
+        r = client.post("/jobs", headers=API,
+                        files={"file": ("a.pdf", make_pdf_text(1, "IBAN IT00"), "application/pdf")},
+                        data={"template": json.dumps(tpl)})
+        job_id = r.json()["job_id"]
+        res = _wait_result(client, job_id)
+        assert res.status_code == 200
+        js = res.json()
+        assert js["request_id"] == job_id and js["status"] == "done"
+
+def test_job_result_unknown_is_404():
+    with TestClient(main.app) as client:
+        r = client.get("/jobs/does-not-exist", headers=API)
+        assert r.status_code == 404
+
+def test_ttl_store_bounds_entries_and_age():
+    st = jobs.TTLStore(max_entries=2, ttl_s=3600)
+    st.set("a", 1); st.set("b", 2); st.set("c", 3)
+    assert st.get("a") is None and st.get("c") == 3 and len(st) == 2
+    st.append("c2", {"x": 1}); st.append("c2", {"x": 2})
+    assert st.get("c2") == [{"x": 1}, {"x": 2}]
+    old = jobs.TTLStore(max_entries=10, ttl_s=0.01)
+    old.set("k", "v")
+    time.sleep(0.05)
+    assert old.get("k") is None
@@ -0,0 +1,104 @@
+import asyncio, json, time
+import anyio
+import jobs
+
+def _q(tmp_path, **kw):
+    kw.setdefault("poll_s", 0.01)
+    return jobs.SQLiteJobQueue(str(tmp_path / "jobs.db"), **kw)
+
+def test_priority_order_and_shared_visibility(tmp_path):
+    api, worker = _q(tmp_path), _q(tmp_path)  # two "processes" on one file
+    low = api.submit({"data": b"a", "filename": "a.pdf", "tpl": {}}, priority=9)
+    high = api.submit({"data": b"b", "filename": "b.pdf", "tpl": {}}, priority=1)
+    assert worker.depth() == 2
+    first = worker._claim("w1")
+    assert first["job_id"] == high and first["data"] == b"b"
+    worker._complete(high, {"request_id": high, "status": "done"})
+    assert api.get_result(high)["status"] == "done"
+    assert [e["event"] for e in api.get_events(high)] == ["queued", "started", "done"]
+    assert worker._claim("w1")["job_id"] == low
+
+def test_expired_lease_is_reclaimed_then_failed(tmp_path):
+    q = _q(tmp_path, lease_s=0.01, max_attempts=2)
+    jid = q.submit({"data": b"", "filename": "x.pdf", "tpl": {}})
+    assert q._claim("crashed")["attempt"] == 1
+    time.sleep(0.02)
+    assert q._claim("w2")["attempt"] == 2
+    time.sleep(0.02)
+    assert q._claim("w3") is None
+    assert q.get_result(jid)["error"] == "LeaseExpired"
+
+def test_workers_retry_failures(tmp_path):
+    q = _q(tmp_path, max_attempts=3)
+    calls = []
+
+    async def handler(payload):
+        calls.append(payload["attempt"])
+        if payload["attempt"] == 1:
+            raise RuntimeError("boom")
+        return {"request_id": payload["job_id"], "status": "done"}
+
+    async def scenario():
+        q.start(1, handler)
+        jid = q.submit({"data": b"", "filename": "x.pdf", "tpl": {}})
+        for _ in range(400):
+            # skip the retry backoff
+            with q._connect() as db:
+                db.execute("UPDATE jobs SET available_at = 0 WHERE job_id = ?", (jid,))
+            if q.get_result(jid):
+                break
+            await asyncio.sleep(0.01)
+        await q.stop()
+        return jid
+
+    jid = anyio.run(scenario)
+    assert calls == [1, 2]
+    assert q.get_result(jid)["status"] == "done"
+    assert "retry" in [e["event"] for e in q.get_events(jid)]
+
+def test_purge_bounds_finished_jobs(tmp_path):
+    q = _q(tmp_path, max_entries=1)
+    ids = [q.submit({"data": b"", "filename": "x.pdf", "tpl": {}}) for _ in range(3)]
+    for jid in ids:
+        q._claim("w")
+        q._complete(jid, {"status": "done"})
+    q.purge()
+    assert sum(q.get_result(j) is not None for j in ids) == 1
+    assert q.get_events(ids[0]) == []
+
+def test_locked_database_does_not_stall_the_loop(tmp_path):
+    import sqlite3, threading
+    q = _q(tmp_path)
+    jid = q.submit({"data": b"", "filename": "x.pdf", "tpl": {}})
+    holder = sqlite3.connect(str(tmp_path / "jobs.db"), isolation_level=None, check_same_thread=False)
+    holder.execute("BEGIN IMMEDIATE")  # another process holding the write lock
+    threading.Timer(0.5, holder.execute, ("COMMIT",)).start()
+
+    async def scenario():
+        gaps, stop = [], asyncio.Event()
+
+        async def ticker():
+            last = time.perf_counter()
+            while not stop.is_set():
+                await asyncio.sleep(0.01)
+                now = time.perf_counter()
+                gaps.append(now - last)
+                last = now
+
+        tick = asyncio.create_task(ticker())
+        emit = q.emitter(jid)
+        for i in range(20):
+            emit("progress", step=i)
+        second = await q.asubmit({"data": b"", "filename": "y.pdf", "tpl": {}})
+        depth = await q.adepth()
+        stop.set()
+        await tick
+        return second, depth, max(gaps)
+
+    t0 = time.perf_counter()
+    second, depth, worst = asyncio.run(scenario())
+    assert time.perf_counter() - t0 >= 0.4  # the submit really waited for the lock
+    assert worst < 0.1 and depth == 2 and second != jid
+    q.flush_events()
+    assert [e["data"]["step"] for e in q.get_events(jid) if e["event"] == "progress"] == list(range(20))
+    holder.close()
@@ -2,21 +2,39 @@ import json, time
 from fastapi.testclient import TestClient
 import main, os
 
-client = TestClient(main.app)
 API = {"x-api-key": os.environ["API_KEY"]}
 
 def test_submit_and_sse_backlog():
-    files={"file": ("x.pdf", b"%PDF-1.7\n", "application/pdf")}
-    data={"template": json.dumps({"name":"t","fields":["iban","cf"], "llm_text":"estrai i campi"}) , "priority":"5"}
-    r = client.post("/jobs", headers=API, files=files, data=data)
-    assert r.status_code == 200
-    job_id = r.json()["job_id"]
-    # Let worker run
-    time.sleep(0.5)
-    ev = client.get(f"/jobs/{job_id}/events", headers=API)
-    assert ev.status_code == 200
-    # Should contain at least queued+started+done in backlog
-    text = ev.text
-    assert "event: queued" in text
-    assert "event: started" in text
-    assert "event: done" in text
+    with TestClient(main.app) as client:
+        files={"file": ("x.pdf", b"%PDF-1.7\n", "application/pdf")}
+        data={"template": json.dumps({"name":"t","fields":["iban","cf"], "llm_text":"estrai i campi"}) , "priority":"5"}
+        r = client.post("/jobs", headers=API, files=files, data=data)
+        assert r.status_code == 200
+        job_id = r.json()["job_id"]
+        # Let worker run
+        time.sleep(0.5)
+        ev = client.get(f"/jobs/{job_id}/events", headers=API)
+        assert ev.status_code == 200
+        # Should contain at least queued+started+done in backlog
+        text = ev.text
+        assert "event: queued" in text
+        assert "event: started" in text
+        assert "event: done" in text
+
+def test_sse_ids_resume_and_pipeline_events():
+    with TestClient(main.app) as client:
+        files={"file": ("x.pdf", b"%PDF-1.7\n", "application/pdf")}
+        data={"template": json.dumps({"name":"t","fields":["iban"], "llm_text":"estrai"})}
+        job_id = client.post("/jobs", headers=API, files=files, data=data).json()["job_id"]
+        # Held open until the job finishes, then closed after the terminal event
+        text = client.get(f"/jobs/{job_id}/events", headers=API).text
+        assert "id: 1\nevent: queued" in text
+        assert "event: markdown_start" in text
+        assert text.rstrip().split("\n")[-2] == "event: done"
+        resumed = client.get(f"/jobs/{job_id}/events", headers={**API, "Last-Event-ID": "1"}).text
+        assert "event: queued" not in resumed and "id: 2\n" in resumed
+        assert "event: done" in resumed
+
+def test_sse_unknown_job_404():
+    with TestClient(main.app) as client:
+        assert client.get("/jobs/nope/events", headers=API).status_code == 404
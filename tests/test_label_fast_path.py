@@ -0,0 +1,72 @@
+import os, json
+import fitz
+from fastapi.testclient import TestClient
+import main
+from services.spatial import SpatialIndex, extract_by_labels
+from token_table import TokenTable
+
+API = {"x-api-key": os.environ["API_KEY"]}
+
+def _tok(text, x0, y0, page=1, w=0.06, h=0.015):
+    return {"text": text, "page": page, "bbox": [x0, y0, x0 + w, y0 + h]}
+
+TOKENS = TokenTable.from_dicts([
+    _tok("Fattura", 0.10, 0.10), _tok("N.", 0.17, 0.10), _tok("42", 0.24, 0.10),
+    _tok("Cliente", 0.10, 0.20), _tok("ACME", 0.10, 0.22), _tok("S.r.l.", 0.17, 0.22),
+    _tok("Totale:", 0.60, 0.80), _tok("1464,00", 0.68, 0.80), _tok("EUR", 0.75, 0.80),
+    _tok("Totale:", 0.60, 0.40, page=2), _tok("99,00", 0.68, 0.40, page=2),
+])
+
+def test_grid_neighbours():
+    idx = SpatialIndex(TOKENS, grid=16)
+    assert idx.right_of(0, 0.2) == [1, 2]
+    assert idx.right_of(6, 0.05) == [7]
+    assert idx.below(3, 0.05) == [4]
+    assert idx.below(0, 0.05) == [] and idx.right_of(10, 0.5) == []
+
+def test_labels_resolve_right_and_below_values():
+    rules = {"numero": {"labels": ["Fattura N."], "direction": "right", "max_words": 1},
+             "cliente": {"labels": ["Cliente"], "direction": "below"},
+             "totale": {"labels": ["Totale"], "max_words": 1}}
+    out = extract_by_labels(TOKENS, rules)
+    assert out["numero"]["value"] == "42" and out["numero"]["tokens"] == [2]
+    assert out["numero"]["confidence"] > 0.8
+    assert out["cliente"]["value"] == "ACME S.r.l."
+    # two different totals in the document: the better one is kept, at half confidence
+    assert out["totale"]["value"] in ("1464,00", "99,00") and out["totale"]["confidence"] <= 0.5
+
+def _invoice():
+    doc = fitz.open()
+    p = doc.new_page()
+    p.insert_text((72, 72), "Fattura N. 42 del 01/02/2024")
+    p.insert_text((72, 300), "Totale: 1464,00")
+    p.insert_text((72, 400), "Pagamento a 30 giorni")
+    return doc.tobytes()
+
+def test_labelled_fields_skip_the_llm(monkeypatch):
+    monkeypatch.setenv("TEXT_LAYER_MIN_CHARS", "1")
+    asked = []
+
+    async def llm(fields, llm_text, context, timings=None):
+        asked.append(list(fields))
+        return {k: {"value": "30 giorni", "confidence": 0.9} for k in fields}
+
+    monkeypatch.setattr(main, "extract_fields_async", llm)
+    tpl = {"name": "invoice", "fields": ["numero", "totale", "pagamento"], "llm_text": "estrai",
+           "labels": {"numero": {"labels": ["Fattura N."], "max_words": 1}, "totale": {"labels": ["Totale"]}}}
+    c = TestClient(main.app)
+    r = c.post("/extract", headers=API, files={"file": ("f.pdf", _invoice(), "application/pdf")},
+               data={"template": json.dumps(tpl)})
+    assert r.status_code == 200
+    fields = r.json()["fields"]
+    assert fields["numero"]["value"] == "42" and fields["totale"]["value"] == "1464,00"
+    assert list(fields) == ["numero", "totale", "pagamento"]
+    assert asked and all(a == ["pagamento"] for a in asked)
+    rep = c.get(f"/reports/{r.json()['request_id']}", headers=API).json()
+    assert rep["manifest"]["field_sources"] == {"numero": "label", "totale": "label", "pagamento": "llm"}
+
+def test_labels_for_unknown_fields_are_rejected():
+    tpl = {"name": "x", "fields": ["a"], "llm_text": "t", "labels": {"b": {"labels": ["B"]}}}
+    r = TestClient(main.app).post("/extract", headers=API, files={"file": ("f.pdf", _invoice(), "application/pdf")},
+                                  data={"template": json.dumps(tpl)})
+    assert r.status_code == 400
@@ -0,0 +1,103 @@
+import os, json, re
+import fitz
+from fastapi.testclient import TestClient
+import main
+from parse import extract_pdf_tokens
+from services.layout_cache import LayoutCache, fingerprint
+
+API = {"x-api-key": os.environ["API_KEY"]}
+TPL = {"name": "vendor", "fields": ["numero", "totale"], "llm_text": "estrai"}
+
+def _invoice(numero, totale, item, vendor="Rossi Forniture Industriali"):
+    doc = fitz.open()
+    p = doc.new_page()
+    p.insert_text((72, 60), f"{vendor} Via Roma Milano")
+    p.insert_text((72, 90), "Partita IVA Telefono Email Sito")
+    p.insert_text((72, 140), "Fattura numero")
+    p.insert_text((200, 140), numero)
+    p.insert_text((72, 200), f"Descrizione {item}")
+    p.insert_text((72, 300), "Totale documento")
+    p.insert_text((300, 300), totale)
+    p.insert_text((72, 700), "Condizioni generali di vendita pagamento bonifico")
+    return doc.tobytes()
+
+def test_known_layout_reads_learned_positions():
+    cache = LayoutCache(max_entries=4, min_match=0.8)
+    first = extract_pdf_tokens(_invoice("A-17", "1.464,00", "consulenza"))
+    fp = fingerprint(first)
+    assert cache.match(("t",), fp) == (None, 0.0)
+    texts = first.texts()
+    results = [{"key": "totale", "value": "1.464,00", "confidence": 0.95,
+                "bboxes": [first.bbox[texts.index("1.464,00")].tolist()], "bbox_pages": [1]}]
+    key = cache.learn(("t",), fp, None, results)
+    second = extract_pdf_tokens(_invoice("B-9", "12.030,50", "manutenzione impianti"))
+    hit, score = cache.match(("t",), fingerprint(second))
+    assert hit == key and score >= 0.8
+    assert cache.read(hit, second, score)["totale"]["value"] == "12.030,50"
+    assert cache.match(("other",), fingerprint(second))[0] is None
+    other = extract_pdf_tokens(_invoice("C-1", "5,00", "x", vendor="Bianchi Servizi Logistici"))
+    assert cache.match(("t",), fingerprint(other))[0] is None
+
+def test_lru_bound():
+    cache = LayoutCache(max_entries=2)
+    res = [{"key": "f", "value": "1", "confidence": 1.0, "bboxes": [[0.1, 0.1, 0.2, 0.2]], "bbox_pages": [1]}]
+    keys = [cache.learn(("t",), {hash((n, i)) for i in range(10)}, None, res) for n in range(3)]
+    assert len(cache) == 2 and cache.match(("t",), {hash((0, i)) for i in range(10)})[0] is None
+    assert cache.match(("t",), {hash((2, i)) for i in range(10)})[0] == keys[2]
+
+def test_repeat_vendor_skips_the_llm(monkeypatch):
+    monkeypatch.setenv("TEXT_LAYER_MIN_CHARS", "1")
+    monkeypatch.setattr(main, "layout_cache", LayoutCache(8, 0.8))
+    asked = []
+
+    async def llm(fields, llm_text, context, timings=None):
+        asked.append(list(fields))
+        found = {"numero": re.search(r"[A-Z]-\d+", context), "totale": re.search(r"\d[\d.]*,\d\d", context)}
+        return {k: {"value": found[k].group(0) if found.get(k) else None, "confidence": 0.9} for k in fields}
+
+    monkeypatch.setattr(main, "extract_fields_async", llm)
+    c = TestClient(main.app)
+
+    def run(pdf):
+        r = c.post("/extract", headers=API, files={"file": ("f.pdf", pdf, "application/pdf")},
+                   data={"template": json.dumps(TPL)})
+        assert r.status_code == 200
+        rep = c.get(f"/reports/{r.json()['request_id']}", headers=API).json()
+        return r.json()["fields"], rep["manifest"]
+
+    fields, manifest = run(_invoice("A-17", "1.464,00", "consulenza"))
+    assert manifest["layout"]["hit"] is False and asked == [["numero", "totale"]]
+    asked.clear()
+    fields, manifest = run(_invoice("B-9", "12.030,50", "manutenzione impianti"))
+    assert manifest["layout"]["hit"] is True and asked == []
+    assert manifest["field_sources"] == {"numero": "layout", "totale": "layout"}
+    assert fields["numero"]["value"] == "B-9" and fields["totale"]["value"] == "12.030,50"
+
+    # LAYOUT_VERIFY: the LLM still answers; where it agrees the cached position is kept
+    monkeypatch.setattr(main, "LAYOUT_VERIFY", 1)
+    fields, manifest = run(_invoice("C-3", "7,10", "trasporto"))
+    assert asked == [["numero", "totale"]]
+    assert manifest["field_sources"] == {"numero": "layout", "totale": "layout"}
+
+    # ... and where it disagrees its value wins and the learned position is dropped
+    asked.clear()
+    agreeing = main.extract_fields_async
+
+    async def disagreeing(fields, llm_text, context, timings=None):
+        out = await agreeing(fields, llm_text, context, timings)
+        if "totale" in out:
+            out["totale"] = {"value": "999,99", "confidence": 0.9}
+        return out
+
+    monkeypatch.setattr(main, "extract_fields_async", disagreeing)
+    before = main.metrics.layout_cache_verifications_total.labels(outcome="disagree")._value.get()
+    fields, manifest = run(_invoice("D-4", "8,20", "imballo"))
+    assert fields["totale"]["value"] == "999,99" and fields["numero"]["value"] == "D-4"
+    assert manifest["field_sources"] == {"numero": "layout", "totale": "llm"}
+    assert main.metrics.layout_cache_verifications_total.labels(outcome="disagree")._value.get() == before + 1
+    [entry] = main.layout_cache._data.values()
+    assert set(entry["fields"]) == {"numero"}  # "999,99" is nowhere on the page: not re-learned
+    monkeypatch.setattr(main, "LAYOUT_VERIFY", 0)
+    asked.clear()
+    fields, manifest = run(_invoice("E-5", "3,30", "varie"))
+    assert asked == [["totale"]] and manifest["field_sources"]["numero"] == "layout"
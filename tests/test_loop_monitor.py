@@ -0,0 +1,54 @@
+import os, json, asyncio, logging, time
+from fastapi.testclient import TestClient
+import main, metrics, loop_monitor
+from _pdfutils import make_pdf_text
+
+API = {"x-api-key": os.environ["API_KEY"]}
+
+def _lag_count():
+    return sum(s.value for m in metrics.event_loop_lag_ms.collect() for s in m.samples if s.name.endswith("_count"))
+
+def test_blocked_loop_logs_stack_of_blocking_code(caplog):
+    def blocking_parse_step():
+        time.sleep(0.4)
+
+    async def scenario():
+        mon = loop_monitor.LoopMonitor(interval_ms=10, block_threshold_ms=100).start()
+        await asyncio.sleep(0.05)
+        blocking_parse_step()
+        await asyncio.sleep(0.05)
+        await mon.stop()
+        return mon
+
+    before = _lag_count()
+    with caplog.at_level(logging.WARNING, logger="loop_monitor"):
+        mon = asyncio.run(scenario())
+    assert mon.stalls == 1
+    assert _lag_count() > before
+    msgs = [r.getMessage() for r in caplog.records if "Event loop blocked" in r.getMessage()]
+    assert len(msgs) == 1 and "blocking_parse_step" in msgs[0]
+
+def test_blocking_pipeline_steps_run_off_the_loop(monkeypatch):
+    monkeypatch.setenv("MOCK_LLM", "1")
+    on_loop = {}
+
+    def _probe(name, ret):
+        def fn(*a, **k):
+            try:
+                asyncio.get_running_loop()
+                on_loop[name] = True
+            except RuntimeError:
+                on_loop[name] = False
+            return ret(*a)
+        return fn
+
+    monkeypatch.setattr(main, "attach_locations_to_response", _probe("locations", lambda p, r, cells=None: r))
+    monkeypatch.setattr(main.align, "align_value_to_tokens", _probe("align", lambda v, t: ([], 0.0)))
+    save = main.reports.save_report_bundle
+    monkeypatch.setattr(main.reports, "save_report_bundle", _probe("bundle", save))
+    tpl = {"name": "off_loop", "fields": ["iban"], "llm_text": "estrai"}
+    r = TestClient(main.app).post("/extract", headers=API,
+                                  files={"file": ("t.pdf", make_pdf_text(1, "IBAN IT00"), "application/pdf")},
+                                  data={"template": json.dumps(tpl)})
+    assert r.status_code == 200
+    assert on_loop == {"locations": False, "align": False, "bundle": False}
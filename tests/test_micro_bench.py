@@ -0,0 +1,21 @@
+import os
+import pytest
+from bench import micro
+
+def test_micro_benchmarks_within_allocation_budgets():
+    report = micro.run_suite(sizes=(1000, 10000), fields=(10,))
+    budgets = micro.load_budgets()
+    assert all(k in budgets["results"] for k in report["results"])
+    assert micro.check(report, budgets, timing=False) == []
+
+@pytest.mark.skipif(os.getenv("BENCH", "0") != "1", reason="wall-clock budgets are machine-specific; set BENCH=1")
+def test_micro_benchmarks_within_time_budgets():
+    report = micro.run_suite(sizes=(1000, 10000), fields=(10,))
+    assert micro.check(report, micro.load_budgets()) == []
+
+def test_check_flags_blown_budgets():
+    report = {"results": {"x/n=10": {"time_ms": 5.0, "alloc_kb": 10.0}}, "scaling": {"x": {"points": [], "slope": 2.1}}}
+    budgets = {"results": {"x/n=10": {"time_ms": 2.0, "alloc_kb": 64.0}}, "max_slope": {"x": 1.3}}
+    out = micro.check(report, budgets)
+    assert len(out) == 2 and "time" in out[0] and "scaling" in out[1]
+    assert micro.check(report, budgets, timing=False) == []
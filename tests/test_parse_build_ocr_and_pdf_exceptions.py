@@ -32,6 +32,7 @@ def test_convert_markdown_async_pdf_exception_path(monkeypatch):
     class DummyDoc:
         def __iter__(self): return iter([])
     def fake_open(stream, filetype): raise RuntimeError("boom")
-    monkeypatch.setattr(_p.fitz, "open", fake_open, raising=True)
+    import fitz  # parse imports it lazily, inside the functions
+    monkeypatch.setattr(fitz, "open", fake_open, raising=True)
     out = anyio.run(_p.convert_markdown_async, b"%PDF-XXX", "x.pdf")
     assert isinstance(out, str)
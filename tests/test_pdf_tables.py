@@ -0,0 +1,91 @@
+import os, json
+import fitz
+from fastapi.testclient import TestClient
+import main
+from parse import extract_pdf_tables
+from services.bbox_mapper import map_bboxes_to_fields
+
+API = {"x-api-key": os.environ["API_KEY"]}
+ROWS = [("Descrizione", "Importo"), ("Consulenza", "1200,00"), ("Totale", "1464,00")]
+
+def _invoice():
+    doc = fitz.open()
+    p = doc.new_page()
+    p.insert_text((72, 72), "Fattura n. 42 del 01/02/2024")
+    for r in range(len(ROWS) + 1):
+        p.draw_line((72, 200 + r * 20), (372, 200 + r * 20))
+    for c in range(3):
+        p.draw_line((72 + c * 150, 200), (72 + c * 150, 200 + len(ROWS) * 20))
+    for r, row in enumerate(ROWS):
+        for c, text in enumerate(row):
+            p.insert_text((80 + c * 150, 215 + r * 20), text)
+    p.insert_text((72, 400), "Pagamento a 30 giorni")
+    return doc.tobytes()
+
+def test_text_layer_tables_become_markdown_and_cells():
+    out = extract_pdf_tables(_invoice())
+    md = out["markdown"]
+    assert "| Descrizione | Importo |" in md and "| Totale | 1464,00 |" in md
+    assert md.index("Fattura") < md.index("| Descrizione") < md.index("Pagamento")
+    [page] = out["pages_blocks"]
+    assert page["page"] == 1 and [b["type"] for b in page["blocks"]] == ["table"]
+    assert len(out["cells"]) == 6
+    fields = map_bboxes_to_fields({"totale": {"value": "1464,00"}}, out["cells"])
+    x, y, w, h = fields["totale"]["bbox"]
+    assert fields["totale"]["page_index"] == 0
+    assert 222 <= x <= 230 and 238 <= y <= 242 and w > 100
+
+def test_digital_invoice_with_table_needs_no_ocr(monkeypatch):
+    monkeypatch.setenv("OCR_POLICY", "auto")
+    monkeypatch.setenv("MOCK_LLM", "1")
+    monkeypatch.setenv("TEXT_LAYER_MIN_CHARS", "1")
+    from clients import doctr_client as ocr
+    calls = []
+
+    async def fake_ocr(data, filename, pages=None):
+        calls.append(filename)
+        return []
+
+    monkeypatch.setattr(ocr, "analyze_async", fake_ocr)
+    monkeypatch.setattr(ocr, "_get_doctr", lambda: calls.append("locations"))
+    tpl = {"name": "invoice", "fields": ["totale"], "llm_text": "estrai"}
+    c = TestClient(main.app)
+    r = c.post("/extract", headers=API, files={"file": ("f.pdf", _invoice(), "application/pdf")},
+               data={"template": json.dumps(tpl)})
+    assert r.status_code == 200
+    assert calls == []
+    rep = c.get(f"/reports/{r.json()['request_id']}", headers=API).json()
+    plan = rep["manifest"]["plan"]
+    assert plan["tables"] == {"source": "text_layer", "count": 1}
+    assert "ocr_scope" not in plan
+    rdir = os.path.dirname(rep["artifacts"]["response.json"])
+    with open(os.path.join(rdir, "md.txt"), encoding="utf-8") as f:
+        assert "| Consulenza | 1200,00 |" in f.read()
+    with open(os.path.join(rdir, "tables.json"), encoding="utf-8") as f:
+        assert json.load(f)[0]["blocks"][0]["type"] == "table"
+
+async def _no_llm(fields, llm_text, context, timings=None):
+    return {k: {"value": None, "confidence": 0.0} for k in fields}
+
+def test_table_finder_only_runs_on_ruled_pages_of_a_text_layer(monkeypatch):
+    from _pdfutils import make_pdf_text
+    calls = []
+    original = fitz.Page.find_tables
+
+    def spy(page, *a, **k):
+        calls.append(page.number)
+        return original(page, *a, **k)
+
+    monkeypatch.setattr(fitz.Page, "find_tables", spy)
+    monkeypatch.setattr(main, "extract_fields_async", _no_llm)
+    tpl = json.dumps({"name": "invoice", "fields": ["totale"], "llm_text": "estrai"})
+    c = TestClient(main.app)
+    monkeypatch.setenv("TEXT_LAYER_MIN_CHARS", "1")
+    r = c.post("/extract", headers=API, files={"file": ("f.pdf", make_pdf_text(30, "Totale 1464,00 " * 20), "application/pdf")},
+               data={"template": tpl})
+    assert r.status_code == 200 and calls == []
+    # a ruled table is still found, but not when the text layer is too thin to be used
+    assert extract_pdf_tables(_invoice())["pages_blocks"] and calls == [0]
+    monkeypatch.setenv("TEXT_LAYER_MIN_CHARS", "999999")
+    r = c.post("/extract", headers=API, files={"file": ("f.pdf", _invoice(), "application/pdf")}, data={"template": tpl})
+    assert r.status_code == 200 and calls == [0]
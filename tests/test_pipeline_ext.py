@@ -45,5 +45,5 @@ def test_image_raster_ocr_and_tokens_exist():
     rid = r.json()["request_id"]
     # tokens file should exist and have at least one line
     import os as _os
-    tok = f"/mnt/data/reports/{rid}/tokens.jsonl"
+    tok = f"/mnt/data/reports/{rid}/tokens.bin"
     assert _os.path.exists(tok)
@@ -2,7 +2,6 @@ import os, io, json, time
 from fastapi.testclient import TestClient
 import main
 import pytest
-from parse import extract_words_with_bboxes_pdf
 
 client = TestClient(main.app)
 API = {"x-api-key": os.environ["API_KEY"]}
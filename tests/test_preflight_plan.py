@@ -0,0 +1,46 @@
+import os, json
+from fastapi.testclient import TestClient
+import main, clients, parse
+from _pdfutils import make_pdf_text
+
+API = {"x-api-key": os.environ["API_KEY"]}
+PNG = b"\x89PNG\r\n\x1a\n" + b"0" * 64
+
+def _tpl():
+    return {"name": "t", "fields": ["iban"], "llm_text": "estrai"}
+
+def test_plan_by_media_type_and_policy():
+    pdf = parse.plan_stages(make_pdf_text(1, "x"), "a.pdf", "auto")
+    assert pdf["kind"] == "pdf" and pdf["words"] and pdf["ocr"] == "decide"
+    img = parse.plan_stages(PNG, "scan.png", "auto")
+    assert img["kind"] == "image" and img["ocr"] == "run" and img["markdown"] == "fallback"
+    assert parse.plan_stages(PNG, "scan.png", "auto_pages")["ocr"] == "skip"
+    other = parse.plan_stages(b"hello", "notes.txt", "always")
+    assert other["kind"] == "other" and other["ocr"] == "skip" and other["markdown"] == "run"
+
+def test_image_skips_markitdown_when_ocr_replaces_it(monkeypatch):
+    monkeypatch.setenv("OCR_POLICY", "auto")
+    import clients.doctr_client as ocr
+    async def fake_ocr(data, filename, pages=None):
+        return [{"page": 1, "blocks": [{"type": "text", "text": "IBAN IT00", "bbox": [0, 0, 1, 1]}]}]
+    monkeypatch.setattr(ocr, "analyze_async", fake_ocr)
+    clients.reset_mock_counters()
+    r = TestClient(main.app).post("/extract", headers=API, files={"file": ("x.png", PNG, "image/png")},
+                                  data={"template": json.dumps(_tpl())})
+    assert r.status_code == 200
+    assert clients.get_mock_counters()["md"] == 0
+    assert "IBAN IT00" in r.json()["text"]
+
+def test_image_falls_back_to_markitdown_without_ocr_pages(monkeypatch):
+    monkeypatch.setenv("OCR_POLICY", "auto")
+    import clients.doctr_client as ocr
+    async def fake_ocr(data, filename, pages=None):
+        return []
+    monkeypatch.setattr(ocr, "analyze_async", fake_ocr)
+    clients.reset_mock_counters()
+    r = TestClient(main.app).post("/extract", headers=API, files={"file": ("x.png", PNG, "image/png")},
+                                  data={"template": json.dumps(_tpl())})
+    assert r.status_code == 200
+    assert clients.get_mock_counters()["md"] == 1
+    rep = TestClient(main.app).get(f"/reports/{r.json()['request_id']}", headers=API).json()
+    assert rep["manifest"]["plan"]["kind"] == "image"
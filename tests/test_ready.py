@@ -0,0 +1,56 @@
+import os, sys, subprocess, threading, time
+from fastapi.testclient import TestClient
+import main, warmup
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+def _wait_ready(client, timeout=10.0):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        r = client.get("/ready")
+        if r.status_code == 200:
+            return r.json()
+        time.sleep(0.05)
+    raise AssertionError(client.get("/ready").json())
+
+def test_ready_reports_backends_and_cold_start():
+    with TestClient(main.app) as c:
+        st = _wait_ready(c)
+    assert st["backends"]["ocr"]["status"] == "ready" and st["backends"]["ocr"]["backend"] == "mock"
+    assert st["backends"]["llm"]["backend"] == "mock"
+    assert st["backends"]["embeddings"]["status"] == "ready"
+    assert st["backends"]["markitdown"]["status"] in ("ready", "failed")
+    assert "markitdown" not in st["required"]
+    text = main.generate_latest().decode()
+    assert 'cold_start_seconds{phase="import"}' in text and 'cold_start_seconds{phase="ready"}' in text
+    assert 'backend_warmup_seconds{backend="ocr"}' in text
+
+def test_startup_does_not_wait_for_slow_backend(monkeypatch):
+    gate = threading.Event()
+    monkeypatch.setitem(warmup.BACKENDS, "ocr", lambda: gate.wait(10) and "slow")
+    with TestClient(main.app) as c:
+        assert c.get("/").status_code == 200
+        r = c.get("/ready")
+        assert r.status_code == 503 and r.json()["backends"]["ocr"]["status"] in ("pending", "loading")
+        gate.set()
+        assert _wait_ready(c)["backends"]["ocr"]["backend"] == "slow"
+
+def test_failed_required_backend_is_not_ready(monkeypatch):
+    def boom():
+        raise RuntimeError("no model")
+    monkeypatch.setitem(warmup.BACKENDS, "llm", boom)
+    with TestClient(main.app) as c:
+        deadline = time.time() + 10
+        while not warmup._task.done() and time.time() < deadline:
+            time.sleep(0.05)
+        r = c.get("/ready")
+    assert r.status_code == 503
+    assert r.json()["backends"]["llm"] == {"status": "failed", "error": "no model"}
+
+def test_importing_main_does_not_import_heavy_backends(tmp_path):
+    marker = tmp_path / "imported"
+    for mod in ("llama_cpp", "markitdown", "doctr", "huggingface_hub", "fitz"):
+        (tmp_path / f"{mod}.py").write_text(f"open({str(marker)!r}, 'a').write({mod!r} + '\\n')\n")
+    env = {**os.environ, "PYTHONPATH": os.pathsep.join([str(tmp_path), ROOT])}
+    subprocess.run([sys.executable, "-c", "import main"], cwd=ROOT, env=env, check=True, capture_output=True)
+    assert not marker.exists(), marker.read_text()
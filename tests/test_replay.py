@@ -0,0 +1,38 @@
+import asyncio, json
+from bench.synth import make_document
+from bench.replay import load_traffic, send_times, replay
+
+TPL = {"name": "replay_tpl", "fields": ["iban"], "llm_text": "estrai"}
+
+def _traffic(tmp_path):
+    (tmp_path / "d.pdf").write_bytes(make_document("digital", 1))
+    (tmp_path / "tpl.json").write_text(json.dumps(TPL))
+    lines = [
+        {"file": "d.pdf", "template": "tpl.json", "offset_ms": 40},
+        {"file": "d.pdf", "template": TPL, "offset_s": 0.0, "policy": "auto"},
+        {"file": "d.pdf", "template": TPL, "offset_s": 0.02, "endpoint": "/jobs"},
+        {"request_id": "not-traffic"},
+    ]
+    path = tmp_path / "traffic.jsonl"
+    path.write_text("\n".join(json.dumps(l) for l in lines))
+    return str(path)
+
+def test_load_and_schedule(tmp_path):
+    entries = load_traffic(_traffic(tmp_path))
+    assert [e["offset_s"] for e in entries] == [0.0, 0.02, 0.04]
+    assert entries[2]["template"] == TPL and entries[1]["endpoint"] == "/jobs"
+    assert send_times(entries, "open", speed=2.0) == [0.0, 0.01, 0.02]
+    assert send_times(entries, "rps", rps=10) == [0.0, 0.1, 0.2]
+
+def test_replay_in_process_reports_latency_errors_and_waits(tmp_path):
+    res = asyncio.run(replay(load_traffic(_traffic(tmp_path)), mode="rps", rps=50))
+    assert res["requests"] == 3 and res["ok"] == 3 and res["error_rate"] == 0.0
+    assert res["histogram_ms"]["+Inf"] == 3
+    assert set(res["by_endpoint"]) == {"/extract", "/jobs"}
+    assert res["queue_wait_ms"]["job_queue"]["n"] == 1
+    assert res["queue_wait_ms"]["executor:pdf"]["n"] == 2
+
+def test_replay_counts_failures(tmp_path):
+    entries = load_traffic(_traffic(tmp_path))
+    res = asyncio.run(replay(entries[:1], api_key="wrong"))
+    assert res["ok"] == 0 and res["error_rate"] == 1.0 and res["errors"] == {"401": 1}
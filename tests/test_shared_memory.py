@@ -0,0 +1,49 @@
+import gc, importlib.util, os
+import pytest
+from fastapi.testclient import TestClient
+import main, metrics, warmup
+import clients.llm_local as llm_local
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+needs_smaps = pytest.mark.skipif(not os.path.exists("/proc/self/smaps_rollup"), reason="Linux smaps_rollup only")
+
+@needs_smaps
+def test_process_memory_reports_unique_set():
+    mem = metrics.process_memory()
+    assert set(mem) == {"rss", "pss", "shared", "uss"}
+    assert 0 < mem["uss"] <= mem["rss"] and mem["pss"] <= mem["rss"]
+    text = main.generate_latest().decode()
+    assert 'process_memory_bytes{kind="uss"}' in text
+
+@needs_smaps
+def test_ready_includes_worker_memory():
+    with TestClient(main.app) as c:
+        proc = c.get("/ready").json()["process"]
+    assert proc["pid"] == os.getpid() and proc["memory_bytes"]["uss"] > 0
+
+def test_gguf_models_loaded_with_mmap(monkeypatch):
+    seen = {}
+    class FakeLlama:
+        def __init__(self, **kw):
+            seen.update(kw)
+    monkeypatch.setattr(llm_local, "_llama_cls", lambda: FakeLlama)
+    monkeypatch.setattr(llm_local, "_GLOBAL_LLM", None)
+    llm_local.get_local_llm()
+    assert seen["use_mmap"] is True
+
+def test_gunicorn_config_preloads_before_fork(monkeypatch):
+    spec = importlib.util.spec_from_file_location("gunicorn_conf", os.path.join(ROOT, "gunicorn.conf.py"))
+    conf = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(conf)
+    assert conf.preload_app is True and conf.worker_class == "uvicorn.workers.UvicornWorker"
+    logged = []
+    class Server:
+        class log:
+            info = staticmethod(lambda msg, *a: logged.append(msg % a))
+    try:
+        conf.when_ready(Server())
+        assert gc.get_freeze_count() > 0
+    finally:
+        gc.unfreeze()
+    assert logged == ["Preloaded before fork: ocr"]
+    conf.post_fork(Server(), None)
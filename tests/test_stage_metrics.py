@@ -0,0 +1,39 @@
+import os, json
+from fastapi.testclient import TestClient
+import main
+import clients.llm_local as llm_local
+from _pdfutils import make_pdf_text
+
+API = {"x-api-key": os.environ["API_KEY"]}
+
+def test_stage_histograms_and_manifest_timings():
+    c = TestClient(main.app)
+    tpl = {"name": "metrics_tpl", "fields": ["iban"], "llm_text": "estrai"}
+    r = c.post("/extract", headers=API, files={"file": ("m.pdf", make_pdf_text(1, "IBAN IT00"), "application/pdf")},
+               data={"template": json.dumps(tpl)})
+    assert r.status_code == 200
+    rep = c.get(f"/reports/{r.json()['request_id']}", headers=API).json()
+    timings = rep["manifest"]["timings_ms"]
+    for stage in ("markdown", "words", "chunking", "llm", "alignment", "persistence"):
+        assert stage in timings
+    text = c.get("/metrics").text
+    assert 'stage_latency_ms_count{stage="words",template="metrics_tpl"}' in text
+    assert 'executor_completed_total{executor="pdf"}' in text
+    assert "job_queue_depth" in text
+
+def test_chat_json_records_tokens_and_phases(monkeypatch):
+    class FakeLlama:
+        def tokenize(self, b):
+            return b.split()
+        def create_completion(self, prompt, stream=False, **kw):
+            assert stream
+            for piece in ['{"iban": ', '{"value": "IT00", ', '"confidence": 0.9}}']:
+                yield {"choices": [{"text": piece}]}
+    monkeypatch.setattr(llm_local, "get_local_llm", lambda: FakeLlama())
+    before = llm_local.metrics.llm_tokens_total.labels(direction="out")._value.get()
+    out = llm_local.chat_json(["iban"], "estrai", "IBAN IT00")
+    assert out["iban"]["value"] == "IT00"
+    stats = llm_local.last_call_stats()
+    assert stats["completion_tokens"] == 3 and stats["prompt_tokens"] > 0
+    assert stats["prompt_eval_ms"] >= 0 and stats["generation_ms"] >= 0
+    assert llm_local.metrics.llm_tokens_total.labels(direction="out")._value.get() == before + 3
@@ -0,0 +1,70 @@
+import os, json, asyncio, uuid
+import fitz
+from fastapi.testclient import TestClient
+import main
+from parse import count_pages
+from token_table import TokenTable
+
+API = {"x-api-key": os.environ["API_KEY"]}
+
+def _statement(pages=10):
+    doc = fitz.open()
+    for i in range(pages):
+        p = doc.new_page()
+        p.insert_text((72, 72), f"Pagina {i + 1} movimenti del conto")
+        if i + 1 == 7:
+            p.insert_text((72, 120), "Totale dovuto 1234,56")
+    return doc.tobytes()
+
+def test_long_pdf_is_processed_in_page_windows(monkeypatch):
+    monkeypatch.setenv("TEXT_LAYER_MIN_CHARS", "1")
+    monkeypatch.setattr(main, "STREAM_MIN_PAGES", 5)
+    monkeypatch.setattr(main, "STREAM_WINDOW_PAGES", 4)
+    seen = []
+    orig_preflight = main._preflight
+
+    async def preflight(data, *a, **k):
+        seen.append(count_pages(data, "w.pdf"))
+        return await orig_preflight(data, *a, **k)
+
+    async def llm(fields, llm_text, context, timings=None):
+        val = "1234,56" if "1234,56" in context else None
+        return {k: {"value": val, "confidence": 0.9} for k in fields}
+
+    monkeypatch.setattr(main, "_preflight", preflight)
+    monkeypatch.setattr(main, "extract_fields_async", llm)
+    tpl = {"name": "statement", "fields": ["totale"], "llm_text": "estrai"}
+    c = TestClient(main.app)
+    r = c.post("/extract", headers=API, files={"file": ("s.pdf", _statement(), "application/pdf")},
+               data={"template": json.dumps(tpl)})
+    assert r.status_code == 200
+    assert seen == [4, 4, 2]
+    body = r.json()
+    assert body["text"].index("Pagina 1 ") < body["text"].index("Pagina 10 ")
+    rep = c.get(f"/reports/{body['request_id']}", headers=API).json()
+    stream = rep["manifest"]["plan"]["stream"]
+    assert stream["pages"] == 10 and [w["pages"] for w in stream["windows"]] == [[1, 4], [5, 8], [9, 10]]
+    assert rep["manifest"]["llm_context_mode"] == "rag_field_wise"
+    rdir = os.path.dirname(rep["artifacts"]["response.json"])
+    pages = TokenTable.load(os.path.join(rdir, "tokens.bin")).page.tolist()
+    assert pages == sorted(pages) and set(pages) == set(range(1, 11))
+    with open(os.path.join(rdir, "response.json"), encoding="utf-8") as f:
+        totale = json.load(f)["fields"]["totale"]
+    assert totale["value"] == "1234,56" and totale["confidence"] > 0.9
+
+def test_window_events_carry_page_ranges_and_pages_are_counted_once(monkeypatch):
+    monkeypatch.setenv("TEXT_LAYER_MIN_CHARS", "1")
+    monkeypatch.setattr(main, "STREAM_MIN_PAGES", 5)
+    monkeypatch.setattr(main, "STREAM_WINDOW_PAGES", 4)
+    counted = []
+    monkeypatch.setattr(main, "count_pages", lambda data, name: counted.append(name) or count_pages(data, name))
+    events = []
+    tpl = {"name": "statement", "fields": ["totale"], "llm_text": "estrai"}
+    asyncio.run(main._process_request(_statement(), "s.pdf", tpl, str(uuid.uuid4()), n_pages=10,
+                                      emit=lambda typ, **d: events.append((typ, d.get("pages")))))
+    assert counted == []
+    assert [p for typ, p in events if typ == "markdown_start"] == [[1, 4], [5, 8], [9, 10]]
+    assert [p for typ, p in events if typ == "window_done"] == [[1, 4], [5, 8], [9, 10]]
+    r = TestClient(main.app).post("/extract", headers=API, files={"file": ("s.pdf", _statement(), "application/pdf")},
+                                  data={"template": json.dumps(tpl)})
+    assert r.status_code == 200 and counted == ["s.pdf"]
@@ -0,0 +1,69 @@
+import os, io, json
+import fitz
+import pytest
+from PIL import Image
+from fastapi.testclient import TestClient
+import main
+from parse import merge_region_ocr
+from token_table import TokenTable
+
+API = {"x-api-key": os.environ["API_KEY"]}
+
+def _contract(pages=4, table_page=3):
+    doc = fitz.open()
+    for i in range(pages):
+        p = doc.new_page()
+        p.insert_text((72, 72), f"Pagina {i + 1} testo digitale")
+        if i + 1 == table_page:
+            p.insert_text((72, 120), "| Voce | Importo |\n|---|---|\n| Totale | 100 |")
+            for r in range(4):
+                p.draw_line((72, 300 + r * 20), (372, 300 + r * 20))
+            for c in range(3):
+                p.draw_line((72 + c * 150, 300), (72 + c * 150, 360))
+            for r in range(3):
+                p.insert_text((80, 315 + r * 20), f"cella{r}")
+    return doc.tobytes()
+
+def test_table_ocr_limited_to_table_regions(monkeypatch):
+    monkeypatch.setenv("OCR_POLICY", "auto")
+    monkeypatch.setenv("MOCK_LLM", "1")
+    monkeypatch.setenv("TEXT_LAYER_MIN_CHARS", "1")
+    monkeypatch.setenv("PDF_TABLES", "0")  # no native table extraction: regions go through OCR
+    from clients import doctr_client as ocr
+    calls = []
+
+    async def fake_ocr(data, filename, pages=None):
+        w, h = Image.open(io.BytesIO(data)).size
+        calls.append((filename, w, h))
+        return [{"page": 1, "page_w": float(w), "page_h": float(h),
+                 "blocks": [{"type": "text", "text": "cella0 OCR", "bbox": [0.0, 0.0, w / 2, h / 3]}]}]
+
+    monkeypatch.setattr(ocr, "analyze_async", fake_ocr)
+    tpl = {"name": "tables", "fields": ["totale"], "llm_text": "estrai"}
+    c = TestClient(main.app)
+    r = c.post("/extract", headers=API, files={"file": ("c.pdf", _contract(), "application/pdf")},
+               data={"template": json.dumps(tpl)})
+    assert r.status_code == 200
+    assert [name for name, _, _ in calls] == ["p3_table0.png"]
+    _, w, h = calls[0]
+    assert w < 612 * 200 / 72 / 2 and h < 792 * 200 / 72 / 4  # a clip, not the page
+    rep = c.get(f"/reports/{r.json()['request_id']}", headers=API).json()
+    assert rep["manifest"]["plan"]["ocr_scope"] == {"pages": [3], "regions": 1}
+    rdir = os.path.dirname(rep["artifacts"]["response.json"])
+    tokens = TokenTable.load(os.path.join(rdir, "tokens.bin")).to_dicts()
+    ocr_tokens = [t for t in tokens if t.get("source") == "ocr"]
+    assert [t["text"] for t in ocr_tokens] == ["cella0", "OCR"]
+    assert all(t["page"] == 3 for t in ocr_tokens)
+    assert not any(t["text"].startswith("cella") and t.get("source") != "ocr" for t in tokens)
+    assert {t["page"] for t in tokens} == {1, 2, 3, 4}
+
+def test_merge_places_region_words_where_the_text_layer_had_them():
+    tok = lambda text, page, x, y: {"text": text, "page": page, "bbox": [x, y, x + 0.05, y + 0.01], "line_id": None}
+    tokens = [tok("a", 1, 0.1, 0.1), tok("old", 1, 0.5, 0.5), tok("b", 1, 0.1, 0.9), tok("c", 2, 0.1, 0.1)]
+    crops = [{"page": 1, "region": [0.4, 0.4, 0.8, 0.6]}, {"page": 2, "region": [0.0, 0.5, 1.0, 1.0]}]
+    results = [[{"page_w": 100, "page_h": 100, "blocks": [{"type": "text", "text": "new cell", "bbox": [0, 0, 100, 50]}]}],
+               [{"page_w": 10, "page_h": 10, "blocks": [{"type": "text", "text": "tail", "bbox": [0, 0, 10, 10]}]}]]
+    blocks, merged = merge_region_ocr(tokens, crops, results)
+    assert [t["text"] for t in merged] == ["a", "new", "cell", "b", "c", "tail"]
+    assert merged[1]["bbox"][0] == pytest.approx(0.4) and merged[2]["bbox"][2] == pytest.approx(0.8)
+    assert blocks[0]["blocks"][0]["bbox"] == pytest.approx([0.4, 0.4, 0.4, 0.1])
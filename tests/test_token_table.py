@@ -0,0 +1,45 @@
+import io
+import pytest
+import align
+from bench import micro
+from parse import extract_pdf_tokens
+from token_table import TokenTable
+
+def test_pdf_text_layer_is_read_with_page_relative_bboxes():
+    table = extract_pdf_tokens(micro.make_pdf(1200, per_page=500))
+    assert len(table) == 1200 and table.page.tolist() == [1] * 500 + [2] * 500 + [3] * 200
+    assert (table.bbox >= 0).all() and (table.bbox <= 1).all()
+    assert (table.bbox[:, 2] > table.bbox[:, 0]).all() and (table.bbox[:, 3] > table.bbox[:, 1]).all()
+    assert table[5] == {"text": table.texts()[5], "page": 1, "bbox": pytest.approx(table.bbox[5].tolist()), "line_id": None}
+
+def test_binary_segments_round_trip():
+    a = TokenTable.from_dicts([{"text": "Però", "page": 1, "bbox": [0.1, 0.2, 0.3, 0.4], "line_id": 3},
+                               {"text": "IBAN", "page": 2, "bbox": [0.5, 0.5, 0.6, 0.6], "line_id": None, "source": "ocr"}])
+    b = TokenTable.from_dicts([{"text": "€ 10", "page": 3, "bbox": [0, 0, 1, 1], "line_id": None}])
+    f = io.BytesIO()
+    a.write(f)
+    at = f.tell()
+    b.write(f)
+    f.seek(at)
+    assert TokenTable.read(f).texts() == ["€ 10"]
+    f.seek(0)
+    both = TokenTable.concat([TokenTable.read(f), TokenTable.read(f)])
+    assert TokenTable.read(f) is None
+    assert both.texts() == ["Però", "IBAN", "€ 10"]
+    assert both[0]["line_id"] == 3 and both[1]["source"] == "ocr" and "source" not in both[2]
+    assert both.take([2, 0]).texts() == ["€ 10", "Però"]
+    assert both.n_chars == 12
+
+def test_offsets_are_written_as_int64():
+    t = TokenTable.from_dicts([{"text": "a", "page": 1, "bbox": [0, 0, 1, 1]}])
+    t.offsets = t.offsets + 2**32  # a text buffer past 4 GiB
+    f = io.BytesIO()
+    t.write(f)
+    f.seek(0)
+    assert TokenTable.read(f).offsets.tolist() == [2**32, 2**32 + 1]
+
+def test_alignment_accepts_a_table():
+    toks = micro.make_tokens(300)
+    table = TokenTable.from_dicts(toks)
+    value = " ".join(t["text"] for t in toks[40:42])
+    assert align.align_value_to_tokens(value, table) == align.align_value_to_tokens(value, toks)
@@ -0,0 +1,31 @@
+import os, json
+from fastapi.testclient import TestClient
+import main
+from _pdfutils import make_pdf_text
+
+API = {"x-api-key": os.environ["API_KEY"]}
+TPL = {"name": "trace_tpl", "fields": ["iban"], "llm_text": "estrai"}
+
+def _extract(c, headers):
+    r = c.post("/extract", headers=headers, files={"file": ("t.pdf", make_pdf_text(1, "IBAN IT00"), "application/pdf")},
+               data={"template": json.dumps(TPL)})
+    assert r.status_code == 200
+    return c.get(f"/reports/{r.json()['request_id']}", headers=API).json()
+
+def test_trace_json_saved_in_bundle():
+    rep = _extract(TestClient(main.app), API)
+    assert "profile.folded" not in rep["artifacts"]
+    with open(rep["artifacts"]["trace.json"], encoding="utf-8") as f:
+        trace = json.load(f)
+    names = {e["name"] for e in trace["traceEvents"] if e["ph"] == "X"}
+    assert {"preflight", "markdown", "words", "llm", "queue_wait:pdf"} <= names
+    assert any(n.startswith("pdf:") for n in names)
+    assert trace["otherData"]["request_id"] == rep["request_id"]
+
+def test_profile_header_saves_folded_stacks():
+    rep = _extract(TestClient(main.app), {**API, "X-Profile": "1"})
+    path = rep["artifacts"]["profile.folded"]
+    assert os.path.exists(path)
+    with open(path, encoding="utf-8") as f:
+        lines = [l for l in f.read().splitlines() if l]
+    assert all(l.rsplit(" ", 1)[1].isdigit() for l in lines)
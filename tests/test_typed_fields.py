@@ -0,0 +1,69 @@
+import os, json
+import fitz
+from fastapi.testclient import TestClient
+import main
+from services.layout_cache import LayoutCache
+from services.typed_fields import TypedField, scan
+
+API = {"x-api-key": os.environ["API_KEY"]}
+
+def test_builtin_types_validate_and_normalize():
+    md = ("Fattura n. A-42 del 01/02/2024\nIBAN IT60 X054 2811 1010 0000 0123 456 BIC BPMOIT22\n"
+          "P.IVA IT01234567897 - cod. 01234567890\n| Imponibile | 1.200,00 |\n| Totale | 1.464,00 |\nScadenza 31/02/2024")
+    out = scan(md, {"iban": TypedField("iban"), "piva": TypedField("vat"), "data": TypedField("date"),
+                    "totale": TypedField("amount", near=["totale"]), "importi": TypedField("amount"),
+                    "numero": TypedField("regex", r"Fattura n\. (\S+)")})
+    assert out["iban"] == {"value": "IT60X0542811101000000123456", "text": "IT60 X054 2811 1010 0000 0123 456",
+                           "values": ["IT60X0542811101000000123456"]}
+    assert out["piva"]["values"] == ["01234567897"]  # the other 11 digits fail the check digit
+    assert out["data"]["values"] == ["2024-02-01"]  # 31/02 is not a date
+    assert out["totale"]["values"] == ["1.464,00"]
+    assert out["importi"]["values"] == ["1.200,00", "1.464,00"]
+    assert out["numero"]["value"] == "A-42"
+    assert scan("IBAN IT61 X054 2811 1010 0000 0123 456", {"iban": TypedField("iban")}) == {}
+
+def _invoice():
+    doc = fitz.open()
+    p = doc.new_page()
+    p.insert_text((72, 72), "Fattura del 01/02/2024 scadenza 03/03/2024")
+    p.insert_text((72, 100), "Partita IVA 01234567897")
+    p.insert_text((72, 130), "IBAN IT60X0542811101000000123456")
+    p.insert_text((72, 300), "Totale 1.464,00")
+    return doc.tobytes()
+
+def test_validated_matches_skip_the_llm(monkeypatch):
+    monkeypatch.setenv("TEXT_LAYER_MIN_CHARS", "1")
+    monkeypatch.setattr(main, "layout_cache", LayoutCache(0))
+    monkeypatch.setattr(main, "field_tally", main.metrics.FieldTally())
+    asked = []
+
+    async def llm(fields, llm_text, context, timings=None):
+        asked.append(list(fields))
+        return {k: {"value": "01/02/2024", "confidence": 0.9} for k in fields}
+
+    monkeypatch.setattr(main, "extract_fields_async", llm)
+    tpl = {"name": "typed", "fields": ["iban", "piva", "totale", "data"], "llm_text": "estrai",
+           "extractors": {"iban": {"type": "iban"}, "piva": {"type": "vat"},
+                          "totale": {"type": "amount", "near": ["Totale"]}, "data": {"type": "date"}}}
+    c = TestClient(main.app)
+    for _ in range(2):
+        r = c.post("/extract", headers=API, files={"file": ("f.pdf", _invoice(), "application/pdf")},
+                   data={"template": json.dumps(tpl)})
+        assert r.status_code == 200
+    fields = r.json()["fields"]
+    assert fields["iban"]["value"] == "IT60X0542811101000000123456" and fields["piva"]["value"] == "01234567897"
+    assert fields["totale"]["value"] == "1.464,00" and fields["totale"]["confidence"] == 1.0
+    # two dates: ambiguous, so only that field goes to the LLM
+    assert asked == [["data"], ["data"]]
+    manifest = c.get(f"/reports/{r.json()['request_id']}", headers=API).json()["manifest"]
+    assert manifest["field_sources"] == {"iban": "pattern", "piva": "pattern", "totale": "pattern", "data": "llm"}
+    assert manifest["bypass_rates"]["iban"] == {"rate": 1.0, "docs": 2}
+    assert manifest["bypass_rates"]["data"] == {"rate": 0.0, "docs": 2}
+
+def test_bad_extractors_are_rejected():
+    c = TestClient(main.app)
+    for ex in ({"a": {"type": "regex"}}, {"a": {"pattern": "("}}, {"b": {"type": "iban"}}):
+        tpl = {"name": "x", "fields": ["a"], "llm_text": "t", "extractors": ex}
+        r = c.post("/extract", headers=API, files={"file": ("f.pdf", _invoice(), "application/pdf")},
+                   data={"template": json.dumps(tpl)})
+        assert r.status_code == 400
@@ -0,0 +1,151 @@
+# token_table.py — columnar token store: one numpy array per column, texts in one buffer
+from __future__ import annotations
+import struct
+from typing import Any, BinaryIO, Dict, Iterator, List, Optional, Sequence
+
+import numpy as np
+
+# values of the ``source`` column; "" = PDF text layer
+SOURCES = ("", "ocr")
+
+# segment header of the binary format: magic, rows, bytes of utf-8 text
+_HEADER = struct.Struct("<4sQQ")
+_MAGIC = b"DFT2"
+
+
+class TokenTable:
+    """Tokens of a document as columns.
+
+    ``bbox`` is a float32 ``(n, 4)`` matrix of page-relative ``[x0, y0, x1, y1]``,
+    ``page`` int32 (1-based), ``line_id`` int32 (``-1`` = none) and ``source``
+    uint8 (index into ``SOURCES``); the texts are one string cut by ``offsets``.
+    A row still reads as the token dict (``tokens[i]["bbox"]``), but hot paths
+    should use the columns.
+    """
+
+    __slots__ = ("text", "offsets", "page", "bbox", "line_id", "source")
+
+    def __init__(self, text: str, offsets, page, bbox, line_id=None, source=None):
+        n = len(page)
+        self.text = text
+        self.offsets = np.asarray(offsets, dtype=np.int64)
+        self.page = np.asarray(page, dtype=np.int32)
+        self.bbox = np.asarray(bbox, dtype=np.float32).reshape(n, 4)
+        self.line_id = np.full(n, -1, np.int32) if line_id is None else np.asarray(line_id, dtype=np.int32)
+        self.source = np.zeros(n, np.uint8) if source is None else np.asarray(source, dtype=np.uint8)
+
+    # ---------------- construction ----------------
+    @classmethod
+    def empty(cls) -> "TokenTable":
+        return cls("", [0], [], np.zeros((0, 4)))
+
+    @classmethod
+    def from_texts(cls, texts: Sequence[str], page, bbox, line_id=None, source=None) -> "TokenTable":
+        offsets = np.zeros(len(texts) + 1, np.int64)
+        np.cumsum(np.fromiter(map(len, texts), np.int64, len(texts)), out=offsets[1:])
+        return cls("".join(texts), offsets, page, bbox, line_id, source)
+
+    @classmethod
+    def from_dicts(cls, tokens: Sequence[Dict[str, Any]]) -> "TokenTable":
+        if not tokens:
+            return cls.empty()
+        return cls.from_texts(
+            [t.get("text", "") or "" for t in tokens],
+            [t.get("page", 1) for t in tokens],
+            [t.get("bbox") or [0.0, 0.0, 0.0, 0.0] for t in tokens],
+            [-1 if t.get("line_id") is None else t["line_id"] for t in tokens],
+            [SOURCES.index(t.get("source", "")) for t in tokens],
+        )
+
+    @classmethod
+    def concat(cls, tables: Sequence["TokenTable"]) -> "TokenTable":
+        tables = [t for t in tables if len(t)]
+        if not tables:
+            return cls.empty()
+        if len(tables) == 1:
+            return tables[0]
+        starts = np.cumsum([0] + [len(t.text) for t in tables[:-1]])
+        offsets = np.concatenate([tables[0].offsets[:1]] + [t.offsets[1:] + s for t, s in zip(tables, starts)])
+        return cls(
+            "".join(t.text for t in tables), offsets,
+            np.concatenate([t.page for t in tables]), np.concatenate([t.bbox for t in tables]),
+            np.concatenate([t.line_id for t in tables]), np.concatenate([t.source for t in tables]),
+        )
+
+    # ---------------- access ----------------
+    def __len__(self) -> int:
+        return len(self.page)
+
+    @property
+    def n_chars(self) -> int:
+        return int(self.offsets[-1])
+
+    def texts(self) -> List[str]:
+        t, off = self.text, self.offsets.tolist()
+        return [t[a:b] for a, b in zip(off, off[1:])]
+
+    def __getitem__(self, i: int) -> Dict[str, Any]:
+        if i < 0:
+            i += len(self)
+        row = {
+            "text": self.text[self.offsets[i]:self.offsets[i + 1]],
+            "page": int(self.page[i]),
+            "bbox": self.bbox[i].tolist(),
+            "line_id": None if self.line_id[i] < 0 else int(self.line_id[i]),
+        }
+        if self.source[i]:
+            row["source"] = SOURCES[self.source[i]]
+        return row
+
+    def __iter__(self) -> Iterator[Dict[str, Any]]:
+        return (self[i] for i in range(len(self)))
+
+    def to_dicts(self) -> List[Dict[str, Any]]:
+        return list(self)
+
+    def take(self, idx) -> "TokenTable":
+        """Rows ``idx`` (indices or a boolean mask), in that order."""
+        idx = np.flatnonzero(idx) if np.asarray(idx).dtype == bool else np.asarray(idx, dtype=np.int64)
+        texts = self.texts()
+        return TokenTable.from_texts([texts[i] for i in idx.tolist()], self.page[idx], self.bbox[idx],
+                                     self.line_id[idx], self.source[idx])
+
+    # ---------------- persistence ----------------
+    def write(self, f: BinaryIO) -> int:
+        """Append the table to ``f`` as one segment of the binary format; returns the bytes written."""
+        text = self.text.encode("utf-8")
+        parts = [
+            _HEADER.pack(_MAGIC, len(self), len(text)),
+            self.page.astype("<i4").tobytes(), self.line_id.astype("<i4").tobytes(), self.source.tobytes(),
+            self.bbox.astype("<f4").tobytes(), self.offsets.astype("<i8").tobytes(), text,
+        ]
+        for p in parts:
+            f.write(p)
+        return sum(map(len, parts))
+
+    @classmethod
+    def read(cls, f: BinaryIO) -> Optional["TokenTable"]:
+        """The segment at the current position of ``f``, or ``None`` at its end."""
+        head = f.read(_HEADER.size)
+        if len(head) < _HEADER.size:
+            return None
+        magic, n, nbytes = _HEADER.unpack(head)
+        if magic != _MAGIC:
+            raise ValueError("not a token table segment")
+        col = lambda dtype, count: np.frombuffer(bytearray(f.read(count * np.dtype(dtype).itemsize)), dtype=dtype, count=count)
+        page, line_id, source = col("<i4", n), col("<i4", n), col("u1", n)
+        bbox, offsets = col("<f4", 4 * n), col("<i8", n + 1)
+        return cls(f.read(nbytes).decode("utf-8"), offsets, page, bbox.reshape(n, 4), line_id, source)
+
+    def save(self, path: str) -> None:
+        with open(path, "wb") as f:
+            self.write(f)
+
+    @classmethod
+    def load(cls, path: str) -> "TokenTable":
+        """All segments of a file written by ``save`` / ``write``, concatenated."""
+        tables = []
+        with open(path, "rb") as f:
+            while (t := cls.read(f)) is not None:
+                tables.append(t)
+        return cls.concat(tables)
@@ -0,0 +1,148 @@
+# tracing.py — per-request span tracing (Chrome trace format) and sampling profiler
+from __future__ import annotations
+import asyncio, contextvars, json, os, sys, threading, time
+from collections import Counter
+from contextlib import contextmanager
+from typing import Any, Dict, List, Optional
+from logger import get_logger
+
+log = get_logger(__name__)
+
+# trace of the request being processed by the current task/context
+current: contextvars.ContextVar[Optional["Trace"]] = contextvars.ContextVar("docflow_trace", default=None)
+
+
+class Trace:
+    """Spans of one request, serialisable as a Chrome/Perfetto ``trace.json``.
+
+    Async spans are laid out on one track per asyncio task, executor work on
+    one track per worker thread, so concurrent stages don't overlap a track.
+    """
+
+    def __init__(self, request_id: str):
+        self.request_id = request_id
+        self.t0 = time.perf_counter()
+        self.pid = os.getpid()
+        self.events: List[Dict[str, Any]] = []
+        self._tracks: Dict[Any, int] = {}
+        self._lock = threading.Lock()
+
+    def _tid(self, key: Any, label: str) -> int:
+        tid = self._tracks.get(key)
+        if tid is None:
+            tid = self._tracks[key] = len(self._tracks) + 1
+            self.events.append({"ph": "M", "name": "thread_name", "pid": self.pid, "tid": tid, "args": {"name": label}})
+        return tid
+
+    def add(self, name: str, start: float, end: float, cat: str = "stage",
+            track: Optional[tuple] = None, args: Optional[Dict[str, Any]] = None):
+        """Record a complete span; ``start``/``end`` are ``time.perf_counter()`` values."""
+        key, label = track or current_track()
+        with self._lock:
+            self.events.append({
+                "name": name,
+                "cat": cat,
+                "ph": "X",
+                "ts": round((start - self.t0) * 1e6, 1),
+                "dur": round(max(0.0, end - start) * 1e6, 1),
+                "pid": self.pid,
+                "tid": self._tid(key, label),
+                "args": args or {},
+            })
+
+    def to_json(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "traceEvents": list(self.events),
+                "displayTimeUnit": "ms",
+                "otherData": {"request_id": self.request_id},
+            }
+
+    def save(self, out_dir: str) -> str:
+        path = os.path.join(out_dir, "trace.json")
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump(self.to_json(), f)
+        return path
+
+
+def current_track() -> tuple:
+    try:
+        task = asyncio.current_task()
+    except RuntimeError:
+        task = None
+    if task is not None:
+        return ("task", id(task)), f"task {task.get_name()}"
+    th = threading.current_thread()
+    return ("thread", th.ident), f"thread {th.name}"
+
+
+@contextmanager
+def activate(trace: Optional[Trace]):
+    """Make ``trace`` the current trace for the enclosed code (and tasks it spawns)."""
+    token = current.set(trace)
+    try:
+        yield trace
+    finally:
+        current.reset(token)
+
+
+@contextmanager
+def span(name: str, cat: str = "stage", **args: Any):
+    tr = current.get()
+    if tr is None:
+        yield
+        return
+    t0 = time.perf_counter()
+    try:
+        yield
+    finally:
+        tr.add(name, t0, time.perf_counter(), cat=cat, args=args)
+
+
+class SamplingProfiler:
+    """Wall-clock sampler of every Python thread, written as folded stacks.
+
+    Samples the whole process, so work of concurrent requests shows up too;
+    the output (``thread;outer;...;inner count`` per line) loads in
+    speedscope or flamegraph.pl.
+    """
+
+    def __init__(self, interval_ms: float = 5.0):
+        self.interval = max(0.001, interval_ms / 1000.0)
+        self.samples: Counter = Counter()
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def _run(self):
+        me = threading.get_ident()
+        names = {}
+        while not self._stop.wait(self.interval):
+            for th in threading.enumerate():
+                names[th.ident] = th.name
+            for ident, frame in sys._current_frames().items():
+                if ident == me:
+                    continue
+                stack = []
+                while frame is not None:
+                    code = frame.f_code
+                    stack.append(f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})")
+                    frame = frame.f_back
+                stack.append(names.get(ident, str(ident)))
+                self.samples[";".join(reversed(stack))] += 1
+
+    def start(self) -> "SamplingProfiler":
+        self._thread = threading.Thread(target=self._run, name="docflow-profiler", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+
+    def save(self, out_dir: str) -> str:
+        path = os.path.join(out_dir, "profile.folded")
+        with open(path, "w", encoding="utf-8") as f:
+            for stack, n in self.samples.most_common():
+                f.write(f"{stack} {n}\n")
+        return path
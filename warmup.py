@@ -0,0 +1,160 @@
+# warmup.py — background backend warmup and readiness state for /ready
+from __future__ import annotations
+import asyncio, io, os, sys, time
+from typing import Any, Callable, Dict, List, Optional
+
+import executors
+import metrics
+from logger import get_logger
+
+log = get_logger(__name__)
+
+
+def process_start_time() -> float:
+    """Wall-clock start of this process (``/proc``), or of this module's import elsewhere."""
+    try:
+        with open("/proc/self/stat") as f:
+            start_ticks = int(f.read().rsplit(")", 1)[1].split()[19])
+        with open("/proc/uptime") as f:
+            uptime = float(f.read().split()[0])
+        return time.time() - uptime + start_ticks / os.sysconf("SC_CLK_TCK")
+    except (OSError, ValueError, IndexError):
+        return _IMPORTED_AT
+
+
+_IMPORTED_AT = time.time()
+
+
+def mark(phase: str) -> float:
+    """Record ``cold_start_seconds{phase}`` as seconds since process start."""
+    secs = max(0.0, time.time() - process_start_time())
+    metrics.cold_start_seconds.labels(phase=phase).set(secs)
+    return secs
+
+
+# ---------------- backends: load + dry-run inference ----------------
+def _blank_png() -> bytes:
+    from PIL import Image
+    buf = io.BytesIO()
+    Image.new("L", (64, 64), 255).save(buf, format="PNG")
+    return buf.getvalue()
+
+
+def _warm_ocr() -> str:
+    from clients.doctr_client import _get_doctr, _analyze_sync
+    kind = type(_get_doctr()).__name__
+    _analyze_sync(_blank_png(), "warmup.png")
+    return {"_Mock": "mock", "_Stub": "stub"}.get(kind, "doctr")
+
+
+def _warm_embeddings() -> str:
+    import clients
+    from clients.embeddings_local import embed_texts, _llama_cls
+    embed_texts(["warmup"])
+    if callable(getattr(clients, "llm_embed", None)):
+        return "custom"
+    return "gguf" if _llama_cls() is not None else "zeros"
+
+
+def _warm_llm() -> str:
+    if os.getenv("MOCK_LLM", "0") in ("1", "true", "True"):
+        return "mock"
+    from clients.llm_local import get_local_llm
+    get_local_llm().create_completion("{", max_tokens=1)
+    return "gguf"
+
+
+def _warm_markitdown() -> str:
+    from clients.markitdown_client import _markitdown_cls
+    cls = _markitdown_cls()
+    if cls is None:
+        raise RuntimeError("markitdown is not installed")
+    cls()
+    return "markitdown"
+
+
+BACKENDS: Dict[str, Callable[[], str]] = {
+    "ocr": _warm_ocr,
+    "embeddings": _warm_embeddings,
+    "llm": _warm_llm,
+    "markitdown": _warm_markitdown,
+}
+
+_state: Dict[str, Dict[str, Any]] = {}
+_task: Optional[asyncio.Task] = None
+
+
+def _names(csv: str) -> List[str]:
+    return [n.strip() for n in (csv or "").split(",") if n.strip() in BACKENDS]
+
+
+async def run(names: List[str]) -> None:
+    """Load each backend in turn off the event loop, recording its state."""
+    for name in names:
+        _state[name] = {"status": "loading"}
+        t0 = time.perf_counter()
+        try:
+            backend = await executors.run(name, BACKENDS[name])
+        except Exception as e:
+            _state[name] = {"status": "failed", "error": str(e)}
+            log.warning("Warmup of %s failed: %s", name, e)
+            continue
+        secs = time.perf_counter() - t0
+        metrics.backend_warmup_seconds.labels(backend=name).set(secs)
+        _state[name] = {"status": "ready", "backend": backend, "load_s": round(secs, 3)}
+        log.info("Warmup of %s finished in %.2fs (%s)", name, secs, backend)
+    log.info("Warmup finished in %.2fs after process start", mark("ready"))
+
+
+def start(backends: str) -> None:
+    """Schedule the warmup of the comma-separated ``backends`` on the running loop."""
+    global _task
+    names = _names(backends)
+    _state.clear()
+    _state.update({n: {"status": "pending"} for n in names})
+    _task = asyncio.get_running_loop().create_task(run(names))
+
+
+async def stop() -> None:
+    if _task is not None and not _task.done():
+        _task.cancel()
+        try:
+            await _task
+        except asyncio.CancelledError:
+            pass
+
+
+# ---------------- pre-fork loading (gunicorn.conf.py) ----------------
+def preload(backends: str) -> List[str]:
+    """Load weights in the server master before workers are forked, so their pages
+    are shared copy-on-write. No inference runs here, and torch is kept to one
+    thread so no OpenMP pool exists at fork time; ``after_fork`` restores it."""
+    loaded = []
+    for name in _names(backends):
+        if name != "ocr":
+            log.warning("%s is not preloaded before fork; GGUF models are shared through mmap", name)
+            continue
+        from clients.doctr_client import _get_doctr, set_torch_threads
+        set_torch_threads(1)
+        _get_doctr()
+        loaded.append(name)
+    return loaded
+
+
+def after_fork() -> None:
+    from clients.doctr_client import OCR_TORCH_THREADS, set_torch_threads
+    if "torch" in sys.modules:
+        set_torch_threads(OCR_TORCH_THREADS)
+
+
+def status(required: str) -> Dict[str, Any]:
+    """Readiness: every warmed-up backend listed in ``required`` has loaded."""
+    req = [n for n in _names(required) if n in _state]
+    done = _task is not None and _task.done()
+    return {
+        "ready": done and all(_state[n]["status"] == "ready" for n in req),
+        "required": req,
+        "backends": {n: dict(s) for n, s in _state.items()},
+        "uptime_s": round(time.time() - process_start_time(), 3),
+        "process": {"pid": os.getpid(), "memory_bytes": metrics.process_memory()},
+    }
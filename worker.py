@@ -0,0 +1,47 @@
+"""
+worker.py
+---------
+Standalone job worker for the durable SQLite queue (``JOB_BACKEND=sqlite``).
+
+API processes enqueue into ``JOB_DB_PATH`` and can run with ``JOB_WORKERS=0``;
+compute processes started with this entrypoint claim and process the jobs, so
+the two tiers scale independently on the same node.
+
+Run with:
+    JOB_BACKEND=sqlite JOB_WORKERS=2 python worker.py
+"""
+
+import asyncio
+import signal
+import sys
+
+import jobs
+import loop_monitor
+import warmup
+from config import JOB_BACKEND, JOB_WORKERS, WARMUP_BACKENDS, LOOP_LAG_INTERVAL_MS, LOOP_BLOCK_THRESHOLD_MS
+from main import _job_worker
+from logger import get_logger
+
+log = get_logger(__name__)
+
+
+async def run() -> None:
+    stop = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        loop.add_signal_handler(sig, stop.set)
+    warmup.start(WARMUP_BACKENDS)
+    loop_monitor.start(LOOP_LAG_INTERVAL_MS, LOOP_BLOCK_THRESHOLD_MS)
+    jobs.global_q.start(max(1, JOB_WORKERS), _job_worker)
+    log.info("Standalone worker running (%d tasks)", max(1, JOB_WORKERS))
+    await stop.wait()
+    log.info("Stopping standalone worker")
+    await jobs.global_q.stop()
+    await loop_monitor.stop()
+    await warmup.stop()
+
+
+if __name__ == "__main__":
+    if JOB_BACKEND != "sqlite":
+        sys.exit("worker.py needs a shared queue: set JOB_BACKEND=sqlite")
+    asyncio.run(run())